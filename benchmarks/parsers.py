@@ -0,0 +1,76 @@
+#!/usr/bin/python3 -u
+'''
+Benchmark spreadsheet engines over a corpus of saved exports, e.g. the download
+directories of a crawl, on speed and equality of output with pandas.read_excel
+
+    python benchmarks/parsers.py /tmp/msfinance --repeat 3
+'''
+
+import os
+import sys
+import time
+import glob
+import argparse
+
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from msfinance.parsers import spreadsheet_engines, parse_spreadsheet  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('corpus', nargs='+', help="Spreadsheet files, or directories searched for *.xls")
+    parser.add_argument('--engines', nargs='+', default=list(spreadsheet_engines), help="Engines to compare")
+    parser.add_argument('--baseline', default='pandas', help="Engine whose output is the reference")
+    parser.add_argument('--repeat', type=int, default=1, help="Parse the corpus this many times")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.corpus:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '**', '*.xls'), recursive=True)))
+        else:
+            files.append(path)
+    corpus = []
+    for path in files:
+        with open(path, 'rb') as f:
+            corpus.append((path, f.read()))
+    if not corpus:
+        sys.exit("No spreadsheet is found")
+    print(f"{len(corpus)} files, {sum(len(data) for _, data in corpus) / 1e6:.1f} MB")
+
+    baseline = {path: parse_spreadsheet(data, args.baseline) for path, data in corpus}
+
+    print(f"{'engine':<10} {'total s':>10} {'ms/file':>10} {'speedup':>10} {'mismatch':>10}")
+    base_elapsed = None
+    for engine in [args.baseline] + [e for e in args.engines if e != args.baseline]:
+        try:
+            parse_spreadsheet(corpus[0][1], engine)
+        except ImportError as e:
+            print(f"{engine:<10} skipped: {e}")
+            continue
+
+        mismatch = 0
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            for _, data in corpus:
+                parse_spreadsheet(data, engine)
+        elapsed = time.perf_counter() - start
+
+        for path, data in corpus:
+            try:
+                pd.testing.assert_frame_equal(parse_spreadsheet(data, engine), baseline[path])
+            except AssertionError as e:
+                mismatch += 1
+                print(f"  {engine} mismatch in {path}: {str(e).splitlines()[0]}")
+
+        if base_elapsed is None:
+            base_elapsed = elapsed
+        per_file = elapsed * 1000 / (len(corpus) * args.repeat)
+        print(f"{engine:<10} {elapsed:>10.3f} {per_file:>10.2f} {base_elapsed / elapsed:>9.2f}x {mismatch:>10}")
+
+
+if __name__ == '__main__':
+    main()
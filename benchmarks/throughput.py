@@ -0,0 +1,124 @@
+#!/usr/bin/python3 -u
+'''
+End-to-end throughput benchmark of Stock against the local stand-in of Morningstar,
+see tests/standin.py. Tickers are fetched from scratch by a pool of drivers, and the
+report shows per-ticker latency, tickers per hour, and where the time of fetches goes
+
+    python benchmarks/throughput.py --tickers 20 --workers 2 --rate 1
+'''
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from msfinance.stocks import Stock, dataset_names  # noqa: E402
+from msfinance.drivers import DriverPool  # noqa: E402
+from msfinance.pacing import Pacer, CircuitBreaker  # noqa: E402
+from tests.standin import StandIn  # noqa: E402
+
+# Steps of fetches measured by Stock.timings, in order of a fetch
+STEPS = ['driver', 'breaker', 'page_load', 'delay', 'element_wait', 'download', 'parse', 'db_write']
+
+
+def fetch_ticker(stock, ticker, datasets, period, stage):
+    '''
+    Fetch datasets of a ticker, one page visit per page
+
+    Returns:
+        (ticker, seconds, error message or None)
+    '''
+    groups = {}
+    for name in datasets:
+        groups.setdefault(dataset_names[name][0], []).append(name)
+
+    start = time.monotonic()
+    try:
+        for names in groups.values():
+            stock._fetch_datasets(ticker, 'xnas', names, period, stage, update=True)
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return ticker, time.monotonic() - start, error
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tickers', type=int, default=10, help="Number of tickers to fetch")
+    parser.add_argument('--datasets', nargs='+', default=['income_statement', 'balance_sheet', 'growth'],
+                        choices=list(dataset_names), help="Datasets of each ticker")
+    parser.add_argument('--period', default='Annual', help="Period of statements")
+    parser.add_argument('--stage', default='Restated', help="Stage of statements")
+    parser.add_argument('--workers', type=int, default=1, help="Number of concurrent drivers")
+    parser.add_argument('--rate', type=float, default=Pacer().rate, help="Pacer rate in human-like steps per second")
+    parser.add_argument('--jitter', type=float, default=Pacer().jitter, help="Pacer jitter in seconds per step")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds of stand-in latency per response")
+    parser.add_argument('--challenges', type=int, default=0, help="Page loads answered with a bot challenge")
+    parser.add_argument('--backoff', type=float, default=5, help="Seconds of circuit breaker window")
+    parser.add_argument('--fetch-mode', default='export', choices=['export', 'network'], help="Fetch mode of Stock")
+    parser.add_argument('--storage', default='table', choices=['table', 'fact', 'parquet'], help="Storage layout")
+    parser.add_argument('--write-behind', action='store_true', help="Write data with the write-behind writer")
+    parser.add_argument('--driver-type', default='uc', help="Driver type of DriverPool")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='msfinance-bench-')
+    tickers = [f"T{i:04d}" for i in range(args.tickers)]
+
+    with StandIn(latency=args.latency, challenges=args.challenges) as standin:
+        pool = DriverPool(
+            size=args.workers, driver_type=args.driver_type, warmup_url=f"{standin.url}/stocks", warmup_delay=0,
+            capture_network=('network' == args.fetch_mode))
+        stock = Stock(
+            database=os.path.join(workdir, 'msfinance.db3'), base_urls=standin.base_urls, driver_pool=pool,
+            pacer=Pacer(rate=args.rate, jitter=args.jitter),
+            breaker=CircuitBreaker(os.path.join(workdir, 'breaker'), backoff=args.backoff),
+            fetch_mode=args.fetch_mode, storage=args.storage, write_behind=args.write_behind)
+
+        results = []
+        start = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=args.workers) as executor:
+                futures = [executor.submit(fetch_ticker, stock, ticker, args.datasets, args.period, args.stage)
+                           for ticker in tickers]
+                for future in as_completed(futures):
+                    ticker, elapsed, error = future.result()
+                    results.append((ticker, elapsed, error))
+                    print(f"{ticker:<8} {elapsed:>8.2f}s {error or ''}")
+            stock.flush()
+        finally:
+            wall = time.monotonic() - start
+            stock.close()
+            pool.close()
+
+    latency = np.array([elapsed for _, elapsed, _ in results])
+    failed = sum(1 for _, _, error in results if error is not None)
+    print()
+    print(f"{len(results)} tickers, {failed} failed, {len(args.datasets)} datasets each, "
+          f"{args.workers} workers, {wall:.1f}s")
+    print(f"tickers/hour {len(results) * 3600 / wall:.0f}")
+    if len(latency):
+        print(f"latency s    mean {latency.mean():.2f}  p50 {np.percentile(latency, 50):.2f}  "
+              f"p95 {np.percentile(latency, 95):.2f}  max {latency.max():.2f}")
+
+    # Steps are added up over all workers, so they are compared with the sum of ticker latency
+    total = latency.sum() if len(latency) else 0.0
+    measured = sum(stock.timings[step] for step in STEPS)
+    print()
+    print(f"{'step':<14} {'total s':>10} {'s/ticker':>10} {'share':>8}")
+    for step, seconds in [(s, stock.timings[s]) for s in STEPS] + [('other', max(0.0, total - measured))]:
+        per_ticker = seconds / len(results) if results else 0.0
+        share = seconds / total if total else 0.0
+        print(f"{step:<14} {seconds:>10.2f} {per_ticker:>10.2f} {share:>7.1%}")
+    print()
+    print("stand-in requests: " + ', '.join(f"{k} {v}" for k, v in sorted(standin.requests.items())))
+
+
+if __name__ == '__main__':
+    main()
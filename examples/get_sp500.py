@@ -12,23 +12,15 @@ stock = msf.Stock(
 
 sp500_tickers = stock.get_sp500_tickers()
 
-tickers_list = {}
-tickers_list['xnas'] = stock.get_xnas_tickers()
-tickers_list['xnys'] = stock.get_xnys_tickers()
-tickers_list['xase'] = stock.get_xase_tickers()
-
 for ticker in sorted(sp500_tickers):
-    if ticker in tickers_list['xnas']:
-        key_metrics = stock.get_key_metrics(ticker, 'xnas')
-        financials = stock.get_financials(ticker, 'xnas')
-    elif ticker in tickers_list['xnys']:
-        key_metrics = stock.get_key_metrics(ticker, 'xnys')
-        financials = stock.get_financials(ticker, 'xnys')
-    elif ticker in tickers_list['xase']:
-        key_metrics = stock.get_key_metrics(ticker, 'xase')
-        financials = stock.get_financials(ticker, 'xase')
-    else:
+    try:
+        exchange = stock.resolve_exchange(ticker)
+    except ValueError:
         print(f"Ticker: {ticker} is not found in any exchange")
+        continue
+
+    key_metrics = stock.get_key_metrics(ticker, exchange)
+    financials = stock.get_financials(ticker, exchange)
 
     print(f"Ticker: {ticker}")
     for key_metric in key_metrics:
@@ -1,2 +1,4 @@
 from msfinance.stocks import Stock
-
+from msfinance.drivers import DriverPool
+from msfinance.pacing import Pacer
+from msfinance.crawl import crawl, crawl_journal
@@ -0,0 +1,231 @@
+import time
+import queue
+import logging
+import multiprocessing
+
+from datetime import datetime
+
+import pandas as pd
+from sqlalchemy import create_engine, text
+
+from msfinance.stocks import Stock, dataset_names
+from msfinance import storage
+
+
+def _group_datasets(stock, datasets, stage):
+    '''Group dataset names by page and stage, each group is fetched with one page visit'''
+    groups = {}
+    for name in datasets:
+        key = (dataset_names[name][0], stock._dataset_stage(name, stage))
+        groups.setdefault(key, []).append(name)
+    return groups
+
+
+def _crawl_ticker(stock, ticker, exchange, datasets, period, stage, update):
+    '''
+    Fetch datasets of one ticker, failures are reported instead of raised
+
+    Returns:
+        List of (ticker, exchange, dataset, DataFrame or None, error message or None, start time, elapsed seconds)
+    '''
+    results = []
+    for (_, group_stage), names in _group_datasets(stock, datasets, stage).items():
+        started_at = datetime.now()
+        start = time.monotonic()
+        try:
+            fetched = stock._fetch_datasets(ticker, exchange, names, period, group_stage, update)
+            elapsed = time.monotonic() - start
+
+            # Fetches without data and failed fetches both give None, catalog tells them apart
+            unique_ids = {name: stock._dataset_id(ticker, exchange, name, period, group_stage) for name in names}
+            catalog = stock.lookup_catalog([unique_ids[r[2]] for r in fetched if r[3] is None])
+            for r in fetched:
+                error = None
+                if r[3] is None and unique_ids[r[2]] in catalog.index:
+                    record = catalog.loc[unique_ids[r[2]]]
+                    if 'failed' == record['status']:
+                        error = record['error'] or 'failed'
+                results.append(r + (error, started_at, elapsed))
+        except Exception as e:
+            stock.logger.error(f"Fetch {ticker}@{exchange} {names} fail: {e}")
+            elapsed = time.monotonic() - start
+            results.extend((ticker, exchange, name, None, str(e), started_at, elapsed) for name in names)
+    return results
+
+
+def _crawl_worker(tasks, results, period, stage, update, return_data, stock_kwargs):
+    '''Worker process, which keeps one Stock and pulls one ticker at a time from tasks queue'''
+    stock = Stock(**stock_kwargs)
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+
+            ticker, exchange, datasets = task
+            fetched = _crawl_ticker(stock, ticker, exchange, datasets, period, stage, update)
+            if not return_data:
+                fetched = [(t, e, n, None if df is None else len(df)) + tuple(r) for t, e, n, df, *r in fetched]
+            results.put((ticker, exchange, fetched))
+    finally:
+        stock.close()
+
+
+def _journal_item(ticker, exchange, name, period, stage):
+    '''Journal key of a dataset of a crawl, statistics have no period'''
+    if 'statistics' == dataset_names[name][0]:
+        period = None
+    return (ticker, exchange, name, period, stage)
+
+
+def _journal_status(data, error):
+    '''Journal status of one crawl result'''
+    if error is not None:
+        return 'failed'
+    if data is None:
+        return 'no_data'
+    return 'done'
+
+
+def crawl(tickers, datasets, workers=1, period='Annual', stage='Restated', update=False, return_data=True,
+          resume=False, retry_failed=False, **stock_kwargs):
+    '''
+    Crawl datasets of many tickers with worker processes. Each worker keeps one
+    long-lived Stock and pulls single tickers from a shared queue, so a slow
+    ticker only holds back its own worker. Results are streamed back as soon
+    as each ticker is done.
+
+    Progress is kept in a journal table of the database, one item per ticker,
+    exchange, dataset, period and stage, so an interrupted crawl can be resumed where it stopped.
+
+    Args:
+        tickers: List of (ticker, exchange) or tickers, or dict of ticker to exchange.
+            Exchange is resolved from ticker if it is not given
+        datasets: List of dataset names, e.g. 'income_statement', 'balance_sheet', 'cash_flow_statement',
+            'financial_summary', 'growth', 'profitability_and_efficiency', 'financial_health', 'cash_flow'
+        workers: Number of worker processes
+        period: Period of statement, which can be 'Annual'(default), 'Quarterly'
+        stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
+        update: Force update data from website, else only missing or stale data is fetched
+        return_data: Send DataFrames back to the parent process, else only their row counts
+        resume: Skip items already done or without data in the journal, else all items are crawled again
+        retry_failed: Only crawl items failed in the journal
+        stock_kwargs: Arguments of Stock in each worker, e.g. database, proxy, freshness.
+            Each worker creates its own database engine, so session_factory is not supported
+
+    Yields:
+        (ticker, exchange, dataset, DataFrame or None, error message or None), in completion order
+    '''
+    for name in datasets:
+        if name not in dataset_names:
+            raise ValueError(f"Invalid dataset: {name}")
+    if 'session_factory' in stock_kwargs:
+        raise ValueError("session_factory can not be shared by worker processes, use database instead")
+
+    if isinstance(tickers, dict):
+        tickers = list(tickers.items())
+    else:
+        tickers = list(tickers)
+
+    # Resolve exchanges of plain tickers once in the parent process
+    if any(isinstance(item, str) or item[1] is None for item in tickers):
+        stock = Stock(**stock_kwargs)
+        try:
+            tickers = stock._ticker_pairs(tickers)
+        finally:
+            stock.close()
+    tickers = [tuple(item) for item in tickers]
+
+    logger = logging.getLogger(f"{multiprocessing.current_process().name}.crawl")
+
+    # Only the parent process writes the journal
+    engine = create_engine(f"sqlite:///{stock_kwargs.get('database', 'msfinance.db3')}")
+    items = [_journal_item(ticker, exchange, name, period, stage) for ticker, exchange in tickers for name in datasets]
+    with engine.begin() as conn:
+        storage.ensure_journal(conn)
+        storage.seed_journal(conn, items, reset=not (resume or retry_failed))
+        if retry_failed:
+            todo = storage.select_journal(conn, ['failed'])
+        else:
+            todo = storage.select_journal(conn, ['pending', 'failed'])
+
+    tasks = []
+    for ticker, exchange in tickers:
+        names = [name for name in datasets if _journal_item(ticker, exchange, name, period, stage) in todo]
+        if names:
+            tasks.append((ticker, exchange, names))
+    logger.info(f"Crawl {len(tasks)} of {len(tickers)} tickers")
+
+    task_queue = multiprocessing.Queue()
+    result_queue = multiprocessing.Queue()
+    for task in tasks:
+        task_queue.put(task)
+    for _ in range(workers):
+        task_queue.put(None)
+
+    processes = [
+        multiprocessing.Process(
+            target=_crawl_worker,
+            args=(task_queue, result_queue, period, stage, update, return_data, stock_kwargs),
+            name=f"crawl-{i}",
+        )
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        pending = len(tasks)
+        while pending:
+            try:
+                ticker, exchange, fetched = result_queue.get(timeout=1)
+            except queue.Empty:
+                if any(process.is_alive() for process in processes):
+                    continue
+                # Results of exited workers are already flushed to the queue
+                try:
+                    ticker, exchange, fetched = result_queue.get(timeout=1)
+                except queue.Empty:
+                    logger.error(f"All crawl workers exited, {pending} tickers are not done")
+                    break
+
+            pending -= 1
+            with engine.begin() as conn:
+                for t, e, name, data, error, started_at, elapsed in fetched:
+                    storage.record_journal(
+                        conn, *_journal_item(t, e, name, period, stage), _journal_status(data, error),
+                        started_at, elapsed, error)
+            for result in fetched:
+                yield result[:5]
+    finally:
+        for process in processes:
+            if process.is_alive() and pending:
+                process.terminate()
+            process.join()
+        engine.dispose()
+
+
+def crawl_journal(database='msfinance.db3', status=None):
+    '''
+    Read the crawl journal
+
+    Args:
+        database: Database file of the crawl
+        status: List of status to read, e.g. 'pending', 'done', 'failed', 'no_data', else all items are read
+
+    Returns:
+        DataFrame of journal items
+    '''
+    engine = create_engine(f"sqlite:///{database}")
+    try:
+        with engine.begin() as conn:
+            storage.ensure_journal(conn)
+            query = f"SELECT * FROM {storage.JOURNAL_TABLE}"
+            params = {}
+            if status is not None:
+                status = [status] if isinstance(status, str) else list(status)
+                query += " WHERE status IN (" + ", ".join(f":s{i}" for i in range(len(status))) + ")"
+                params = {f"s{i}": s for i, s in enumerate(status)}
+            return pd.read_sql_query(text(query), conn, params=params)
+    finally:
+        engine.dispose()
@@ -0,0 +1,556 @@
+import os
+import re
+import sys
+import time
+import json
+import base64
+import queue
+import collections
+import select
+import fnmatch
+import logging
+import tempfile
+import threading
+import ctypes
+import ctypes.util
+
+from contextlib import contextmanager
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException
+
+from fake_useragent import UserAgent
+
+from selenium_stealth import stealth
+import undetected_chromedriver as uc
+
+# For Chrome driver
+from webdriver_manager.chrome import ChromeDriverManager
+
+# For Firefox driver
+from webdriver_manager.firefox import GeckoDriverManager
+
+
+class DriverPool:
+    '''
+    Pool of warmed-up browser drivers, which can be shared across Stock instances
+
+    Drivers are lent to fetch calls with acquire() and taken back with release(),
+    so the browser startup and warm-up cost is paid once per driver instead of
+    once per Stock instance. Drivers are created on first acquire(), a pool which
+    is never asked for a driver never launches a browser.
+    '''
+
+    def __init__(self, size=1, debug=False, browser='chrome', proxy=None, driver_type='uc',
+                 warmup_url='https://www.morningstar.com/stocks', warmup_delay=15, logger=None,
+                 capture_network=False):
+        self.size = size
+        self.debug = debug
+        self.browser = browser
+        self.proxy = proxy
+        self.driver_type = driver_type
+        self.warmup_url = warmup_url
+        self.warmup_delay = warmup_delay
+        # Record network events in performance log, which is needed by NetworkCapture (Chrome only)
+        self.capture_network = capture_network
+        self.logger = logger if logger is not None else logging.getLogger(
+            self.__class__.__name__)
+
+        # UserAgent is initialized with the first driver
+        self.ua = None
+
+        if os.environ.get('CHROME_PATH') is not None:
+            self.chrome_path = os.environ.get('CHROME_PATH')
+        else:
+            self.chrome_path = None
+
+        # Idle drivers and slot accounting are guarded by one lock, waiters of
+        # acquire() are notified whenever a driver is given back or a slot is freed
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._drivers = {}
+        self._slots = set()
+        self._closed = False
+
+    def __len__(self):
+        '''Number of drivers created by the pool'''
+        return len(self._slots)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _reserve_slot(self):
+        '''Reserve a free slot for a new driver, or None if the pool is full, with the lock held'''
+        for index in range(self.size):
+            if index not in self._slots:
+                self._slots.add(index)
+                return index
+        return None
+
+    def _free_slot(self, index):
+        '''Free the slot of a driver which is gone, and wake up a waiter of acquire() to fill it'''
+        with self._changed:
+            self._slots.discard(index)
+            self._changed.notify()
+
+    def _create_driver(self, index, warmup=True):
+        '''Create a new driver in slot index, and register its download directory'''
+
+        if self.ua is None:
+            # Initialize UserAgent for random user-agent generation
+            self.ua = UserAgent()
+
+        # Each driver downloads into its own directory
+        download_dir = os.path.join(
+            tempfile.gettempdir(), 'msfinance', str(os.getpid()), str(index))
+        self.logger.debug(f"Download directory: {download_dir}")
+
+        if not os.path.exists(download_dir):
+            os.makedirs(download_dir)
+
+        if self.browser == 'chrome':
+            driver = self.setup_chrome_driver(download_dir)
+        else:
+            # Default: firefox
+            driver = self.setup_firefox_driver(download_dir)
+
+        with self._lock:
+            self._drivers[id(driver)] = (index, download_dir)
+
+        # Open Morningstar stock page
+        if warmup and self.warmup_url is not None:
+            driver.get(self.warmup_url)
+            time.sleep(self.warmup_delay)
+
+        return driver
+
+    def acquire(self, timeout=None):
+        '''
+        Borrow a driver from the pool, block until one is available
+
+        Args:
+            timeout: Seconds to wait for an idle driver, None to wait forever,
+                queue.Empty is raised when it passes
+
+        Returns:
+            Driver instance
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._changed:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Driver pool is closed")
+                if self._idle:
+                    return self._idle.popleft()
+
+                # No idle driver, create a new one if the pool is not full yet
+                index = self._reserve_slot()
+                if index is not None:
+                    break
+
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._changed.wait(remaining)
+
+        try:
+            return self._create_driver(index)
+        except Exception:
+            self._free_slot(index)
+            raise
+
+    def start(self):
+        '''Create and warm up all drivers of the pool in advance'''
+        while True:
+            with self._lock:
+                index = self._reserve_slot()
+            if index is None:
+                break
+            try:
+                driver = self._create_driver(index)
+            except Exception:
+                self._free_slot(index)
+                raise
+            self._put_idle(driver)
+
+    def release(self, driver):
+        '''Give a borrowed driver back to the pool, drivers already quit are dropped'''
+        with self._lock:
+            registered = id(driver) in self._drivers
+        if registered:
+            self._put_idle(driver)
+
+    def _put_idle(self, driver):
+        '''Make a driver idle and wake up a waiter of acquire() to take it, or quit it if the pool is closed'''
+        with self._changed:
+            if not self._closed:
+                self._idle.append(driver)
+                self._changed.notify()
+                return
+        self._quit(driver)
+
+    @contextmanager
+    def driver(self, timeout=None):
+        '''Context manager to borrow a driver and give it back on exit'''
+        driver = self.acquire(timeout)
+        try:
+            yield driver
+        finally:
+            self.release(driver)
+
+    def download_dir(self, driver):
+        '''Get the download directory of a driver in this pool'''
+        return self._drivers[id(driver)][1]
+
+    def reset(self, driver):
+        '''
+        Replace a broken driver with a new one in the same slot
+
+        Args:
+            driver: A borrowed driver
+
+        Returns:
+            The new driver, which is still borrowed by the caller
+        '''
+        index = self._drivers[id(driver)][0]
+        self._quit(driver)
+        try:
+            return self._create_driver(index, warmup=False)
+        except Exception:
+            # Free the slot, so a new driver is created by the next or a waiting acquire()
+            self._free_slot(index)
+            raise
+
+    def close(self):
+        '''Quit all idle drivers, borrowed drivers are quit when they are released'''
+        with self._changed:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._slots.clear()
+            # Waiters of acquire() fail instead of waiting forever
+            self._changed.notify_all()
+        for driver in idle:
+            self._quit(driver)
+
+    def _quit(self, driver):
+        with self._lock:
+            self._drivers.pop(id(driver), None)
+        try:
+            driver.quit()
+        except Exception as e:
+            self.logger.debug(f"Driver quit fail: {e}")
+
+    def setup_chrome_driver(self, download_dir):
+        # Chrome support
+        options = webdriver.ChromeOptions()
+
+        # Set a random user-agent
+        options.add_argument(f"--user-agent={self.ua.random}")
+
+        # Use headless mode
+        if not self.debug:
+            options.add_argument("--headless")
+        else:
+            options.add_argument("--start-maximized")
+            options.add_argument("--disable-popup-blocking")
+
+        if self.proxy is not None:
+            [protocol, host, port] = re.split(r'://|:', self.proxy)
+            if 'socks5' == protocol:
+                options.add_argument(
+                    f'--proxy-server=socks5://{host}:{port}')
+            else:
+                self.logger.error("No supported proxy protocol")
+                exit(1)
+
+        if self.capture_network:
+            options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+        # Initialize the undetected_chromedriver
+        driver = self.initialize_chrome_driver(options)
+
+        # Override the webdriver property, make more undetected
+        driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
+            "source": """
+                Object.defineProperty(navigator, 'webdriver', {
+                    get: () => undefined
+                })
+            """
+        })
+
+        # Change download directory
+        params = {
+            "behavior": "allow",
+            "downloadPath": download_dir,
+        }
+        driver.execute_cdp_cmd("Page.setDownloadBehavior", params)
+
+        return driver
+
+    def setup_firefox_driver(self, download_dir):
+        options = webdriver.FirefoxOptions()
+
+        options.set_preference("browser.download.folderList", 2)
+        options.set_preference("browser.download.dir", download_dir)
+        options.set_preference("browser.download.useDownloadDir", True)
+        options.set_preference(
+            "browser.download.viewableInternally.enabledTypes", "")
+        options.set_preference(
+            "browser.download.manager.showWhenStarting", False)
+        options.set_preference(
+            "browser.helperApps.neverAsk.saveToDisk", "application/octet-stream")
+        # Enable cache
+        options.set_preference("browser.cache.disk.enable", True)
+        options.set_preference("browser.cache.memory.enable", True)
+        options.set_preference("browser.cache.offline.enable", True)
+        options.set_preference("network.http.use-cache", True)
+
+        options.set_preference(
+            "general.useragent.override", self.ua.random)
+
+        # Use headless mode
+        if not self.debug:
+            options.add_argument("--headless")
+
+        if self.proxy is not None:
+            [protocol, host, port] = re.split(r'://|:', self.proxy)
+            # Use set_preference method to enable the DNS proxy
+            options.set_preference('network.proxy.type', 1)
+            if 'socks5' == protocol:
+                options.set_preference('network.proxy.socks', host)
+                options.set_preference(
+                    'network.proxy.socks_port', int(port))
+                options.set_preference('network.proxy.socks_version', 5)
+                options.set_preference(
+                    'network.proxy.socks_remote_dns', True)
+            else:
+                self.logger.error("No supported proxy protocol")
+                exit(1)
+
+        return webdriver.Firefox(
+            service=webdriver.FirefoxService(GeckoDriverManager().install()),
+            options=options)
+
+    def initialize_chrome_driver(self, options):
+        # Initialize the driver based on the driver_type
+        if self.driver_type == 'uc':
+            driver = uc.Chrome(
+                options=options,
+                browser_executable_path=self.chrome_path,
+                version_main=126,
+                use_subprocess=True,
+                user_multi_procs=True,
+                service=webdriver.ChromeService(
+                    ChromeDriverManager(driver_version='126').install()),
+                debug=self.debug,
+            )
+        elif self.driver_type == 'stealth':
+            # Initialize the WebDriver (e.g., Chrome)
+            driver = webdriver.Chrome(
+                service=webdriver.ChromeService(
+                    ChromeDriverManager(driver_version='126').install()),
+                options=options,
+            )
+
+            # Apply selenium-stealth to the WebDriver
+            stealth(driver,
+                    languages=["en-US", "en"],
+                    vendor="Google Inc.",
+                    platform="Win32",
+                    webgl_vendor="Intel Inc.",
+                    renderer="Intel Iris OpenGL Engine",
+                    fix_hairline=True,
+                    )
+        else:
+            raise ValueError("Invalid driver type specified")
+
+        return driver
+
+# End of class DriverPool
+
+
+class NetworkCapture:
+    '''
+    Capture JSON responses loaded by a page, from CDP network events in Chrome performance log.
+    The driver must be created by a DriverPool with capture_network=True
+    '''
+
+    def __init__(self, driver, poll_interval=0.2):
+        self.driver = driver
+        self.poll_interval = poll_interval
+        # Request ID to URL of received responses, in order of arrival
+        self._responses = {}
+        self._finished = set()
+
+    def clear(self):
+        '''Drop all network events recorded so far'''
+        self.driver.get_log('performance')
+        self._responses.clear()
+        self._finished.clear()
+
+    def _poll(self):
+        for entry in self.driver.get_log('performance'):
+            message = json.loads(entry['message'])['message']
+            method = message.get('method')
+            params = message.get('params', {})
+            if 'Network.responseReceived' == method:
+                request_id = params['requestId']
+                self._responses.pop(request_id, None)
+                self._responses[request_id] = params['response']['url']
+            elif 'Network.loadingFinished' == method:
+                self._finished.add(params['requestId'])
+
+    def wait_json(self, match, timeout=30):
+        '''
+        Wait for the latest finished response whose URL matches, and decode its body as JSON
+
+        Args:
+            match: Function which takes the response URL and returns True if it matches
+            timeout: Seconds to wait for the response
+
+        Returns:
+            Decoded JSON object
+        '''
+        deadline = time.monotonic() + timeout
+        while True:
+            self._poll()
+            for request_id, url in reversed(list(self._responses.items())):
+                if request_id in self._finished and match(url):
+                    body = self.driver.execute_cdp_cmd(
+                        'Network.getResponseBody', {'requestId': request_id})
+                    text = body['body']
+                    if body.get('base64Encoded'):
+                        text = base64.b64decode(text).decode('utf-8')
+                    return json.loads(text)
+
+            if time.monotonic() > deadline:
+                raise TimeoutException("No matched network response")
+            time.sleep(self.poll_interval)
+
+# End of class NetworkCapture
+
+
+# inotify event masks, see inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+
+# Suffixes of partial downloads of Chrome and Firefox
+PARTIAL_SUFFIXES = ('.crdownload', '.part', '.tmp')
+
+
+def _inotify_libc():
+    '''Get libc with inotify support, or None on other platforms'''
+    if not sys.platform.startswith('linux'):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+class DownloadWatcher:
+    '''
+    Wait for a download to complete in a directory. Completed downloads are
+    noticed with inotify on Linux, or by polling the directory elsewhere.
+
+    Create the watcher before the download is triggered, so a fast download
+    is not missed:
+
+        with DownloadWatcher(download_dir) as watcher:
+            export_button.click()
+            path = watcher.wait('summary*.xls', timeout=30)
+    '''
+
+    def __init__(self, directory, poll_interval=0.1):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self._fd = None
+
+        libc = _inotify_libc()
+        if libc is not None:
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0:
+                wd = libc.inotify_add_watch(
+                    fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+                if wd >= 0:
+                    self._fd = fd
+                else:
+                    os.close(fd)
+
+        # Files already in directory are only reported when they are rewritten
+        self._existing = self._snapshot()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _snapshot(self):
+        snapshot = {}
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.name] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _find(self, pattern):
+        '''Find a new, complete file which matches pattern'''
+        for name, (mtime, size) in self._snapshot().items():
+            if name.endswith(PARTIAL_SUFFIXES) or 0 == size:
+                continue
+            if not fnmatch.fnmatch(name, pattern):
+                continue
+            if self._existing.get(name, (None, None))[0] == mtime:
+                continue
+            return os.path.join(self.directory, name)
+        return None
+
+    def wait(self, pattern, timeout=30):
+        '''
+        Wait for a complete file which matches pattern
+
+        Args:
+            pattern: Shell-style wildcard of the file name
+            timeout: Deadline in seconds
+
+        Returns:
+            Path of the downloaded file
+        '''
+        deadline = time.monotonic() + timeout
+        while True:
+            path = self._find(pattern)
+            if path is not None:
+                return path
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutException("Export data fail")
+
+            if self._fd is not None:
+                # Block until something is written or moved into directory
+                readable, _, _ = select.select([self._fd], [], [], remaining)
+                if readable:
+                    try:
+                        while os.read(self._fd, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+            else:
+                time.sleep(min(self.poll_interval, remaining))
+
+# End of class DownloadWatcher
@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import random
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # No file lock on Windows, breaker state is still shared, only updates may race
+    fcntl = None
+
+
+class BotChallenge(Exception):
+    '''Website answers with a bot challenge instead of the page'''
+
+
+class Pacer:
+    '''
+    Per-host token bucket pacing requests to a website. Each human-like step
+    of a fetch takes tokens from the bucket of its host, and waits when the
+    bucket is empty. Time spent on loading pages refills the bucket, so only
+    the part of the budget not used by real work is slept.
+
+    The rate tightens when the website answers with bot challenges or timeouts,
+    and loosens again as fetches succeed cleanly.
+    '''
+
+    def __init__(self, rate=1 / 9, burst=3, min_rate=None, max_rate=None, backoff=0.5, recovery=1.25, jitter=1.0):
+        '''
+        Args:
+            rate: Target steps per second of each host
+            burst: Max number of steps taken without waiting
+            min_rate: Lowest rate after tightening, default is 1/8 of rate
+            max_rate: Highest rate after loosening, default is 4 times of rate
+            backoff: Rate is multiplied by backoff on challenges or timeouts
+            recovery: Rate is multiplied by recovery on clean fetches
+            jitter: Max random seconds added to each wait, per step
+        '''
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate if min_rate is not None else rate / 8
+        self.max_rate = max_rate if max_rate is not None else rate * 4
+        self.backoff = backoff
+        self.recovery = recovery
+        self.jitter = jitter
+
+        # Host to [tokens, time of last refill, rate]
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def _bucket(self, host):
+        '''Bucket of host, refilled up to now at its current rate'''
+        now = time.monotonic()
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = [self.burst, now, self.rate]
+        else:
+            tokens, last, rate = bucket
+            bucket[0], bucket[1] = min(self.burst, tokens + (now - last) * rate), now
+        return bucket
+
+    def rate_of(self, host):
+        '''Current rate of host in steps per second'''
+        with self._lock:
+            return self._bucket(host)[2]
+
+    def reserve(self, host, cost=1.0):
+        '''
+        Take cost tokens from the bucket of host
+
+        Returns:
+            Seconds to wait before the step can be done
+        '''
+        with self._lock:
+            bucket = self._bucket(host)
+
+            # Tokens may go negative, so concurrent callers queue up behind each other
+            bucket[0] -= cost
+            return max(0.0, -bucket[0] / bucket[2])
+
+    def wait(self, host, cost=1.0):
+        '''
+        Wait until the bucket of host has cost tokens, with a random jitter
+
+        Returns:
+            Seconds waited
+        '''
+        delay = self.reserve(host, cost) + random.uniform(0, self.jitter * cost)
+        time.sleep(delay)
+        return delay
+
+    def penalize(self, host):
+        '''Tighten rate of host, on bot challenges or timeouts'''
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket[2] = max(self.min_rate, bucket[2] * self.backoff)
+            # Drop the saved burst, so the next steps are paced at the new rate
+            bucket[0] = min(bucket[0], 0)
+
+    def reward(self, host):
+        '''Loosen rate of host, on clean fetches'''
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket[2] = min(self.max_rate, bucket[2] * self.recovery)
+
+
+class CircuitBreaker:
+    '''
+    Circuit breaker shared by all threads and processes on this machine.
+    When a bot challenge is detected, the breaker of the host is opened for
+    a backoff window, in which all fetches to the host wait, and resume
+    together when it closes. The window doubles on each trip in a row, and
+    is reset by a clean fetch.
+
+    The state is kept in one small file per host, so worker processes of a
+    crawl share it without any coordination.
+    '''
+
+    def __init__(self, directory=None, backoff=300, max_backoff=3600, poll_interval=5):
+        '''
+        Args:
+            directory: Directory of state files, default is msfinance in temporary directory
+            backoff: Seconds of the first open window
+            max_backoff: Max seconds of an open window
+            poll_interval: Max seconds between checks of the state while waiting
+        '''
+        if directory is None:
+            directory = os.path.join(tempfile.gettempdir(), 'msfinance', 'breaker')
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+
+    def _path(self, host):
+        return os.path.join(self.directory, f"{host}.json")
+
+    def _update(self, host, update):
+        '''Read, update and write state of host under file lock, return the new state'''
+        with self._lock, open(self._path(host), 'a+') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or '{}')
+            except ValueError:
+                state = {}
+            new = update(dict(state))
+            if new != state:
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(new))
+            return new
+
+    def state(self, host):
+        '''
+        State of host
+
+        Returns:
+            Dict with open_until, time when the breaker closes, and trips, number of trips in a row
+        '''
+        try:
+            with open(self._path(host)) as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_SH)
+                state = json.loads(f.read() or '{}')
+        except (OSError, ValueError):
+            state = {}
+        return {'open_until': state.get('open_until', 0), 'trips': state.get('trips', 0)}
+
+    def remaining(self, host):
+        '''Seconds until the breaker of host closes, 0 if it is closed'''
+        return max(0.0, self.state(host)['open_until'] - time.time())
+
+    def wait(self, host):
+        '''
+        Wait until the breaker of host closes
+
+        Returns:
+            Seconds waited
+        '''
+        waited = 0.0
+        remaining = self.remaining(host)
+        while remaining > 0:
+            # Check again in a while, as the window may be extended by other processes
+            delay = min(remaining, self.poll_interval)
+            time.sleep(delay)
+            waited += delay
+            remaining = self.remaining(host)
+        return waited
+
+    def trip(self, host, on_open=None):
+        '''
+        Open the breaker of host, a trip while it is open is not counted again,
+        as parallel fetches see the same challenge
+
+        Args:
+            host: Host of the website
+            on_open: Function called with host under the state lock, only by the trip which opens the breaker,
+                e.g. Pacer.penalize, so a challenge seen by parallel fetches is penalized once
+
+        Returns:
+            Seconds until the breaker closes
+        '''
+        def update(state):
+            now = time.time()
+            if state.get('open_until', 0) > now:
+                return state
+            trips = state.get('trips', 0) + 1
+            window = min(self.max_backoff, self.backoff * 2 ** (trips - 1))
+            if on_open is not None:
+                on_open(host)
+            return {'open_until': now + window, 'trips': trips}
+
+        return max(0.0, self._update(host, update)['open_until'] - time.time())
+
+    def reset(self, host):
+        '''Reset trips of host in a row, after a clean fetch'''
+        if self.state(host)['trips']:
+            self._update(host, lambda state: dict(state, trips=0))
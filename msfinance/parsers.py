@@ -0,0 +1,281 @@
+import io
+import re
+
+import xlrd
+import numpy as np
+import pandas as pd
+
+try:
+    # Optional, Rust based reader of spreadsheets, pip install msfinance[calamine]
+    import python_calamine
+except ImportError:
+    python_calamine = None
+
+
+# Name of the line item column, the first column of Morningstar exports
+LABEL_COLUMN = 'Name'
+
+
+def _find_table(data):
+    '''Find the first object with 'columnDefs' and 'rows' in Morningstar JSON, depth first'''
+    if isinstance(data, dict):
+        if 'columnDefs' in data and 'rows' in data:
+            return data
+        values = data.values()
+    elif isinstance(data, list):
+        values = data
+    else:
+        return None
+
+    for value in values:
+        table = _find_table(value)
+        if table is not None:
+            return table
+    return None
+
+
+def _flatten_rows(rows, records, width):
+    '''Flatten nested rows of Morningstar JSON, each sub level follows its parent row'''
+    for row in rows:
+        datum = list(row.get('datum') or [])
+        datum = (datum + [None] * width)[:width]
+        records.append([row.get('label')] + datum)
+        _flatten_rows(row.get('subLevel') or [], records, width)
+
+
+def parse_table_json(data):
+    '''
+    Parse statement or statistics JSON loaded by Morningstar pages into a DataFrame,
+    in the same shape as the exported spreadsheet
+
+    Args:
+        data: Decoded JSON object
+
+    Returns:
+        DataFrame with line item column followed by one column per fiscal period,
+        or None if there is no table in JSON
+    '''
+    table = _find_table(data)
+    if table is None:
+        return None
+
+    columns = [str(c) for c in table['columnDefs']]
+    records = []
+    _flatten_rows(table['rows'], records, len(columns))
+    return pd.DataFrame.from_records(records, columns=[LABEL_COLUMN] + columns, coerce_float=True)
+
+
+def _cell_value(value):
+    '''Normalize cell value as pandas.read_excel does, empty cell is None, integral float is int'''
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if '' == value:
+        return None
+    return value
+
+
+def _frame_from_rows(rows):
+    '''Build DataFrame from rows of cell values, first row is the header, blank rows are skipped'''
+    rows = [[_cell_value(v) for v in row] for row in rows]
+    rows = [row for row in rows if any(v is not None for v in row)]
+    if not rows:
+        return pd.DataFrame()
+
+    width = max(len(row) for row in rows)
+    header = rows[0] + [None] * (width - len(rows[0]))
+    columns = [f"Unnamed: {i}" if v is None else v for i, v in enumerate(header)]
+    # Missing values are NaN, also in columns of strings
+    records = [[np.nan if v is None else v for v in row] + [np.nan] * (width - len(row)) for row in rows[1:]]
+    return pd.DataFrame(records, columns=columns)
+
+
+def _read_xlrd(data):
+    '''Read first sheet with xlrd directly, without the generic machinery of pandas.read_excel'''
+    book = xlrd.open_workbook(file_contents=data, on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        rows = []
+        for i in range(sheet.nrows):
+            row = []
+            for cell in sheet.row(i):
+                if xlrd.XL_CELL_DATE == cell.ctype:
+                    row.append(xlrd.xldate_as_datetime(cell.value, book.datemode))
+                elif cell.ctype in (xlrd.XL_CELL_ERROR, xlrd.XL_CELL_BLANK):
+                    row.append(None)
+                elif xlrd.XL_CELL_BOOLEAN == cell.ctype:
+                    row.append(bool(cell.value))
+                else:
+                    row.append(cell.value)
+            rows.append(row)
+    finally:
+        book.release_resources()
+    return _frame_from_rows(rows)
+
+
+def _read_calamine(data):
+    '''Read first sheet with python-calamine'''
+    if python_calamine is None:
+        raise ImportError("python-calamine is not installed, pip install msfinance[calamine]")
+    workbook = python_calamine.CalamineWorkbook.from_filelike(io.BytesIO(data))
+    return _frame_from_rows(workbook.get_sheet_by_index(0).to_python(skip_empty_area=False))
+
+
+def _read_pandas(data):
+    '''Read first sheet with pandas.read_excel'''
+    return pd.read_excel(io.BytesIO(data))
+
+
+# Spreadsheet parsers by engine name, each takes bytes of a spreadsheet and returns a DataFrame.
+# Other engines can be registered here
+spreadsheet_engines = {
+    'pandas': _read_pandas,
+    'xlrd': _read_xlrd,
+    'calamine': _read_calamine,
+}
+
+
+def parse_spreadsheet(data, engine='auto'):
+    '''
+    Parse exported spreadsheet in memory into a DataFrame, in the same shape as pandas.read_excel
+
+    Args:
+        data: Bytes of the spreadsheet
+        engine: Name of engine in spreadsheet_engines, 'auto' for calamine if it is installed, else xlrd
+
+    Returns:
+        DataFrame of the first sheet
+    '''
+    if 'auto' == engine:
+        engine = 'xlrd' if python_calamine is None else 'calamine'
+    try:
+        parser = spreadsheet_engines[engine]
+    except KeyError:
+        raise ValueError(f"Invalid spreadsheet engine: {engine}")
+    return parser(data)
+
+
+# Scale of unit suffixes in values, e.g. '1.2B'
+UNIT_SCALES = {
+    'K': 1e3,
+    'M': 1e6,
+    'B': 1e9,
+    'T': 1e12,
+}
+
+# Columns which are not line item values
+META_COLUMNS = ('Last Updated',)
+
+
+def _to_numeric(series, dtype):
+    '''Convert a column of values to numbers, vectorized over the column'''
+    if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+        return series.astype(dtype)
+
+    text = series.astype('string').str.strip()
+    text = text.str.replace(',', '', regex=False).str.replace('%', '', regex=False)
+
+    # Accounting format of negative values, e.g. '(1.5)'
+    negative = text.str.startswith('(') & text.str.endswith(')')
+    text = text.str.strip('()')
+
+    # Unit suffixes, e.g. '1.2B'
+    scale = text.str[-1:].str.upper().map(UNIT_SCALES)
+    text = text.where(scale.isna(), text.str[:-1])
+
+    # Dashes and other placeholders of missing values become NaN
+    values = pd.to_numeric(text, errors='coerce').astype('float64')
+    values = values * scale.astype('float64').fillna(1.0).to_numpy()
+    values[negative.fillna(False).to_numpy(dtype=bool)] *= -1
+    return values.astype(dtype)
+
+
+def normalize_statement(df, dtype='float64'):
+    '''
+    Convert line item values of a statement or statistics to numbers. Thousands
+    separators, percent signs, accounting negatives and unit suffixes are parsed,
+    dashes and other placeholders become NaN. Column names become strings
+
+    Args:
+        df: DataFrame with line item column followed by one column per fiscal period
+        dtype: dtype of values, 'float64' or 'float32'
+
+    Returns:
+        DataFrame with numeric value columns
+    '''
+    df = df.copy()
+    df.columns = [str(c) for c in df.columns]
+    for column in df.columns[1:]:
+        if column not in META_COLUMNS:
+            df[column] = _to_numeric(df[column], dtype)
+    return df
+
+
+def melt_statement(df, id_vars=()):
+    '''
+    Reshape a wide statement to long format, one row per line item and fiscal period
+
+    Args:
+        df: DataFrame with id_vars columns, line item column and one column per fiscal period
+        id_vars: Columns kept as identifiers, e.g. ticker
+
+    Returns:
+        DataFrame with id_vars columns, item, fiscal_period and value
+    '''
+    id_vars = list(id_vars)
+    columns = [c for c in df.columns if c not in id_vars and c not in META_COLUMNS]
+    wide = df[id_vars + columns]
+    wide.columns = id_vars + ['item'] + [str(c) for c in columns[1:]]
+    return wide.melt(id_vars=id_vars + ['item'], var_name='fiscal_period', value_name='value')
+
+
+_period_patterns = [
+    # 2023
+    (re.compile(r'^(\d{4})$'), lambda m: pd.Period(m.group(1), 'Y')),
+    # 2023-09, 2023/09
+    (re.compile(r'^(\d{4})[-/](\d{1,2})$'), lambda m: pd.Period(year=int(m.group(1)), month=int(m.group(2)), freq='M')),
+    # 09/2023, 09-2023
+    (re.compile(r'^(\d{1,2})[-/](\d{4})$'), lambda m: pd.Period(year=int(m.group(2)), month=int(m.group(1)), freq='M')),
+    # 2023Q3, 2023-Q3, 2023 Q3
+    (re.compile(r'^(\d{4})[- ]?Q([1-4])$', re.I),
+     lambda m: pd.Period(year=int(m.group(1)), quarter=int(m.group(2)), freq='Q')),
+    # Q3 2023, Q3-2023
+    (re.compile(r'^Q([1-4])[- ]?(\d{4})$', re.I),
+     lambda m: pd.Period(year=int(m.group(2)), quarter=int(m.group(1)), freq='Q')),
+]
+
+
+def parse_period(label):
+    '''
+    Parse fiscal period header of a statement
+
+    Args:
+        label: Column header, e.g. '2023', '2023-09', 'Q3 2023', 'TTM'
+
+    Returns:
+        pandas.Period, or None if it is not a fiscal period, e.g. 'TTM'
+    '''
+    label = str(label).strip()
+    for pattern, make in _period_patterns:
+        match = pattern.match(label)
+        if match is not None:
+            return make(match)
+    return None
+
+
+def to_periods(df):
+    '''
+    Reshape a normalized statement to line items by typed fiscal periods
+
+    Args:
+        df: DataFrame with line item column followed by one column per fiscal period
+
+    Returns:
+        DataFrame indexed by line item, with PeriodIndex columns. Columns which are
+        not fiscal periods, e.g. 'TTM' and 'Last Updated', are dropped
+    '''
+    periods = {column: parse_period(column) for column in df.columns[1:]}
+    columns = [column for column, period in periods.items() if period is not None]
+    values = df.set_index(df.columns[0])[columns]
+    values.columns = pd.PeriodIndex([periods[column] for column in columns])
+    values.columns.name = 'period'
+    return values
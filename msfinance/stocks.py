@@ -1,20 +1,23 @@
 import os
 import random
-import re
 import time
-import json
 import requests
-import tempfile
 import logging
-import glob
+import asyncio
+import weakref
+import threading
 import multiprocessing
 
 import pandas as pd
 
-from tenacity import retry, wait_random, stop_after_attempt
-from datetime import datetime
+from tenacity import retry, stop_after_attempt, retry_if_exception
+from io import StringIO
+from datetime import datetime, timedelta
+from collections import Counter
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse, parse_qs
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
@@ -24,22 +27,24 @@ from selenium.common.exceptions import NoSuchElementException
 from selenium.common.exceptions import ElementClickInterceptedException
 from selenium.common.exceptions import ElementNotInteractableException
 from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import InvalidSessionIdException
+from selenium.common.exceptions import WebDriverException
 
 
 import sqlalchemy
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 
 from fake_useragent import UserAgent
 
-from selenium_stealth import stealth
-import undetected_chromedriver as uc
-
-# For Chrome driver
-from webdriver_manager.chrome import ChromeDriverManager
-
-# For Firefox driver
-from webdriver_manager.firefox import GeckoDriverManager
+from msfinance.drivers import DriverPool, NetworkCapture, DownloadWatcher
+from msfinance.pacing import Pacer, CircuitBreaker, BotChallenge
+from msfinance.parsers import parse_table_json, parse_spreadsheet, normalize_statement, melt_statement
+from msfinance.storage import CATALOG_COLUMNS, ensure_catalog, lookup_catalog, update_catalog, catalog_tickers
+from msfinance.storage import touch_catalog
+from msfinance.storage import ensure_facts, write_facts, close_facts, read_facts, query_facts
+from msfinance.storage import FrameCache, ParquetStore, NO_PERIOD, WriteBehind
 
 
 # Mapping statistics string to statistics file name
@@ -51,27 +56,220 @@ statistics_filename = {
     'Cash Flow':                    'cashFlow',
 }
 
+# Mapping dataset name of bulk APIs to kind and statement or statistics string
+dataset_names = {
+    'income_statement':             ('statement', 'Income Statement'),
+    'balance_sheet':                ('statement', 'Balance Sheet'),
+    'cash_flow_statement':          ('statement', 'Cash Flow'),
+    'financial_summary':            ('statistics', 'Financial Summary'),
+    'growth':                       ('statistics', 'Growth'),
+    'profitability_and_efficiency': ('statistics', 'Profitability and Efficiency'),
+    'financial_health':             ('statistics', 'Financial Health'),
+    'cash_flow':                    ('statistics', 'Cash Flow'),
+}
+
+# Mapping exchange of Morningstar to exchange name of NASDAQ screener
+us_exchange_screeners = {
+    'xnas':                         'nasdaq',
+    'xnys':                         'nyse',
+    'xase':                         'amex',
+}
+
+# Base URLs of websites data is fetched from, which may be overridden, e.g. by a local stand-in
+website_urls = {
+    'morningstar':                  'https://www.morningstar.com',
+    'nasdaq':                       'https://api.nasdaq.com',
+    'wikipedia':                    'https://en.wikipedia.org',
+}
+
+# Max age of cached index constituents, if freshness policy has none
+index_max_age = timedelta(days=1)
+
+# Seconds of human-like delay which cost one step of pacing budget, the mean of the default
+# delay of 3 to 15 seconds, so the default Pacer rate of 1/9 steps per second keeps its pace
+human_delay_step = 9
+
+# Default days to skip fetches which found no data or failed permanently
+negative_max_age = {
+    'no_data':                      30,
+    'failed':                       1,
+}
+
+# Mapping statement string to statement type in Morningstar API
+statement_apiname = {
+    'Income Statement':             'incomeStatement',
+    'Balance Sheet':                'balanceSheet',
+    'Cash Flow':                    'cashFlow',
+}
+
+# Mapping period and stage string to query parameters in Morningstar API
+period_apiparam = {
+    'Annual':                       'A',
+    'Quarterly':                    'Q',
+}
+stage_apiparam = {
+    'As Originally Reported':       'A',
+    'Restated':                     'R',
+}
+
+
+def _setup_wal(dbapi_connection, connection_record):
+    '''Setup SQLite connection for write-behind writer'''
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA busy_timeout=30000")
+    cursor.close()
+
+
+def _weak_method(method):
+    '''Function calling a bound method through a weak reference, which does not keep its instance alive'''
+    ref = weakref.WeakMethod(method)
+
+    def call(*args, **kwargs):
+        method = ref()
+        if method is None:
+            raise ReferenceError("Instance of the method is collected")
+        return method(*args, **kwargs)
+    return call
+
+
+class PageNotFound(Exception):
+    '''Website has no such page, e.g. bad ticker, or ticker is not a stock'''
+
+
+def _classify_error(e):
+    '''
+    Classify exception of a fetch
+
+    Returns:
+        'permanent' for errors which retries can not fix, 'challenge' for bot challenges,
+        'driver' for broken drivers, 'transient' for others
+    '''
+    if isinstance(e, PageNotFound):
+        return 'permanent'
+    if isinstance(e, BotChallenge):
+        return 'challenge'
+    if isinstance(e, (TimeoutException, StaleElementReferenceException,
+                      ElementClickInterceptedException, ElementNotInteractableException)):
+        return 'transient'
+    if isinstance(e, (InvalidSessionIdException, WebDriverException)):
+        return 'driver'
+    return 'transient'
+
+
+def _match_api_url(url, name, params):
+    '''Check if url is a Morningstar API request of name, with all query parameters in params'''
+    parsed = urlparse(url)
+    if name not in parsed.path.split('/'):
+        return False
+    query = parse_qs(parsed.query)
+    return all(query.get(k, [None])[0] == v for k, v in params.items())
+
 
 class StockBase:
-    def __init__(self, debug=False, browser='chrome', database='msfinance.db3', session_factory=None, proxy=None, driver_type='uc'):
+    def __init__(self, debug=False, browser='chrome', database='msfinance.db3', session_factory=None, proxy=None,
+                 driver_type='uc', driver_pool=None, storage='table', freshness=None, memory_cache=0,
+                 fetch_mode='export', download_timeout=30, pacer=None, breaker=None, negative_ttl=None,
+                 spreadsheet_engine='auto', normalize=True, value_dtype='float64', parquet_dir=None,
+                 write_behind=False, base_urls=None):
         self.debug = debug
         self.setup_logger()
 
+        # How data is fetched from website, 'export' to download the exported spreadsheet,
+        # 'network' to capture the JSON loaded by the page (Chrome only)
+        if fetch_mode not in ('export', 'network'):
+            raise ValueError(f"Invalid fetch mode: {fetch_mode}")
+        self.fetch_mode = fetch_mode
+
+        # Deadline in seconds for an exported spreadsheet to be downloaded, or for the JSON of a table to be captured
+        self.download_timeout = download_timeout
+
+        # Engine to parse exported spreadsheets, see msfinance.parsers.spreadsheet_engines
+        self.spreadsheet_engine = spreadsheet_engine
+
+        # Convert values of statements and statistics to numbers of value_dtype,
+        # 'float64' or 'float32', when they are fetched and read
+        self.normalize = normalize
+        self.value_dtype = value_dtype
+
+        # Pacing of human-like steps per host, a Pacer which may be shared by instances,
+        # or a target rate in steps per second
+        if pacer is None:
+            pacer = Pacer()
+        elif not isinstance(pacer, Pacer):
+            pacer = Pacer(rate=pacer)
+        self.pacer = pacer
+
+        # Circuit breaker opened by bot challenges, which pauses fetches of all threads and processes
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+
+        # Storage layout of statements and statistics, 'table' for one table per unique_id,
+        # 'fact' for one indexed long-format table shared by all tickers,
+        # 'parquet' for partitioned Parquet files in parquet_dir, catalog is always in database
+        if storage not in ('table', 'fact', 'parquet'):
+            raise ValueError(f"Invalid storage layout: {storage}")
+        self.storage = storage
+        if parquet_dir is None:
+            parquet_dir = f"{os.path.splitext(database)[0]}.parquet"
+        self.parquet_dir = parquet_dir
+        self._parquet = ParquetStore(parquet_dir) if 'parquet' == storage else None
+
+        # Freshness policy of cached data, e.g. {'Quarterly': 30, 'Annual': 90, 'Financial Summary': 7}.
+        # Keys are matched in order: (dataset, period), (kind, dataset), dataset, period, kind, 'default'.
+        # Values are days or datetime.timedelta, data without policy never gets stale
+        self.freshness = dict(freshness) if freshness is not None else {}
+
+        # Days or datetime.timedelta to skip fetches which found no data ('no_data')
+        # or failed permanently ('failed'), e.g. bad tickers, funds and new listings
+        self.negative_ttl = dict(negative_max_age)
+        if negative_ttl is not None:
+            self.negative_ttl.update(negative_ttl)
+
+        # In-memory LRU cache in front of database reads, bounded by bytes of cached DataFrames,
+        # 0 to disable
+        self.memory_cache = FrameCache(memory_cache) if memory_cache else None
+
+        # Counters of cache lookups: hit, miss and stale
+        self.cache_stats = Counter()
+        self.last_skipped = 0
+
+        # Seconds spent in each step of fetches: driver, breaker, page_load, delay,
+        # element_wait, download, parse and db_write, added up over all threads
+        self.timings = Counter()
+        self._timings_lock = threading.Lock()
+
+        # Base URLs of websites, see website_urls
+        self.base_urls = dict(website_urls)
+        if base_urls is not None:
+            self.base_urls.update(base_urls)
+
         # Initialize UserAgent for random user-agent generation
         self.ua = UserAgent()
 
-        self.driver_type = driver_type
-
-        # Setup driver
-        if browser == 'chrome':
-            if os.environ.get('CHROME_PATH') is not None:
-                self.chrome_path = os.environ.get('CHROME_PATH')
-            else:
-                self.chrome_path = None
-            self.setup_chrome_driver(proxy)
+        # Setup driver pool, drivers are borrowed from the pool for each fetch,
+        # so no browser is launched until data must be fetched from website
+        if driver_pool is not None:
+            self.driver_pool = driver_pool
+            self._own_driver_pool = False
         else:
-            # Default: firefox
-            self.setup_firefox_driver(proxy)
+            self.driver_pool = DriverPool(
+                size=1,
+                debug=debug,
+                browser=browser,
+                proxy=proxy,
+                driver_type=driver_type,
+                warmup_url=f"{self.base_urls['morningstar']}/stocks",
+                logger=self.logger,
+                capture_network=('network' == fetch_mode),
+            )
+            self._own_driver_pool = True
+
+        # Driver borrowed by current thread
+        self._local = threading.local()
+
+        # Index of ticker to exchange, built on first use and dropped when ticker tables refresh
+        self._exchange_index = None
+        self._exchange_index_lock = threading.Lock()
 
         # Setup session
         if session_factory is not None:
@@ -80,24 +278,108 @@ class StockBase:
             # Setup SQLAlchemy engine and session
             self.engine = create_engine(
                 f'sqlite:///{database}', pool_size=5, max_overflow=10)
+            if write_behind:
+                # Readers do not block the writer, and the writer waits for other processes
+                event.listen(self.engine, 'connect', _setup_wal)
             self.Session = sessionmaker(bind=self.engine)
 
+        self._setup_catalog()
+
+        # Write-behind writer of fetched data, a background thread batching writes in
+        # one transaction. Data waiting to be written is served from _pending_writes
+        self._writer = None
+        self._pending_writes = {}
+        self._pending_lock = threading.Lock()
+        if write_behind:
+            # The writer only holds a weak reference, so this instance can be collected and closed
+            self._writer = WriteBehind(_weak_method(self._write_pending), logger=self.logger)
+            weakref.finalize(self, self._writer.close)
+
         # Setup proxies for requests
         self.proxies = {
             "http": proxy,
             "https": proxy,
         }
 
-        # Open Morningstar stock page
-        url = f"https://www.morningstar.com/stocks"
-        self.driver.get(url)
-        time.sleep(15)
+        # Keep-alive HTTP session for requests other than the browser, shared by threads
+        self.http = requests.Session()
+        self.http.proxies.update(self.proxies)
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
 
-        self.logger.debug("Driver initialized")
+        self.logger.debug("Stock initialized")
 
     def __del__(self):
-        if not self.debug:
-            self.driver.quit()
+        if not getattr(self, 'debug', True):
+            self.close()
+        elif getattr(self, '_writer', None) is not None:
+            # Queued data is written even in debug mode
+            self._writer.close()
+
+    def flush(self):
+        '''Wait until data queued by write-behind writer is written to database'''
+        if getattr(self, '_writer', None) is not None:
+            self._writer.flush()
+
+    def close(self):
+        '''
+        Write queued data, quit drivers of the pool owned by this instance, and close HTTP session.
+        The first error of write-behind writer is raised after all of them are closed
+        '''
+        try:
+            if getattr(self, '_writer', None) is not None:
+                self._writer.close()
+        finally:
+            if getattr(self, '_own_driver_pool', False):
+                self.driver_pool.close()
+            if getattr(self, 'http', None) is not None:
+                self.http.close()
+
+    @property
+    def driver(self):
+        '''Driver borrowed by current thread, or None'''
+        return getattr(self._local, 'driver', None)
+
+    @driver.setter
+    def driver(self, driver):
+        self._local.driver = driver
+
+    @property
+    def parquet(self):
+        '''Parquet store of statements and statistics, opened on first use'''
+        if self._parquet is None:
+            self._parquet = ParquetStore(self.parquet_dir)
+        return self._parquet
+
+    @property
+    def download_dir(self):
+        '''Download directory of the driver borrowed by current thread'''
+        return self.driver_pool.download_dir(self.driver)
+
+    @contextmanager
+    def _timed(self, step):
+        '''Add time spent in the block to timings of step'''
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            with self._timings_lock:
+                self.timings[step] += elapsed
+
+    @contextmanager
+    def _borrow_driver(self):
+        '''Borrow a driver from the pool for current thread, and give it back on exit'''
+        with self._timed('driver'):
+            self.driver = self.driver_pool.acquire()
+        try:
+            yield self.driver
+        finally:
+            # The driver may be replaced by reset_driver() in the meantime, or be gone if reset fails
+            if self.driver is not None:
+                self.driver_pool.release(self.driver)
+            self.driver = None
 
     def setup_logger(self):
         # Get the current process name
@@ -140,130 +422,377 @@ class StockBase:
             self.logger.info(
                 f"  Time elapsed: {retry_state.seconds_since_start}")
 
-        # Setup a new driver instance
-        if isinstance(self.driver, (webdriver.Chrome, uc.Chrome)):
-            self.driver.quit()
-            self.setup_chrome_driver(self.proxies['http'])
-        else:
-            self.driver.quit()
-            self.setup_firefox_driver(self.proxies['http'])
+        # Setup a new driver instance in the same pool slot, the old one is quit even if it fails
+        driver, self.driver = self.driver, None
+        self.driver = self.driver_pool.reset(driver)
+
+    def _setup_catalog(self):
+        '''Create catalog and fact tables of cached data if they do not exist'''
+        session = self.Session()
+        try:
+            conn = session.connection()
+            ensure_catalog(conn)
+            ensure_facts(conn)
+            session.commit()
+        finally:
+            session.close()
+
+    def statement_id(self, ticker, exchange, statement, period='Annual', stage='Restated'):
+        '''
+        Compose unique ID of a financials statement, which is its database table name
+
+        Args:
+            ticker: Stock symbol
+            exchange: Exchange name, resolved from ticker if None
+            statement: Statement name, e.g. 'Income Statement'
+            period: Period of statement, which can be 'Annual'(default), 'Quarterly'
+            stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
+        Returns:
+            Unique ID string
+        '''
+        return f"{ticker}_{exchange}_{statement}_{period}_{stage}".replace(' ', '_').lower()
+
+    def statistics_id(self, ticker, exchange, statistics, stage='Restated'):
+        '''
+        Compose unique ID of a key metrics statistics, which is its database table name
+
+        Args:
+            ticker: Stock symbol
+            exchange: Exchange name, resolved from ticker if None
+            statistics: Statistics name, e.g. 'Financial Summary'
+            stage: Stage of statistics, which can be 'As Originally Reported', 'Restated'(default)
+        Returns:
+            Unique ID string
+        '''
+        return f"{ticker}_{exchange}_{statistics}_{stage}".replace(' ', '_').lower()
+
+    def lookup_catalog(self, unique_ids):
+        '''
+        Batch lookup of cached data in catalog
+
+        Args:
+            unique_ids: List of unique ID
+        Returns:
+            DataFrame of catalog records indexed by unique_id, unique ID not cached is absent
+        '''
+        session = self.Session()
+        try:
+            records = lookup_catalog(session.connection(), unique_ids)
+        finally:
+            session.close()
 
-    def setup_chrome_driver(self, proxy):
-        # Chrome support
-        self.options = webdriver.ChromeOptions()
+        df = pd.DataFrame(list(records.values()), columns=CATALOG_COLUMNS)
+        return df.set_index('unique_id')
 
-        # Set a random user-agent
-        self.options.add_argument(f"--user-agent={self.ua.random}")
+    def get_missing(self, unique_ids, max_age=None):
+        '''
+        Find unique IDs which are not cached, or older than max_age. Failed fetches are missing,
+        fetches without data are missing after negative TTL
+
+        Args:
+            unique_ids: List of unique ID
+            max_age: datetime.timedelta, None means cached data never gets stale
+        Returns:
+            List of missing or stale unique ID, in the given order
+        '''
+        session = self.Session()
+        try:
+            records = lookup_catalog(session.connection(), unique_ids)
+        finally:
+            session.close()
 
-        # Setting download directory
-        self.download_dir = os.path.join(
-            tempfile.gettempdir(), 'msfinance', str(os.getpid()))
-        self.logger.debug(f"Download directory: {self.download_dir}")
+        missing = []
+        for unique_id in unique_ids:
+            record = records.get(unique_id)
+            if record is None or 'failed' == record['status']:
+                missing.append(unique_id)
+            elif record['status'] is not None:
+                # No data is only missing again after negative TTL
+                if self._is_stale(record['fetched_at'], self._negative_age(record['status'])):
+                    missing.append(unique_id)
+            elif self._is_stale(record['fetched_at'], max_age):
+                missing.append(unique_id)
+        return missing
+
+    def query_facts(self, dataset, items=None, tickers=None, exchange=None, period=None, stage=None,
+                    as_of=None, history=False):
+        '''
+        Query line items of a dataset across tickers with one indexed query,
+        only data stored with 'fact' storage layout is included. Values replaced
+        by refreshes are kept, so data can be queried as it was at an earlier time
 
-        if not os.path.exists(self.download_dir):
-            os.makedirs(self.download_dir)
+        Args:
+            dataset: Dataset name, e.g. 'Income Statement', 'Financial Summary'
+            items: List of line items, None for all
+            tickers: List of stock symbols, None for all
+            exchange: Exchange name, None for all
+            period: Period of statement, 'Annual' or 'Quarterly', '' for statistics, None for all
+            stage: Stage of data, 'As Originally Reported' or 'Restated', None for all
+            as_of: datetime or date string, query values valid at that time, None for current values
+            history: Query all versions of values, with the time range each one is valid
+        Returns:
+            DataFrame in long format, one row per ticker, line item and fiscal period,
+            and per version if history is set
+        '''
+        session = self.Session()
+        try:
+            return query_facts(
+                session.connection(), dataset, items, tickers, exchange, period, stage, as_of, history)
+        finally:
+            session.close()
 
-        # Use headless mode
-        if not self.debug:
-            self.options.add_argument("--headless")
+    def load_dataset(self, dataset, period='Annual', stage='Restated', exchange=None, tickers=None,
+                     columns=None, as_arrow=False):
+        '''
+        Load a dataset of many tickers at once from Parquet store, only matching partitions
+        and columns are read, only data stored with 'parquet' storage layout is included
+
+        Args:
+            dataset: Dataset name, e.g. 'income_statement', or display name, e.g. 'Income Statement',
+                'Cash Flow' is ambiguous, use 'cash_flow_statement' or 'cash_flow' instead
+            period: Period of statement, which can be 'Annual'(default), 'Quarterly', it is ignored for statistics
+            stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default), None for all
+            exchange: Exchange name, None for all
+            tickers: List of stock symbols, None for all
+            columns: List of columns to read, e.g. ['Name', '2023'], None for all
+            as_arrow: Return pyarrow.Table, without copying into pandas
+        Returns:
+            DataFrame or pyarrow.Table with one row per ticker and line item, None if nothing is stored
+        '''
+        _, kind, dataset = self._resolve_dataset(dataset)
+        if 'statistics' == kind:
+            period = NO_PERIOD
+        return self.parquet.load(dataset, period, stage, exchange, tickers, columns, as_arrow)
+
+    def panel(self, tickers, dataset, items=None, period='Annual', stage='Restated', tidy=False, fetch=False):
+        '''
+        Cross-sectional panel of line items of a dataset over many tickers, read from
+        cache with one catalog lookup and batched reads of each storage layout.
+        Tickers whose data is not cached or stale are left out, unless fetch is set
+
+        Args:
+            tickers: List of (ticker, exchange) or tickers, exchange is resolved from ticker if not given
+            dataset: Dataset name, e.g. 'income_statement', or display name, e.g. 'Income Statement',
+                'Cash Flow' is ambiguous, use 'cash_flow_statement' or 'cash_flow' instead
+            items: List of line items, e.g. ['Total Revenue'], None for all
+            period: Period of statement, which can be 'Annual'(default), 'Quarterly', it is ignored for statistics
+            stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
+            tidy: Return long format, else ticker and fiscal period by line item
+            fetch: Fetch missing or stale data from website with fetch_many(), which can not be
+                done inside a running event loop, await fetch_many() there before panel() instead
+        Returns:
+            DataFrame indexed by ticker and fiscal period with one column per line item, or if tidy,
+            DataFrame with columns ticker, exchange, item, fiscal_period and value
+        '''
+        if fetch and self._in_event_loop():
+            raise RuntimeError(
+                "panel(fetch=True) can not run inside a running event loop, "
+                "await stock.fetch_many(tickers, [dataset]) and call panel() without fetch instead")
+
+        name, kind, dataset = self._resolve_dataset(dataset)
+        stage = self._dataset_stage(name, stage)
+        if 'statement' == kind:
+            max_age = self._max_age(kind, dataset, period)
         else:
-            self.options.add_argument("--start-maximized")
-            self.options.add_argument("--disable-popup-blocking")
-
-        if proxy is not None:
-            [protocol, host, port] = re.split(r'://|:', proxy)
-            if 'socks5' == protocol:
-                self.options.add_argument(
-                    f'--proxy-server=socks5://{host}:{port}')
+            period = None
+            max_age = self._max_age(kind, dataset)
+
+        pairs = {}
+        for ticker, exchange in self._ticker_pairs(tickers):
+            if 'statement' == kind:
+                unique_id = self.statement_id(ticker, exchange, dataset, period, stage)
             else:
-                self.logger.error("No supported proxy protocol")
-                exit(1)
-
-        # Initialize the undetected_chromedriver
-        self.initialize_chrome_driver()
-
-        # Override the webdriver property, make more undetected
-        self.driver.execute_cdp_cmd("Page.addScriptToEvaluateOnNewDocument", {
-            "source": """
-                Object.defineProperty(navigator, 'webdriver', {
-                    get: () => undefined
-                })
-            """
-        })
-
-        # Change download directory
-        params = {
-            "behavior": "allow",
-            "downloadPath": self.download_dir,
-        }
-        self.driver.execute_cdp_cmd("Page.setDownloadBehavior", params)
-
-    def setup_firefox_driver(self, proxy):
-        self.options = webdriver.FirefoxOptions()
-
-        # Setting download directory
-        self.download_dir = os.path.join(
-            tempfile.gettempdir(), 'msfinance', str(os.getpid()))
-        self.logger.debug(f"Download directory: {self.download_dir}")
-
-        if not os.path.exists(self.download_dir):
-            os.makedirs(self.download_dir)
-
-        self.options.set_preference("browser.download.folderList", 2)
-        self.options.set_preference("browser.download.dir", self.download_dir)
-        self.options.set_preference("browser.download.useDownloadDir", True)
-        self.options.set_preference(
-            "browser.download.viewableInternally.enabledTypes", "")
-        self.options.set_preference(
-            "browser.download.manager.showWhenStarting", False)
-        self.options.set_preference(
-            "browser.helperApps.neverAsk.saveToDisk", "application/octet-stream")
-        # Enable cache
-        self.options.set_preference("browser.cache.disk.enable", True)
-        self.options.set_preference("browser.cache.memory.enable", True)
-        self.options.set_preference("browser.cache.offline.enable", True)
-        self.options.set_preference("network.http.use-cache", True)
-
-        self.options.set_preference(
-            "general.useragent.override", self.ua.random)
-
-        # Use headless mode
-        if not self.debug:
-            self.options.add_argument("--headless")
-
-        if proxy is not None:
-            [protocol, host, port] = re.split(r'://|:', proxy)
-            # Use set_preference method to enable the DNS proxy
-            self.options.set_preference('network.proxy.type', 1)
-            if 'socks5' == protocol:
-                self.options.set_preference('network.proxy.socks', host)
-                self.options.set_preference(
-                    'network.proxy.socks_port', int(port))
-                self.options.set_preference('network.proxy.socks_version', 5)
-                self.options.set_preference(
-                    'network.proxy.socks_remote_dns', True)
+                unique_id = self.statistics_id(ticker, exchange, dataset, stage)
+            pairs[unique_id] = (ticker, exchange)
+
+        # Wide frames of (ticker, exchange, DataFrame) served from memory, others are looked up in catalog
+        frames = []
+        lookup = []
+        for unique_id in pairs:
+            entry = self.memory_cache.get(unique_id) if self.memory_cache is not None else None
+            with self._pending_lock:
+                entry = self._pending_writes.get(unique_id, entry)
+            if entry is not None and not self._is_stale(entry[1], max_age):
+                frames.append(pairs[unique_id] + (entry[0],))
             else:
-                self.logger.error("No supported proxy protocol")
-                exit(1)
+                lookup.append(unique_id)
+
+        # Cached unique IDs by storage layout
+        stored = {'table': [], 'fact': [], 'parquet': []}
+        missing = []
+
+        long = []
+        session = self.Session()
+        try:
+            conn = session.connection()
+            records = lookup_catalog(conn, lookup)
+            for unique_id in lookup:
+                record = records.get(unique_id)
+                if record is None or record['status'] is not None or self._is_stale(record['fetched_at'], max_age):
+                    missing.append(unique_id)
+                else:
+                    stored[record['storage'] or 'table'].append(unique_id)
+
+            # Tables of legacy layout are read one by one, on the same connection
+            for unique_id in stored['table']:
+                df = pd.read_sql_query(f"SELECT * FROM '{unique_id}'", conn)
+                frames.append(pairs[unique_id] + (df,))
+
+            # Facts of all tickers with one indexed query
+            if stored['fact']:
+                df = query_facts(conn, dataset, items, [pairs[u][0] for u in stored['fact']],
+                                 period=period or '', stage=stage)
+                long.append(self._panel_rows(df, [pairs[u] for u in stored['fact']]))
+        finally:
+            session.close()
+
+        # Parquet files of all tickers with one dataset scan
+        if stored['parquet']:
+            df = self.parquet.load(dataset, period or NO_PERIOD, stage, None, [pairs[u][0] for u in stored['parquet']])
+            if df is not None:
+                item_columns = list(dict.fromkeys(records[u]['columns'][0] for u in stored['parquet']))
+                item = df[item_columns[0]]
+                for column in item_columns[1:]:
+                    item = item.fillna(df[column])
+                values = df.drop(columns=item_columns + ['ticker', 'exchange', 'dataset', 'period', 'stage'])
+                values.insert(0, 'item', item)
+                values.insert(0, 'exchange', df['exchange'])
+                values.insert(0, 'ticker', df['ticker'])
+                df = melt_statement(values, ['ticker', 'exchange'])
+                long.append(self._panel_rows(df, [pairs[u] for u in stored['parquet']]))
+
+        if fetch and missing:
+            results = asyncio.run(self.fetch_many([pairs[u] for u in missing], [name], period=period or 'Annual',
+                                                  stage=stage))
+            frames.extend((t, e, df) for t, e, _, df in results if df is not None)
+
+        self.cache_stats['hit'] += len(pairs) - len(missing)
+        self.cache_stats['miss'] += len(missing)
+        self.logger.info(f"panel {dataset}: {len(pairs) - len(missing)} cached, {len(missing)} missing or stale")
+
+        for ticker, exchange, df in frames:
+            df = melt_statement(df)
+            df.insert(0, 'exchange', exchange)
+            df.insert(0, 'ticker', ticker)
+            long.append(df)
+
+        columns = ['ticker', 'exchange', 'item', 'fiscal_period', 'value']
+        long = pd.concat([df[columns] for df in long], ignore_index=True) if long else pd.DataFrame(columns=columns)
+        if items is not None:
+            long = long[long['item'].isin(items)]
+        if self.normalize:
+            long = long.assign(value=normalize_statement(long[['item', 'value']], self.value_dtype)['value'])
+        if tidy:
+            return long.reset_index(drop=True)
+
+        order = list(items) if items is not None else list(pd.unique(long['item']))
+        wide = long.groupby(['ticker', 'fiscal_period', 'item'], sort=True)['value'].first().unstack('item')
+        return wide.reindex(columns=[item for item in order if item in wide.columns])
+
+    def _panel_rows(self, df, pairs):
+        '''Keep rows of long format data which belong to pairs, with tickers as given in pairs'''
+        keys = pd.DataFrame(pairs, columns=['ticker', 'exchange'])
+        keys['key_ticker'] = keys['ticker'].str.lower()
+        keys['key_exchange'] = keys['exchange'].str.lower()
+        df = df.rename(columns={'ticker': 'key_ticker', 'exchange': 'key_exchange'})
+        return df.merge(keys, on=['key_ticker', 'key_exchange'])
+
+    def _max_age(self, kind, dataset, period=None, default=None):
+        '''
+        Get max age of cached data from freshness policy
 
-        self.driver = webdriver.Firefox(
-            service=webdriver.FirefoxService(GeckoDriverManager().install()),
-            options=self.options)
+        Returns:
+            datetime.timedelta, or None if cached data never gets stale.
+            default is returned if freshness policy has none
+        '''
+        for key in ((dataset, period), (kind, dataset), dataset, period, kind, 'default'):
+            if key in self.freshness:
+                max_age = self.freshness[key]
+                if max_age is None or isinstance(max_age, timedelta):
+                    return max_age
+                return timedelta(days=max_age)
+        return default
+
+    def _is_stale(self, fetched_at, max_age):
+        '''Check if data fetched at fetched_at is older than max_age'''
+        if max_age is None:
+            return False
+        return fetched_at is None or fetched_at + max_age < datetime.now()
 
-    def _check_database(self, unique_id):
+    def _check_database(self, unique_id, max_age=None):
         '''
         Check database if table with unique_id exists, and return it as a DataFrame
 
         Args:
             unique_id: Name of the query table
+            max_age: datetime.timedelta, cached data older than max_age is stale
 
         Returns:
-            DataFrame of the table, or None
+            DataFrame of the table, or None if it is not cached or stale
         '''
+        # Data queued for the writer is newer than any cached copy of it
+        with self._pending_lock:
+            pending = self._pending_writes.get(unique_id)
+        if pending is not None:
+            df, fetched_at = pending
+            if not self._is_stale(fetched_at, max_age):
+                self.cache_stats['hit'] += 1
+                return df.copy()
+
+        if self.memory_cache is not None:
+            entry = self.memory_cache.get(unique_id)
+            if entry is not None:
+                df, fetched_at = entry
+                if self._is_stale(fetched_at, max_age):
+                    self.logger.debug(f"{unique_id} is stale, fetched at {fetched_at}")
+                    self.cache_stats['stale'] += 1
+                    return None
+                self.cache_stats['hit'] += 1
+                return df
+
         session = self.Session()
         try:
-            query = f"SELECT * FROM '{unique_id}'"
-            df = pd.read_sql_query(query, session.bind)
+            conn = session.connection()
+
+            # Consult catalog first, data table is only read when it is cached
+            record = lookup_catalog(conn, [unique_id]).get(unique_id)
+            if record is None:
+                self.logger.debug(f"{unique_id} is not cached")
+                self.cache_stats['miss'] += 1
+                return None
+
+            if record['status'] is not None:
+                self.logger.debug(f"{unique_id} is not cached, last fetch is {record['status']}")
+                self.cache_stats['miss'] += 1
+                return None
+
+            if self._is_stale(record['fetched_at'], max_age):
+                self.logger.debug(f"{unique_id} is stale, fetched at {record['fetched_at']}")
+                self.cache_stats['stale'] += 1
+                return None
+
+            if 'parquet' == record['storage']:
+                df = self.parquet.read(
+                    record['ticker'], record['exchange'], record['dataset'], record['period'], record['stage'])
+                if df is None:
+                    self.logger.debug(f"{unique_id} is not found in {self.parquet_dir}")
+                    self.cache_stats['miss'] += 1
+                    return None
+            elif 'fact' == record['storage']:
+                df = read_facts(
+                    conn, record['ticker'], record['exchange'], record['dataset'],
+                    record['period'], record['stage'], record['columns'])
+                df['Last Updated'] = record['fetched_at'].strftime('%Y-%m-%d %H:%M:%S.%f')
+            else:
+                query = f"SELECT * FROM '{unique_id}'"
+                df = pd.read_sql_query(query, conn)
+            # Tables cached before catalog kept kind are normalized as well
+            if (record['kind'] or self._legacy_kind(unique_id)) in ('statement', 'statistics'):
+                df = self._normalize(df)
+            self.cache_stats['hit'] += 1
+
+            if self.memory_cache is not None:
+                self.memory_cache.put(unique_id, df, record['fetched_at'])
             return df
         except sqlalchemy.exc.OperationalError as e:
             self.logger.info(f"OperationalError: {e}")
@@ -271,29 +800,201 @@ class StockBase:
         finally:
             session.close()
 
-    def _update_database(self, unique_id, df):
+    def _legacy_kind(self, unique_id):
+        '''Kind of a table cached before catalog kept kind, inferred from its unique_id, or None'''
+        stages = ('As Originally Reported', 'Restated')
+        for statement in statement_apiname:
+            for period in ('Annual', 'Quarterly'):
+                for stage in stages:
+                    if unique_id.endswith(self.statement_id('', '', statement, period, stage)[1:]):
+                        return 'statement'
+        for statistics in statistics_filename:
+            for stage in stages:
+                if unique_id.endswith(self.statistics_id('', '', statistics, stage)[1:]):
+                    return 'statistics'
+        return None
+
+    def _check_negative(self, unique_id):
+        '''
+        Check if last fetch of unique_id found no data or failed permanently, within negative TTL
+
+        Returns:
+            'no_data' or 'failed', or None if it should be fetched
+        '''
+        session = self.Session()
+        try:
+            record = lookup_catalog(session.connection(), [unique_id]).get(unique_id)
+        finally:
+            session.close()
+
+        if record is None or record['status'] is None:
+            return None
+        if self._is_stale(record['fetched_at'], self._negative_age(record['status'])):
+            return None
+        self.cache_stats['negative'] += 1
+        self.logger.debug(f"Skip {unique_id}, last fetch is {record['status']}")
+        return record['status']
+
+    def _negative_age(self, status):
+        '''Negative TTL of status as datetime.timedelta, or None if it never expires'''
+        max_age = self.negative_ttl.get(status)
+        if max_age is not None and not isinstance(max_age, timedelta):
+            max_age = timedelta(days=max_age)
+        return max_age
+
+    def _record_negative(self, unique_id, status, error=None, **meta):
+        '''
+        Record a fetch without data in catalog, data cached earlier is kept for a failed fetch
+
+        Args:
+            unique_id: Name of the table
+            status: 'no_data' or 'failed'
+            error: Error message
+            meta: Catalog columns of the table
+        '''
+        session = self.Session()
+        try:
+            conn = session.connection()
+            record = lookup_catalog(conn, [unique_id]).get(unique_id)
+            if 'failed' == status and record is not None and record['status'] is None:
+                return
+
+            if self.memory_cache is not None:
+                self.memory_cache.invalidate(unique_id)
+            for key in ('ticker', 'exchange'):
+                if meta.get(key) is not None:
+                    meta[key] = meta[key].lower()
+            update_catalog(conn, unique_id, 0, datetime.now(), status=status, error=error, **meta)
+            session.commit()
+        finally:
+            session.close()
+
+    def _normalize(self, df):
+        '''Convert values of statement or statistics to numbers, if normalization is enabled'''
+        if not self.normalize:
+            return df
+        return normalize_statement(df, self.value_dtype)
+
+    def _update_database(self, unique_id, df, **meta):
         '''
         Update database with unique_id as table name, using DataFrame format data.
-        Add 'Last Updated' column to each record
+        Add 'Last Updated' column to each record, and record the table in catalog.
+        Statements and statistics are written to fact table instead, if storage layout is 'fact',
+        where only changed cells are written and replaced values are kept as history
 
         Args:
             unique_id: Name of the table
+            meta: Catalog columns of the table, e.g. ticker, exchange, kind, dataset, period, stage
 
         Returns:
             True if update is done, else False
         '''
+        if self._writer is not None:
+            # Queue data for the writer thread, which is served from memory until it is written
+            df = df.copy()
+            if self.memory_cache is not None:
+                self.memory_cache.invalidate(unique_id)
+            with self._pending_lock:
+                self._pending_writes[unique_id] = (df, datetime.now())
+            self._writer.put((unique_id, df, meta))
+            return True
+
         session = self.Session()
         try:
-            df['Last Updated'] = datetime.now()
-            df.to_sql(unique_id, session.bind,
-                      if_exists='replace', index=False)
+            self._write_database(session.connection(), unique_id, df, **meta)
+            session.commit()
             return True
         finally:
             session.close()
 
+    def _write_pending(self, batch):
+        '''
+        Write a batch of queued data in one transaction, run by write-behind writer.
+        Data of a failed batch is dropped from memory too, so it is not served as cached
+        '''
+        session = self.Session()
+        try:
+            conn = session.connection()
+            for unique_id, df, meta in batch:
+                self._write_database(conn, unique_id, df.copy(), **meta)
+            session.commit()
+        finally:
+            session.close()
+
+            with self._pending_lock:
+                for unique_id, df, _ in batch:
+                    # Newer data of the same unique_id may be queued in the meantime
+                    if self._pending_writes.get(unique_id, (None,))[0] is df:
+                        del self._pending_writes[unique_id]
+
+    def _write_database(self, conn, unique_id, df, **meta):
+        '''
+        Write DataFrame of unique_id and its catalog record with conn, without commit,
+        so several writes can be done in one transaction
+
+        Args:
+            conn: SQLAlchemy connection
+            unique_id: Name of the table
+            df: DataFrame to write
+            meta: Catalog columns of the table
+        '''
+        if self.memory_cache is not None:
+            self.memory_cache.invalidate(unique_id)
+
+        fetched_at = datetime.now()
+        df['Last Updated'] = fetched_at
+
+        for key in ('ticker', 'exchange'):
+            if meta.get(key) is not None:
+                meta[key] = meta[key].lower()
+
+        if 'parquet' == self.storage and meta.get('kind') in ('statement', 'statistics'):
+            key = (meta['ticker'], meta['exchange'], meta['dataset'], meta.get('period'), meta['stage'])
+            columns = self.parquet.write(df, *key)
+            # Drop the table and close the facts written before switching layout
+            conn.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS '{unique_id}'"))
+            close_facts(conn, *key, fetched_at)
+            update_catalog(conn, unique_id, len(df), fetched_at,
+                           storage='parquet', columns=columns, **meta)
+        elif 'fact' == self.storage and meta.get('kind') in ('statement', 'statistics'):
+            key = (meta['ticker'], meta['exchange'], meta['dataset'], meta.get('period'), meta['stage'])
+            columns = write_facts(conn, df, *key, fetched_at)
+            # Drop the table and the Parquet file written before switching layout
+            conn.execute(sqlalchemy.text(f"DROP TABLE IF EXISTS '{unique_id}'"))
+            self._remove_parquet(*key)
+            update_catalog(conn, unique_id, len(df), fetched_at,
+                           storage='fact', columns=columns, **meta)
+        else:
+            df.to_sql(unique_id, conn,
+                      if_exists='replace', index=False)
+            if meta.get('kind') in ('statement', 'statistics'):
+                # Remove the Parquet file and close the facts written before switching layout
+                key = (meta['ticker'], meta['exchange'], meta['dataset'], meta.get('period'), meta['stage'])
+                self._remove_parquet(*key)
+                close_facts(conn, *key, fetched_at)
+            update_catalog(conn, unique_id, len(df), fetched_at,
+                           storage='table', **meta)
+
+    def _remove_parquet(self, ticker, exchange, dataset, period, stage):
+        '''Remove Parquet file of a dataset written before switching layout, if Parquet store was ever used'''
+        if self._parquet is not None or os.path.isdir(self.parquet_dir):
+            self.parquet.remove(ticker, exchange, dataset, period, stage)
+
+    def _report_skipped(self, ticker, exchange, name, skipped, total):
+        '''Report how many datasets of a bulk call are served by fresh cache'''
+        self.last_skipped = skipped
+        self.logger.info(
+            f"{ticker}@{exchange} {name}: skipped {skipped} fresh of {total}, fetched {total - skipped}")
+
+    @property
+    def _host(self):
+        '''Host of the page opened by current thread'''
+        return getattr(self._local, 'host', urlparse(self.base_urls['morningstar']).netloc)
+
     def _human_delay(self, min=3, max=15):
-        '''Simulate human-like random delay'''
-        time.sleep(random.uniform(min, max))
+        '''Simulate human-like random delay, paced by the budget of current host'''
+        with self._timed('delay'):
+            self.pacer.wait(self._host, (min + max) / 2 / human_delay_step)
 
     def _random_mouse_move(self):
         '''Simulate random mouse movement'''
@@ -328,257 +1029,477 @@ class StockBase:
             # Random delay between each character
             time.sleep(random.uniform(0.05, 0.3))
 
-    def _get_key_metrics(self, ticker, exchange, statistics, stage='Restated', update=False):
+    def _open_page(self, url):
+        '''
+        Open a Morningstar page with human-like operations
 
-        @retry(
-            wait=wait_random(min=60, max=120),
-            stop=stop_after_attempt(3),
-            before_sleep=self.reset_driver
-        )
-        def _get_key_metrics_retry():
-            # Compose a unique ID for database table and file name
-            unique_id = f"{ticker}_{exchange}_{statistics}_{stage}".replace(
-                ' ', '_').lower()
+        Returns:
+            NetworkCapture of the page in 'network' fetch mode, else None
+        '''
+        capture = None
+        if 'network' == self.fetch_mode:
+            capture = NetworkCapture(self.driver)
+            capture.clear()
+
+        # Wait while the website is challenging any of our fetches
+        self._local.host = urlparse(url).netloc
+        with self._timed('breaker'):
+            waited = self.breaker.wait(self._host)
+        if waited:
+            self.logger.info(f"Resume fetches of {self._host} after {waited:.0f}s")
+
+        with self._timed('page_load'):
+            self.driver.get(url)
+            self._check_challenge()
+            self._check_page(url)
+
+        # Simulate human-like operations
+        self._random_mouse_move()
+        self._human_delay()
+        self._random_scroll()
+
+        return capture
+
+    def _check_challenge(self):
+        '''Raise BotChallenge if current page is a bot challenge, and open the breaker of its host'''
+        if self.check_for_bot_confirmation():
+            # Slow down once per challenge, parallel fetches see the same one
+            window = self.breaker.trip(self._host, on_open=self.pacer.penalize)
+            self.logger.warning(f"Bot challenge from {self._host}, pause fetches for {window:.0f}s")
+            raise BotChallenge(f"Bot challenge from {self._host}")
+
+    def _check_page(self, url):
+        '''Raise PageNotFound if the website has no such page, or redirects to other kind of page'''
+        current = urlparse(self.driver.current_url).path.rstrip('/').lower()
+        if current != urlparse(url).path.rstrip('/').lower():
+            raise PageNotFound(f"{url} is redirected to {self.driver.current_url}")
+        if 'page not found' in (self.driver.title or '').lower():
+            raise PageNotFound(f"{url} is not found")
+
+    def _retry_wait(self, retry_state):
+        '''Seconds to wait before next attempt of a fetch, by class of the error'''
+        kind = _classify_error(retry_state.outcome.exception())
+        if 'challenge' == kind:
+            # Circuit breaker holds the next attempt back
+            return 0
+        if 'transient' == kind:
+            return random.uniform(5, 15)
+        return random.uniform(60, 120)
+
+    def _before_retry(self, retry_state):
+        '''Prepare next attempt of a fetch, the driver is only reset if it is broken or challenged'''
+        e = retry_state.outcome.exception()
+        kind = _classify_error(e)
+
+        # A challenge may show up as a timeout in the middle of a fetch
+        if isinstance(e, TimeoutException):
+            try:
+                self._check_challenge()
+            except BotChallenge:
+                kind = 'challenge'
+            except Exception as check_error:
+                self.logger.debug(f"Check bot challenge fail: {check_error}")
+
+        # Slow down, the website may be throttling, challenges are penalized when the breaker opens
+        if 'challenge' != kind:
+            self.pacer.penalize(self._host)
+
+        if kind in ('driver', 'challenge'):
+            self.reset_driver(retry_state)
+        else:
+            self.logger.info(f"Retry attempt {retry_state.attempt_number} fail: {e!r}, try again")
 
-            # Not force to update, check database first
-            if not update:
-                df = self._check_database(unique_id)
-                if df is not None:
-                    return df
+    def _select_tab(self, name):
+        '''Select statement or statistics tab of current page'''
+        with self._timed('element_wait'):
+            tab_button = WebDriverWait(self.driver, 30).until(
+                EC.visibility_of_element_located(
+                    (By.XPATH, f"//button[contains(., '{name}')]"))
+            )
+        tab_button.click()
 
-            # Fetch data from website starts here
-            url = f"https://www.morningstar.com/stocks/{exchange}/{ticker}/key-metrics"
-            self.driver.get(url)
+        # More human-like operations
+        self._random_scroll()
+        self._human_delay()
 
-            # Simulate human-like operations
-            self._random_mouse_move()
-            self._human_delay()
-            self._random_scroll()
+    def _select_option(self, options, option):
+        '''
+        Select an option of a drop-down list, e.g. period or stage
 
-            statistics_button = WebDriverWait(self.driver, 30).until(
+        Args:
+            options: All options of the list, the list button shows the selected one
+            option: Option to select
+        '''
+        shown = ' or '.join(f"contains(., '{o}')" for o in options)
+        with self._timed('element_wait'):
+            list_button = WebDriverWait(self.driver, 30).until(
                 EC.visibility_of_element_located(
-                    (By.XPATH, f"//button[contains(., '{statistics}')]"))
+                    (By.XPATH, f"//button[({shown}) and @aria-haspopup='true']"))
             )
-            statistics_button.click()
+        try:
+            list_button.click()
+            self._human_delay()
+        except ElementClickInterceptedException:
+            pass
+        except ElementNotInteractableException:
+            pass
 
-            # More human-like operations
+        with self._timed('element_wait'):
+            option_button = WebDriverWait(self.driver, 30).until(
+                EC.visibility_of_element_located(
+                    (By.XPATH, f"//span[contains(., '{option}') and @class='mds-list-group-item__text__sal']"))
+            )
+        try:
+            option_button.click()
             self._human_delay()
-            self._random_scroll()
+        except ElementClickInterceptedException:
+            pass
+        except ElementNotInteractableException:
+            pass
 
+    def _export_key_metrics(self, unique_id, ticker, exchange, statistics, stage, capture):
+        '''Export statistics shown in current page, and update database'''
+
+        if 'network' == self.fetch_mode:
             # Only 'Financial Summary' has stage selection
+            params = {}
             if 'Financial Summary' == statistics:
-                # Select metrics stage
-                stage_list_button = WebDriverWait(self.driver, 30).until(
+                params['reportType'] = stage_apiparam[stage]
+            with self._timed('download'):
+                data = capture.wait_json(
+                    lambda url: _match_api_url(url, statistics_filename[statistics], params), self.download_timeout)
+
+            # Empty table means there is no such data available
+            with self._timed('parse'):
+                df = parse_table_json(data)
+            if df is None or df.empty:
+                df = None
+        else:
+            with self._timed('element_wait'):
+                export_button = WebDriverWait(self.driver, 30).until(
                     EC.visibility_of_element_located(
-                        (By.XPATH, "//button[contains(., 'As Originally Reported') and @aria-haspopup='true']"))
+                        (By.XPATH, '//*[@id="salKeyStatsPopoverExport"]'))
                 )
+
+                # Check if there is no such data available
                 try:
-                    stage_list_button.click()
-                    self._human_delay()
-                except ElementClickInterceptedException:
-                    pass
-                except ElementNotInteractableException:
-                    pass
-    
-                if 'As Originally Reported' == stage:
-                    stage_button = WebDriverWait(self.driver, 30).until(
+                    WebDriverWait(self.driver, 5).until(
                         EC.visibility_of_element_located(
-                            (By.XPATH, "//span[contains(., 'As Originally Reported') and @class='mds-list-group-item__text__sal']"))
+                            (By.XPATH,
+                             f"//div[contains(., 'There is no {statistics} data available.')]")
+                        )
                     )
-                else:
-                    stage_button = WebDriverWait(self.driver, 30).until(
-                        EC.visibility_of_element_located(
-                            (By.XPATH, "//span[contains(., 'Restated') and @class='mds-list-group-item__text__sal']"))
-                    )
-    
-                try:
-                    stage_button.click()
-                    self._human_delay()
-                except ElementClickInterceptedException:
-                    pass
-                except ElementNotInteractableException:
-                    pass
-            else:
-                pass
-
-            # Export data
-            export_button = WebDriverWait(self.driver, 30).until(
-                EC.visibility_of_element_located(
-                    (By.XPATH, '//*[@id="salKeyStatsPopoverExport"]'))
-            )
+                    no_data = True
+                except TimeoutException:
+                    no_data = False
+
+            df = None
+            if not no_data:
+                # Wait for download to complete, use wildcard to match the file name
+                tmp_string = statistics_filename[statistics]
+                with self._timed('download'):
+                    with DownloadWatcher(self.download_dir) as watcher:
+                        export_button.click()
+                        tmp_file = watcher.wait(f"{tmp_string}*.xls", self.download_timeout)
+
+                statistics_file = os.path.join(self.download_dir, f"{unique_id}.xls")
+                os.replace(tmp_file, statistics_file)
+                with self._timed('parse'), open(statistics_file, 'rb') as f:
+                    df = parse_spreadsheet(f.read(), self.spreadsheet_engine)
+
+        # Remember there is no such data available, so it is not fetched again soon
+        if df is None:
+            with self._timed('db_write'):
+                self._record_negative(
+                    unique_id, 'no_data', ticker=ticker, exchange=exchange, kind='statistics',
+                    dataset=statistics, period=None, stage=stage)
+            return None
 
-            # Check if there is no such data available
-            try:
-                WebDriverWait(self.driver, 5).until(
+        # Update database
+        with self._timed('parse'):
+            df = self._normalize(df)
+        with self._timed('db_write'):
+            self._update_database(
+                unique_id, df, ticker=ticker, exchange=exchange, kind='statistics',
+                dataset=statistics, period=None, stage=stage)
+
+        return df
+
+    def _export_financials(self, unique_id, ticker, exchange, statement, period, stage, capture):
+        '''Export statement shown in current page, and update database'''
+
+        if 'network' == self.fetch_mode:
+            params = {
+                'dataType': period_apiparam[period],
+                'reportType': stage_apiparam[stage],
+            }
+            with self._timed('download'):
+                data = capture.wait_json(
+                    lambda url: _match_api_url(url, statement_apiname[statement], params), self.download_timeout)
+            with self._timed('parse'):
+                df = parse_table_json(data)
+            if df is None:
+                raise ValueError("Capture data fail")
+        else:
+            with self._timed('element_wait'):
+                export_button = WebDriverWait(self.driver, 30).until(
                     EC.visibility_of_element_located(
-                        (By.XPATH,
-                         f"//div[contains(., 'There is no {statistics} data available.')]")
-                    )
+                        (By.XPATH, '//*[@id="salEqsvFinancialsPopoverExport"]'))
                 )
-                return None
-            except TimeoutException:
-                export_button.click()
 
             # Wait for download to complete
-            tmp_string = statistics_filename[statistics]
-
-            # Use wildcard to match the file name
-            pattern = os.path.join(self.download_dir, f"{tmp_string}*.xls")
-
-            retries = 10
-            downloaded_files = glob.glob(pattern)
-            while retries and (not downloaded_files or os.path.getsize(downloaded_files[0]) == 0):
-                time.sleep(1)
-                retries -= 1
-                downloaded_files = glob.glob(pattern)
-
-            if not downloaded_files:
-                raise ValueError("Export data fail")
-
-            tmp_file = downloaded_files[0]
-            statistics_file = self.download_dir + f"/{unique_id}.xls"
-            os.rename(tmp_file, statistics_file)
-            time.sleep(1)
-
-            # Update database
-            df = pd.read_excel(statistics_file)
-            self._update_database(unique_id, df)
+            with self._timed('download'):
+                with DownloadWatcher(self.download_dir) as watcher:
+                    export_button.click()
+                    tmp_file = watcher.wait(f"{statement}_{period}_{stage}.xls", self.download_timeout)
+
+            statement_file = os.path.join(self.download_dir, f"{unique_id}.xls")
+            os.replace(tmp_file, statement_file)
+            with self._timed('parse'), open(statement_file, 'rb') as f:
+                df = parse_spreadsheet(f.read(), self.spreadsheet_engine)
+
+        # Update database
+        with self._timed('parse'):
+            df = self._normalize(df)
+        with self._timed('db_write'):
+            self._update_database(
+                unique_id, df, ticker=ticker, exchange=exchange, kind='statement',
+                dataset=statement, period=period, stage=stage)
+
+        return df
+
+    def _get_key_metrics_batch(self, ticker, exchange, statistics_list, stage='Restated', update=False):
+        '''
+        Get several statistics of stock with one visit of key metrics page
 
-            return df
+        Returns:
+            Dict of statistics to DataFrame or None
+        '''
+        exchange = self._exchange(ticker, exchange)
+        results = {}
+        unique_ids = {}
+        for statistics in statistics_list:
+            # Compose a unique ID for database table and file name
+            unique_ids[statistics] = self.statistics_id(ticker, exchange, statistics, stage)
 
-        return _get_key_metrics_retry()
+            # Not force to update, check database first
+            if not update:
+                df = self._check_database(
+                    unique_ids[statistics], self._max_age('statistics', statistics))
+                if df is not None:
+                    results[statistics] = df
+                elif self._check_negative(unique_ids[statistics]):
+                    results[statistics] = None
 
-    def _get_financials(self, ticker, exchange, statement, period='Annual', stage='Restated', update=False):
+        pending = [s for s in statistics_list if s not in results]
+        if not pending:
+            return results
 
         @retry(
-            wait=wait_random(min=60, max=120),
+            wait=self._retry_wait,
             stop=stop_after_attempt(3),
-            before_sleep=self.reset_driver
+            retry=retry_if_exception(lambda e: 'permanent' != _classify_error(e)),
+            before_sleep=self._before_retry
         )
-        def _get_financials_retry():
-            # Compose a unique ID for database table and file name
-            unique_id = f"{ticker}_{exchange}_{statement}_{period}_{stage}".replace(
-                ' ', '_').lower()
+        def _get_key_metrics_retry():
+            # Fetch data from website starts here, page is loaded once for all statistics
+            url = f"{self.base_urls['morningstar']}/stocks/{exchange}/{ticker}/key-metrics"
+            capture = self._open_page(url)
 
-            # Not force to update, check database first
-            if not update:
-                df = self._check_database(unique_id)
-                if df is not None:
-                    return df
+            # Statistics exported by an earlier attempt are kept
+            for statistics in [s for s in pending if s not in results]:
+                self._select_tab(statistics)
 
-            # Fetch data from website starts here
-            url = f"https://www.morningstar.com/stocks/{exchange}/{ticker}/financials"
-            self.driver.get(url)
+                # Only 'Financial Summary' has stage selection
+                if 'Financial Summary' == statistics:
+                    self._select_option(['As Originally Reported', 'Restated'], stage)
 
-            # Simulate human-like operations
-            self._random_mouse_move()
-            self._human_delay()
-            self._random_scroll()
+                results[statistics] = self._export_key_metrics(
+                    unique_ids[statistics], ticker, exchange, statistics, stage, capture)
 
-            # Select statement type
-            type_button = WebDriverWait(self.driver, 30).until(
-                EC.visibility_of_element_located(
-                    (By.XPATH, f"//button[contains(., '{statement}')]"))
-            )
-            type_button.click()
+        # Only borrow a driver when data must be fetched from website
+        with self._borrow_driver():
+            try:
+                _get_key_metrics_retry()
+            except PageNotFound as e:
+                for statistics in [s for s in pending if s not in results]:
+                    self._record_negative(
+                        unique_ids[statistics], 'failed', str(e), ticker=ticker, exchange=exchange,
+                        kind='statistics', dataset=statistics, period=None, stage=stage)
+                raise
 
-            # More human-like operations
-            self._random_scroll()
-            self._human_delay()
-            self._random_mouse_move()
+        # Speed up after a clean fetch
+        if 1 == _get_key_metrics_retry.statistics.get('attempt_number'):
+            self.pacer.reward(self._host)
+            self.breaker.reset(self._host)
 
-            # Select statement period
-            period_list_button = WebDriverWait(self.driver, 30).until(
-                EC.visibility_of_element_located(
-                    (By.XPATH, "//button[contains(., 'Annual') and @aria-haspopup='true']"))
-            )
-            try:
-                period_list_button.click()
-                self._human_delay()
-            except ElementClickInterceptedException:
-                pass
+        return results
 
-            if 'Annual' == period:
-                period_button = WebDriverWait(self.driver, 30).until(
-                    EC.visibility_of_element_located(
-                        (By.XPATH, "//span[contains(., 'Annual') and @class='mds-list-group-item__text__sal']"))
-                )
-            else:
-                period_button = WebDriverWait(self.driver, 30).until(
-                    EC.visibility_of_element_located(
-                        (By.XPATH, "//span[contains(., 'Quarterly') and @class='mds-list-group-item__text__sal']"))
-                )
+    def _get_key_metrics(self, ticker, exchange, statistics, stage='Restated', update=False):
+        results = self._get_key_metrics_batch(ticker, exchange, [statistics], stage, update)
+        return results[statistics]
 
-            try:
-                period_button.click()
-                self._human_delay()
-            except ElementClickInterceptedException:
-                pass
+    def _get_financials_batch(self, ticker, exchange, statements, periods=('Annual',), stages=('Restated',), update=False):
+        '''
+        Get statements of stock in several periods and stages with one visit of financials page
 
-            # Select statement stage
-            stage_list_button = WebDriverWait(self.driver, 30).until(
-                EC.visibility_of_element_located(
-                    (By.XPATH, "//button[contains(., 'As Originally Reported') and @aria-haspopup='true']"))
-            )
-            try:
-                stage_list_button.click()
+        Returns:
+            Dict of (statement, period, stage) to DataFrame
+        '''
+        exchange = self._exchange(ticker, exchange)
+        results = {}
+        unique_ids = {}
+        for statement in statements:
+            for period in periods:
+                for stage in stages:
+                    key = (statement, period, stage)
+
+                    # Compose a unique ID for database table and file name
+                    unique_ids[key] = self.statement_id(ticker, exchange, statement, period, stage)
+
+                    # Not force to update, check database first
+                    if not update:
+                        df = self._check_database(
+                            unique_ids[key], self._max_age('statement', statement, period))
+                        if df is not None:
+                            results[key] = df
+                        elif self._check_negative(unique_ids[key]):
+                            results[key] = None
+
+        pending = [k for k in unique_ids if k not in results]
+        if not pending:
+            return results
+
+        @retry(
+            wait=self._retry_wait,
+            stop=stop_after_attempt(3),
+            retry=retry_if_exception(lambda e: 'permanent' != _classify_error(e)),
+            before_sleep=self._before_retry
+        )
+        def _get_financials_retry():
+            # Fetch data from website starts here, page is loaded once for all statements
+            url = f"{self.base_urls['morningstar']}/stocks/{exchange}/{ticker}/financials"
+            capture = self._open_page(url)
+
+            # Statements exported by an earlier attempt are kept
+            shown = (None, None, None)
+            for key in [k for k in pending if k not in results]:
+                statement, period, stage = key
+
+                # Select statement type
+                if statement != shown[0]:
+                    self._select_tab(statement)
+                    self._random_mouse_move()
+
+                # Select statement period and stage, which are selected again after switching tab
+                if (statement, period) != shown[:2]:
+                    self._select_option(['Annual', 'Quarterly'], period)
+                if key != shown:
+                    self._select_option(['As Originally Reported', 'Restated'], stage)
+                shown = key
+
+                # More human-like operations
+                self._random_mouse_move()
                 self._human_delay()
-            except ElementClickInterceptedException:
-                pass
-            except ElementNotInteractableException:
-                pass
+                self._random_scroll()
 
-            if 'As Originally Reported' == stage:
-                stage_button = WebDriverWait(self.driver, 30).until(
-                    EC.visibility_of_element_located(
-                        (By.XPATH, "//span[contains(., 'As Originally Reported') and @class='mds-list-group-item__text__sal']"))
-                )
-            else:
-                stage_button = WebDriverWait(self.driver, 30).until(
-                    EC.visibility_of_element_located(
-                        (By.XPATH, "//span[contains(., 'Restated') and @class='mds-list-group-item__text__sal']"))
-                )
+                results[key] = self._export_financials(
+                    unique_ids[key], ticker, exchange, statement, period, stage, capture)
 
+        # Only borrow a driver when data must be fetched from website
+        with self._borrow_driver():
             try:
-                stage_button.click()
-                self._human_delay()
-            except ElementClickInterceptedException:
-                pass
-            except ElementNotInteractableException:
-                pass
+                _get_financials_retry()
+            except PageNotFound as e:
+                for statement, period, stage in [k for k in pending if k not in results]:
+                    self._record_negative(
+                        unique_ids[(statement, period, stage)], 'failed', str(e), ticker=ticker,
+                        exchange=exchange, kind='statement', dataset=statement, period=period, stage=stage)
+                raise
 
-            # More human-like operations
-            self._random_mouse_move()
-            self._human_delay()
-            self._random_scroll()
+        # Speed up after a clean fetch
+        if 1 == _get_financials_retry.statistics.get('attempt_number'):
+            self.pacer.reward(self._host)
+            self.breaker.reset(self._host)
 
-            export_button = WebDriverWait(self.driver, 30).until(
-                EC.visibility_of_element_located(
-                    (By.XPATH, '//*[@id="salEqsvFinancialsPopoverExport"]'))
-            )
-            export_button.click()
+        return results
 
-            retries = 5
-            # Wait for download to complete
-            tmp_file = self.download_dir + f"/{statement}_{period}_{stage}.xls"
-            while retries and (not os.path.exists(tmp_file)):
-                time.sleep(1)
-                retries = retries - 1
+    def _get_financials(self, ticker, exchange, statement, period='Annual', stage='Restated', update=False):
+        results = self._get_financials_batch(ticker, exchange, [statement], [period], [stage], update)
+        return results[(statement, period, stage)]
 
-            if 0 == retries and (not os.path.exists(tmp_file)):
-                raise ValueError("Export data fail")
+    def _resolve_dataset(self, dataset):
+        '''
+        Resolve a dataset given by its bulk API name, or by its display name if that is not ambiguous
 
-            statement_file = self.download_dir + f"/{unique_id}.xls"
-            os.rename(tmp_file, statement_file)
-            time.sleep(1)
+        Returns:
+            (name, kind, display name), e.g. ('income_statement', 'statement', 'Income Statement')
+        '''
+        if dataset in dataset_names:
+            return (dataset,) + dataset_names[dataset]
+
+        # 'Cash Flow' is both a statement and statistics, only its bulk API names tell them apart
+        names = [n for n, (_, display) in dataset_names.items() if display == dataset]
+        if 1 != len(names):
+            hint = f", use one of {names}" if names else ''
+            raise ValueError(f"Invalid dataset: {dataset}{hint}")
+        return (names[0],) + dataset_names[names[0]]
+
+    def _dataset_stage(self, name, stage):
+        '''Stage used by getter of dataset, only 'Financial Summary' has stage selection'''
+        kind, dataset = dataset_names[name]
+        if 'statistics' == kind and 'Financial Summary' != dataset:
+            return 'Restated'
+        return stage
+
+    def _dataset_id(self, ticker, exchange, name, period='Annual', stage='Restated'):
+        '''Unique ID of a dataset by its bulk API name'''
+        kind, dataset = dataset_names[name]
+        stage = self._dataset_stage(name, stage)
+        if 'statement' == kind:
+            return self.statement_id(ticker, exchange, dataset, period, stage)
+        return self.statistics_id(ticker, exchange, dataset, stage)
+
+    def _check_dataset(self, ticker, exchange, name, period='Annual', stage='Restated'):
+        '''Check database for a dataset by its bulk API name, return DataFrame or None'''
+        exchange = self._exchange(ticker, exchange)
+        kind, dataset = dataset_names[name]
+        unique_id = self._dataset_id(ticker, exchange, name, period, stage)
+        if 'statement' == kind:
+            return self._check_database(unique_id, self._max_age(kind, dataset, period))
+        else:
+            return self._check_database(unique_id, self._max_age(kind, dataset))
 
-            # Update database
-            df = pd.read_excel(statement_file)
-            self._update_database(unique_id, df)
+    def _fetch_datasets(self, ticker, exchange, names, period='Annual', stage='Restated', update=False):
+        '''
+        Fetch datasets of a ticker by their bulk API names, all of the same kind and stage
 
-            return df
+        Returns:
+            List of (ticker, exchange, name, DataFrame or None)
+        '''
+        exchange = self._exchange(ticker, exchange)
+        kind = dataset_names[names[0]][0]
+        datasets = [dataset_names[name][1] for name in names]
+        if 'statement' == kind:
+            results = self._get_financials_batch(ticker, exchange, datasets, [period], [stage], update)
+            return [(ticker, exchange, name, results[(dataset, period, stage)]) for name, dataset in zip(names, datasets)]
+        else:
+            results = self._get_key_metrics_batch(ticker, exchange, datasets, stage, update)
+            return [(ticker, exchange, name, results[dataset]) for name, dataset in zip(names, datasets)]
 
-        return _get_financials_retry()
+    def _download_us_exchange_tickers(self, exchange):
+        '''Download ticker table of an exchange from NASDAQ screener'''
+        # Use fake_useragent to generate a random user-agent
+        headers = {
+            'accept': 'application/json, text/plain, */*',
+            'user-agent': self.ua.random,  # Use random user-agent
+        }
+        url = f"{self.base_urls['nasdaq']}/api/screener/stocks?tableonly=true&exchange={exchange}&download=true"
+        response = self.http.get(url, headers=headers)
+        response.raise_for_status()
+
+        tmp_data = response.json()
+        return pd.DataFrame(tmp_data['data']['rows'])
 
     def _get_us_exchange_tickers(self, exchange, update=False):
 
@@ -586,60 +1507,205 @@ class StockBase:
 
         # Not force to update, check database first
         if not update:
-            df = self._check_database(unique_id)
+            df = self._check_database(
+                unique_id, self._max_age('tickers', exchange))
             if df is not None:
                 symbols = df['symbol'].tolist()
                 return symbols
 
-        # Use fake_useragent to generate a random user-agent
-        headers = {
-            'accept': 'application/json, text/plain, */*',
-            'user-agent': self.ua.random,  # Use random user-agent
-        }
-        url = f'https://api.nasdaq.com/api/screener/stocks?tableonly=true&exchange={exchange}&download=true'
-        response = requests.get(url, headers=headers)
-
-        tmp_data = json.loads(response.text)
-        df = pd.DataFrame(tmp_data['data']['rows'])
+        df = self._download_us_exchange_tickers(exchange)
 
         # Update datebase
-        self._update_database(unique_id, df)
+        self._update_database(
+            unique_id, df, exchange=exchange, kind='tickers')
+
+        # Index of ticker to exchange is rebuilt from refreshed tables on next use
+        with self._exchange_index_lock:
+            self._exchange_index = None
 
         symbols = df['symbol'].tolist()
         return symbols
 
-    def initialize_chrome_driver(self):
-        # Initialize the driver based on the driver_type
-        if self.driver_type == 'uc':
-            self.driver = uc.Chrome(
-                options=self.options,
-                browser_executable_path=self.chrome_path,
-                version_main=126,
-                use_subprocess=True,
-                user_multi_procs=True,
-                service=webdriver.ChromeService(
-                    ChromeDriverManager(driver_version='126').install()),
-                debug=self.debug,
-            )
-        elif self.driver_type == 'stealth':
-            # Initialize the WebDriver (e.g., Chrome)
-            self.driver = webdriver.Chrome(
-                service=webdriver.ChromeService(
-                    ChromeDriverManager(driver_version='126').install()),
-                options=self.options,
-            )
+    def get_us_tickers(self, update=False):
+        '''
+        Get tickers of NASDAQ, NYSE and AMEX. Missing or stale ticker tables are
+        downloaded concurrently, and written to database in one transaction
 
-            # Apply selenium-stealth to the WebDriver
-            stealth(self.driver,
-                    languages=["en-US", "en"],
-                    vendor="Google Inc.",
-                    platform="Win32",
-                    webgl_vendor="Intel Inc.",
-                    renderer="Intel Iris OpenGL Engine",
-                    fix_hairline=True,
-                    )
-        else:
-            raise ValueError("Invalid driver type specified")
+        Args:
+            update: Force update data from website
+        Returns:
+            Dict of exchange, e.g. 'xnas', to list of ticker names
+        '''
+        tickers = {}
+        missing = []
+        for exchange, screener in us_exchange_screeners.items():
+            if not update:
+                df = self._check_database(
+                    f"us_exchange_{screener}_tickers", self._max_age('tickers', screener))
+                if df is not None:
+                    tickers[exchange] = df['symbol'].tolist()
+                    continue
+            missing.append(exchange)
+
+        if missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as executor:
+                frames = list(executor.map(
+                    self._download_us_exchange_tickers, [us_exchange_screeners[e] for e in missing]))
+
+            session = self.Session()
+            try:
+                conn = session.connection()
+                for exchange, df in zip(missing, frames):
+                    screener = us_exchange_screeners[exchange]
+                    self._write_database(
+                        conn, f"us_exchange_{screener}_tickers", df, exchange=screener, kind='tickers')
+                    tickers[exchange] = df['symbol'].tolist()
+                session.commit()
+            finally:
+                session.close()
+
+            with self._exchange_index_lock:
+                self._exchange_index = None
+
+        return {exchange: tickers[exchange] for exchange in us_exchange_screeners}
+
+    def _get_index_tickers(self, name, url, parse, update=False):
+        '''
+        Get constituents table of an index from a web page, cached in database.
+        Stale table is revalidated with a conditional request, so an unchanged
+        page is not downloaded nor parsed again
+
+        Args:
+            name: Index name, e.g. 'sp500'
+            url: Web page of constituents
+            parse: Function to parse constituents table from HTML text
+            update: Force revalidate cached table
+
+        Returns:
+            DataFrame of constituents
+        '''
+        unique_id = f"index_{name}_tickers"
+
+        if not update:
+            df = self._check_database(
+                unique_id, self._max_age('index', name, default=index_max_age))
+            if df is not None:
+                return df
+
+        session = self.Session()
+        try:
+            record = lookup_catalog(session.connection(), [unique_id]).get(unique_id)
+        finally:
+            session.close()
+
+        headers = {}
+        if record is not None:
+            if record['etag']:
+                headers['If-None-Match'] = record['etag']
+            if record['last_modified']:
+                headers['If-Modified-Since'] = record['last_modified']
+
+        response = self.http.get(url, headers=headers)
+        if 304 == response.status_code:
+            df = self._check_database(unique_id)
+            if df is not None:
+                self.logger.debug(f"Constituents of {name} are not modified")
+                session = self.Session()
+                try:
+                    touch_catalog(session.connection(), unique_id, datetime.now())
+                    session.commit()
+                finally:
+                    session.close()
+                if self.memory_cache is not None:
+                    self.memory_cache.invalidate(unique_id)
+                return df
+            # Cached table is gone, download the page again
+            response = self.http.get(url)
+        response.raise_for_status()
+
+        df = parse(response.text)
+        self._update_database(
+            unique_id, df, kind='index', dataset=name,
+            etag=response.headers.get('ETag'),
+            last_modified=response.headers.get('Last-Modified'))
+        return df
+
+    def exchange_index(self, update=False):
+        '''
+        Index of ticker to exchange, built from ticker tables of NASDAQ screener and tickers
+        of other exchanges recorded in catalog. The index is cached in memory
+
+        Args:
+            update: Force update ticker tables from website
+
+        Returns:
+            Dict of upper case ticker to exchange
+        '''
+        with self._exchange_index_lock:
+            index = self._exchange_index
+        if index is not None and not update:
+            return index
+
+        index = {}
+        session = self.Session()
+        try:
+            for ticker, exchange in catalog_tickers(session.connection()):
+                index[ticker.upper()] = exchange
+        finally:
+            session.close()
+
+        # Screener tables take precedence, earlier exchange wins for tickers listed twice
+        us_tickers = self.get_us_tickers(update)
+        for exchange in reversed(list(us_exchange_screeners)):
+            for symbol in us_tickers[exchange]:
+                index[str(symbol).upper()] = exchange
+
+        with self._exchange_index_lock:
+            self._exchange_index = index
+        self.logger.debug(f"Exchange index built with {len(index)} tickers")
+        return index
+
+    def resolve_exchange(self, ticker):
+        '''
+        Resolve exchange of ticker
+
+        Args:
+            ticker: Stock symbol
+
+        Returns:
+            Exchange name, e.g. 'xnas'
+        '''
+        exchange = self.exchange_index().get(ticker.upper())
+        if exchange is None:
+            raise ValueError(f"Exchange of ticker {ticker} is not found")
+        return exchange
+
+    def _exchange(self, ticker, exchange):
+        '''Exchange of ticker, resolved from exchange index if it is None'''
+        if exchange is None:
+            return self.resolve_exchange(ticker)
+        return exchange
+
+    def _in_event_loop(self):
+        '''Check if current thread is running an asyncio event loop'''
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        return True
+
+    def _ticker_pairs(self, tickers):
+        '''List of (ticker, exchange) from list of tickers or (ticker, exchange), or dict of ticker to exchange'''
+        if isinstance(tickers, dict):
+            tickers = tickers.items()
+        pairs = []
+        for item in tickers:
+            if isinstance(item, str):
+                pairs.append((item, self.resolve_exchange(item)))
+            else:
+                ticker, exchange = item
+                pairs.append((ticker, self._exchange(ticker, exchange)))
+        return pairs
 
     def check_for_bot_confirmation(self):
         '''Check if the page contains the string "Let's confirm you aren't a bot"'''
@@ -659,13 +1725,13 @@ class Stock(StockBase):
     Get stock financials statements and key metrics statistics
     '''
 
-    def get_financial_summary(self, ticker, exchange, stage='Restated', update=False):
+    def get_financial_summary(self, ticker, exchange=None, stage='Restated', update=False):
         '''
         Get financial summary statistics of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
             update: Force update data from website
         Returns:
             DataFrame of statistics
@@ -673,13 +1739,13 @@ class Stock(StockBase):
         statistics = 'Financial Summary'
         return self._get_key_metrics(ticker, exchange, statistics, stage, update)
 
-    def get_growth(self, ticker, exchange, update=False):
+    def get_growth(self, ticker, exchange=None, update=False):
         '''
         Get growth statistics of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
             update: Force update data from website
         Returns:
             DataFrame of statistics
@@ -687,70 +1753,75 @@ class Stock(StockBase):
         statistics = 'Growth'
         return self._get_key_metrics(ticker, exchange, statistics, stage='Restated', update=update)
 
-    def get_profitability_and_efficiency(self, ticker, exchange, update=False):
+    def get_profitability_and_efficiency(self, ticker, exchange=None, update=False):
         '''
         Get profitability and efficiency statistics of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
         Returns:
             DataFrame of statistics
         '''
         statistics = 'Profitability and Efficiency'
         return self._get_key_metrics(ticker, exchange, statistics, stage='Restated', update=update)
 
-    def get_financial_health(self, ticker, exchange, update=False):
+    def get_financial_health(self, ticker, exchange=None, update=False):
         '''
         Get financial health statistics of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
         Returns:
             DataFrame of statistics
         '''
         statistics = 'Financial Health'
         return self._get_key_metrics(ticker, exchange, statistics, stage='Restated', update=update)
 
-    def get_cash_flow(self, ticker, exchange, update=False):
+    def get_cash_flow(self, ticker, exchange=None, update=False):
         '''
         Get cash flow statistics of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
         Returns:
             DataFrame of statistics
         '''
         statistics = 'Cash Flow'
         return self._get_key_metrics(ticker, exchange, statistics, stage='Restated', update=update)
 
-    def get_key_metrics(self, ticker, exchange, stage='Restated', update=False):
+    def get_key_metrics(self, ticker, exchange=None, stage='Restated', update=False):
         '''
         Get all key metrics of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
+            update: Force update data from website, else only missing or stale data is fetched
         Returns:
             DataFrame list of statistics
         '''
 
-        self.key_metrics = []
-        for statistics in ['Financial Summary', 'Growth', 'Profitability and Efficiency', 'Financial Health', 'Cash Flow']:
-            df = self._get_key_metrics(ticker, exchange, statistics, stage, update)
-            self.key_metrics.append(df)
+        exchange = self._exchange(ticker, exchange)
+        hits = self.cache_stats['hit']
 
+        # All statistics are fetched with one visit of key metrics page
+        statistics_list = ['Financial Summary', 'Growth', 'Profitability and Efficiency', 'Financial Health', 'Cash Flow']
+        results = self._get_key_metrics_batch(ticker, exchange, statistics_list, stage, update)
+        self.key_metrics = [results[statistics] for statistics in statistics_list]
+
+        self._report_skipped(ticker, exchange, 'key metrics', self.cache_stats['hit'] - hits, len(self.key_metrics))
         return self.key_metrics
 
-    def get_income_statement(self, ticker, exchange, period='Annual', stage='Restated', update=False):
+    def get_income_statement(self, ticker, exchange=None, period='Annual', stage='Restated', update=False):
         '''
         Get income statement of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
             period: Period of statement, which can be 'Annual'(default), 'Quarterly'
             stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
         Returns:
@@ -759,13 +1830,13 @@ class Stock(StockBase):
         statement = 'Income Statement'
         return self._get_financials(ticker, exchange, statement, period, stage, update)
 
-    def get_balance_sheet_statement(self, ticker, exchange, period='Annual', stage='Restated', update=False):
+    def get_balance_sheet_statement(self, ticker, exchange=None, period='Annual', stage='Restated', update=False):
         '''
         Get balance sheet statement of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
             period: Period of statement, which can be 'Annual'(default), 'Quarterly'
             stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
         Returns:
@@ -774,13 +1845,13 @@ class Stock(StockBase):
         statement = 'Balance Sheet'
         return self._get_financials(ticker, exchange, statement, period, stage, update)
 
-    def get_cash_flow_statement(self, ticker, exchange, period='Annual', stage='Restated', update=False):
+    def get_cash_flow_statement(self, ticker, exchange=None, period='Annual', stage='Restated', update=False):
         '''
         Get cash flow statement of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
             period: Period of statement, which can be 'Annual'(default), 'Quarterly'
             stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
         Returns:
@@ -789,53 +1860,161 @@ class Stock(StockBase):
         statement = 'Cash Flow'
         return self._get_financials(ticker, exchange, statement, period, stage, update)
 
-    def get_financials(self, ticker, exchange, period='Annual', stage='Restated', update=False):
+    def get_financials(self, ticker, exchange=None, period='Annual', stage='Restated', update=False):
         '''
         Get all financials statements of stock
 
         Args:
             ticker: Stock symbol
-            exchange: Exchange name
+            exchange: Exchange name, resolved from ticker if None
             period: Period of statement, which can be 'Annual'(default), 'Quarterly'
             stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
+            update: Force update data from website, else only missing or stale data is fetched
         Returns:
             DataFrame list of financials statements
         '''
 
-        self.financials = []
-        for statement in ['Income Statement', 'Balance Sheet', 'Cash Flow']:
-            df = self._get_financials(
-                ticker, exchange, statement, period, stage, update)
-            self.financials.append(df)
+        exchange = self._exchange(ticker, exchange)
+        hits = self.cache_stats['hit']
+
+        # All statements are fetched with one visit of financials page
+        statements = ['Income Statement', 'Balance Sheet', 'Cash Flow']
+        results = self._get_financials_batch(
+            ticker, exchange, statements, [period], [stage], update)
+        self.financials = [results[(statement, period, stage)] for statement in statements]
 
+        self._report_skipped(ticker, exchange, 'financials', self.cache_stats['hit'] - hits, len(self.financials))
         return self.financials
 
-    def get_hsi_tickers(self):
+    def get_all_financials(self, ticker, exchange=None, periods=('Annual', 'Quarterly'),
+                           stages=('As Originally Reported', 'Restated'), update=False):
+        '''
+        Get all financials statements of stock in all periods and stages, with one visit of financials page
+
+        Args:
+            ticker: Stock symbol
+            exchange: Exchange name, resolved from ticker if None
+            periods: Periods of statement, default is ('Annual', 'Quarterly')
+            stages: Stages of statement, default is ('As Originally Reported', 'Restated')
+            update: Force update data from website, else only missing or stale data is fetched
+        Returns:
+            Dict of (statement, period, stage) to DataFrame
+        '''
+        exchange = self._exchange(ticker, exchange)
+        hits = self.cache_stats['hit']
+
+        statements = ['Income Statement', 'Balance Sheet', 'Cash Flow']
+        results = self._get_financials_batch(
+            ticker, exchange, statements, list(periods), list(stages), update)
+
+        self._report_skipped(ticker, exchange, 'all financials', self.cache_stats['hit'] - hits, len(results))
+        return results
+
+    async def fetch_many(self, tickers, datasets, concurrency=None, period='Annual', stage='Restated', update=False):
+        '''
+        Fetch datasets of many tickers concurrently. Cached data is served immediately,
+        others are fetched by up to concurrency drivers of the driver pool, one page visit
+        per ticker and page
+
+        Args:
+            tickers: List of (ticker, exchange) or tickers, exchange is resolved from ticker if not given
+            datasets: List of dataset names, e.g. 'income_statement', 'balance_sheet', 'cash_flow_statement',
+                'financial_summary', 'growth', 'profitability_and_efficiency', 'financial_health', 'cash_flow'
+            concurrency: Number of concurrent fetches, default is the driver pool size
+            period: Period of statement, which can be 'Annual'(default), 'Quarterly'
+            stage: Stage of statement, which can be 'As Originally Reported', 'Restated'(default)
+            update: Force update data from website, else only missing or stale data is fetched
+        Returns:
+            List of (ticker, exchange, dataset, DataFrame or None) in completion order,
+            DataFrame is None if there is no such data or the fetch fails
+        '''
+        for name in datasets:
+            if name not in dataset_names:
+                raise ValueError(f"Invalid dataset: {name}")
+
+        if concurrency is None:
+            concurrency = self.driver_pool.size
+        if self._own_driver_pool and self.driver_pool.size < concurrency:
+            # Drivers are created on demand, so the owned pool can simply grow
+            self.driver_pool.size = concurrency
+
+        results = []
+
+        # Serve cache hits without taking a driver, group misses by ticker and page
+        jobs = {}
+        for ticker, exchange in self._ticker_pairs(tickers):
+            for name in datasets:
+                if not update:
+                    df = self._check_dataset(ticker, exchange, name, period, stage)
+                    if df is not None:
+                        results.append((ticker, exchange, name, df))
+                        continue
+                    # Items without data or failed permanently are not fetched again within negative TTL
+                    if self._check_negative(self._dataset_id(ticker, exchange, name, period, stage)):
+                        results.append((ticker, exchange, name, None))
+                        continue
+                key = (ticker, exchange, dataset_names[name][0], self._dataset_stage(name, stage))
+                jobs.setdefault(key, []).append(name)
+
+        self.logger.info(f"fetch_many: {len(results)} cached, {len(jobs)} page visits to fetch")
+
+        async def _fetch(ticker, exchange, names, job_stage):
+            try:
+                # Selenium is blocking, so fetches run in worker threads, each with its own driver
+                return await loop.run_in_executor(
+                    executor, self._fetch_datasets, ticker, exchange, names, period, job_stage, update)
+            except Exception as e:
+                self.logger.error(f"Fetch {ticker}@{exchange} {names} fail: {e}")
+                return [(ticker, exchange, name, None) for name in names]
+
+        loop = asyncio.get_running_loop()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            tasks = [_fetch(ticker, exchange, names, job_stage)
+                     for (ticker, exchange, _, job_stage), names in jobs.items()]
+            for task in asyncio.as_completed(tasks):
+                results.extend(await task)
+
+        return results
+
+    def get_hsi_tickers(self, update=False):
         '''
         Get ticker of Hang Seng Index
 
+        Args:
+            update: Force revalidate cached constituents
         Returns:
             List of ticker with 5-digit number string
         '''
-        url = "https://en.wikipedia.org/wiki/Hang_Seng_Index"
-        response = requests.get(url, proxies=self.proxies)
-        tables = pd.read_html(response.text)
-        symbols = tables[6]['Ticker'].tolist()
+        def parse(html):
+            # Only tables with SEHK tickers are parsed
+            for table in pd.read_html(StringIO(html), match='SEHK'):
+                if 'Ticker' in table.columns:
+                    return table
+            raise ValueError("Constituents table of Hang Seng Index is not found")
+
+        url = f"{self.base_urls['wikipedia']}/wiki/Hang_Seng_Index"
+        df = self._get_index_tickers('hsi', url, parse, update)
+        symbols = df['Ticker'].tolist()
         pfx_len = len('SEHK:\xa0')
         symbols = [s[pfx_len:].zfill(5) for s in symbols]
         return symbols
 
-    def get_sp500_tickers(self):
+    def get_sp500_tickers(self, update=False):
         '''
         Get tickers of SP500
 
+        Args:
+            update: Force revalidate cached constituents
         Returns:
             List of ticker names
         '''
-        url = "https://en.wikipedia.org/wiki/List_of_S%26P_500_companies"
-        response = requests.get(url, proxies=self.proxies)
-        tables = pd.read_html(response.text)
-        symbols = tables[0]['Symbol'].tolist()
+        def parse(html):
+            # Only the constituents table is parsed
+            return pd.read_html(StringIO(html), attrs={'id': 'constituents'})[0]
+
+        url = f"{self.base_urls['wikipedia']}/wiki/List_of_S%26P_500_companies"
+        df = self._get_index_tickers('sp500', url, parse, update)
+        symbols = df['Symbol'].tolist()
         return symbols
 
     def get_xnas_tickers(self):
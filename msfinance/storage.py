@@ -0,0 +1,874 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+
+from datetime import datetime
+from collections import OrderedDict
+
+import pandas as pd
+
+import sqlalchemy
+from sqlalchemy import text, bindparam
+
+try:
+    # Optional, for 'parquet' storage layout, pip install msfinance[parquet]
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs
+except ImportError:
+    pa = None
+
+
+# Catalog of all data cached in database, one row per unique_id
+CATALOG_TABLE = 'msfinance_catalog'
+
+# Column name and type of catalog table
+CATALOG_SCHEMA = [
+    ('unique_id', 'TEXT PRIMARY KEY'),
+    ('ticker', 'TEXT'),
+    ('exchange', 'TEXT'),
+    ('kind', 'TEXT'),
+    ('dataset', 'TEXT'),
+    ('period', 'TEXT'),
+    ('stage', 'TEXT'),
+    ('rows', 'INTEGER'),
+    ('fetched_at', 'TEXT'),
+    # Storage layout of the data, 'table' or 'fact'
+    ('storage', 'TEXT'),
+    # JSON list of DataFrame columns, for layouts which do not keep them
+    ('columns', 'TEXT'),
+    # HTTP validators of the web page the data is parsed from, for conditional requests
+    ('etag', 'TEXT'),
+    ('last_modified', 'TEXT'),
+    # Outcome of a fetch without data, 'no_data' or 'failed', NULL if data is cached
+    ('status', 'TEXT'),
+    ('error', 'TEXT'),
+]
+
+CATALOG_COLUMNS = [name for name, _ in CATALOG_SCHEMA]
+
+# Long-format fact table, one row per version of a statement cell
+FACT_TABLE = 'msfinance_facts'
+
+# Key of a dataset in fact table
+FACT_KEY_CONDITION = (
+    'ticker = :ticker AND exchange = :exchange AND dataset = :dataset AND period = :period AND stage = :stage')
+
+# valid_from of facts stored before history was kept, which sorts before any time
+UNKNOWN_TIME = ''
+
+# SQLite limits the number of host parameters in one statement
+LOOKUP_CHUNK_SIZE = 500
+
+
+def ensure_catalog(conn):
+    '''
+    Create catalog table if it does not exist. Tables cached before the catalog
+    existed are registered with their row count and 'Last Updated' time
+
+    Args:
+        conn: SQLAlchemy connection
+    '''
+    inspector = sqlalchemy.inspect(conn)
+    tables = inspector.get_table_names()
+    if CATALOG_TABLE in tables:
+        # Add columns introduced after the catalog was created
+        existing = [c['name'] for c in inspector.get_columns(CATALOG_TABLE)]
+        for name, type_ in CATALOG_SCHEMA:
+            if name not in existing:
+                conn.execute(text(
+                    f"ALTER TABLE {CATALOG_TABLE} ADD COLUMN \"{name}\" {type_}"))
+        return
+
+    columns = ', '.join(f'"{name}" {type_}' for name, type_ in CATALOG_SCHEMA)
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {CATALOG_TABLE} ({columns})"))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {CATALOG_TABLE}_ticker ON {CATALOG_TABLE} (ticker, exchange)"))
+
+    # Register legacy tables
+    for table in tables:
+        if table.startswith('msfinance_'):
+            continue
+
+        columns = [c['name'] for c in inspector.get_columns(table)]
+        if 'Last Updated' in columns:
+            query = f"SELECT COUNT(*), MAX(\"Last Updated\") FROM '{table}'"
+        else:
+            query = f"SELECT COUNT(*), NULL FROM '{table}'"
+        rows, fetched_at = conn.execute(text(query)).one()
+
+        conn.execute(text(f'''
+            INSERT OR IGNORE INTO {CATALOG_TABLE} (unique_id, rows, fetched_at, storage)
+            VALUES (:unique_id, :rows, :fetched_at, 'table')
+        '''), {'unique_id': table, 'rows': rows, 'fetched_at': fetched_at})
+
+
+def lookup_catalog(conn, unique_ids):
+    '''
+    Batch lookup of catalog records
+
+    Args:
+        conn: SQLAlchemy connection
+        unique_ids: Iterable of unique_id
+
+    Returns:
+        Dict of unique_id to catalog record, unique_id not cached is absent
+    '''
+    unique_ids = list(unique_ids)
+    query = text(
+        f"SELECT * FROM {CATALOG_TABLE} WHERE unique_id IN :unique_ids"
+    ).bindparams(bindparam('unique_ids', expanding=True))
+
+    records = {}
+    for i in range(0, len(unique_ids), LOOKUP_CHUNK_SIZE):
+        chunk = unique_ids[i:i + LOOKUP_CHUNK_SIZE]
+        for row in conn.execute(query, {'unique_ids': chunk}).mappings():
+            record = dict(row)
+            if record['fetched_at'] is not None:
+                record['fetched_at'] = datetime.fromisoformat(
+                    str(record['fetched_at']))
+            if record['columns'] is not None:
+                record['columns'] = json.loads(record['columns'])
+            records[record['unique_id']] = record
+
+    return records
+
+
+def catalog_tickers(conn):
+    '''
+    Tickers and exchanges with statements or statistics cached in catalog,
+    records of fetches without data or failed fetches are not counted
+
+    Args:
+        conn: SQLAlchemy connection
+
+    Returns:
+        List of (ticker, exchange)
+    '''
+    rows = conn.execute(text(f'''
+        SELECT DISTINCT ticker, exchange FROM {CATALOG_TABLE}
+        WHERE kind IN ('statement', 'statistics') AND ticker IS NOT NULL AND exchange IS NOT NULL
+            AND (status IS NULL OR status = 'ok')
+    '''))
+    return [tuple(row) for row in rows]
+
+
+def update_catalog(conn, unique_id, rows, fetched_at, **meta):
+    '''
+    Insert or replace catalog record of unique_id
+
+    Args:
+        conn: SQLAlchemy connection
+        unique_id: Name of the table
+        rows: Number of rows in the table
+        fetched_at: Time of data fetched from website
+        meta: Other catalog columns, e.g. ticker, exchange, kind, dataset, period, stage, storage, columns
+    '''
+    record = dict.fromkeys(CATALOG_COLUMNS)
+    record.update({k: v for k, v in meta.items() if k in record})
+    record.update({
+        'unique_id': unique_id,
+        'rows': rows,
+        'fetched_at': fetched_at.isoformat(sep=' '),
+    })
+    if record['columns'] is not None:
+        record['columns'] = json.dumps(record['columns'])
+
+    columns = ', '.join(f'"{c}"' for c in CATALOG_COLUMNS)
+    values = ', '.join(f":{c}" for c in CATALOG_COLUMNS)
+    conn.execute(text(
+        f"INSERT OR REPLACE INTO {CATALOG_TABLE} ({columns}) VALUES ({values})"), record)
+
+
+def touch_catalog(conn, unique_id, fetched_at):
+    '''
+    Renew fetch time of unique_id, when data on website is known to be unchanged
+
+    Args:
+        conn: SQLAlchemy connection
+        unique_id: Name of the table
+        fetched_at: Time of data checked on website
+    '''
+    conn.execute(text(
+        f"UPDATE {CATALOG_TABLE} SET fetched_at = :fetched_at WHERE unique_id = :unique_id"),
+        {'unique_id': unique_id, 'fetched_at': fetched_at.isoformat(sep=' ')})
+
+
+def ensure_facts(conn):
+    '''
+    Create fact table if it does not exist. Facts stored before history was kept
+    are migrated as valid since unknown time
+
+    Args:
+        conn: SQLAlchemy connection
+    '''
+    inspector = sqlalchemy.inspect(conn)
+    legacy = False
+    if FACT_TABLE in inspector.get_table_names():
+        if 'valid_from' in [c['name'] for c in inspector.get_columns(FACT_TABLE)]:
+            return
+        # Primary key changes, so the table is rebuilt
+        conn.execute(text(f"ALTER TABLE {FACT_TABLE} RENAME TO {FACT_TABLE}_legacy"))
+        conn.execute(text(f"DROP INDEX IF EXISTS {FACT_TABLE}_item"))
+        legacy = True
+
+    # Column value has no type affinity, so numbers and strings are kept as they are.
+    # Each version of a cell is valid from valid_from until valid_to, NULL for the current one
+    conn.execute(text(f'''
+        CREATE TABLE IF NOT EXISTS {FACT_TABLE} (
+            ticker TEXT NOT NULL,
+            exchange TEXT NOT NULL,
+            dataset TEXT NOT NULL,
+            period TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            item_order INTEGER NOT NULL,
+            item TEXT,
+            fiscal_period TEXT NOT NULL,
+            value,
+            valid_from TEXT NOT NULL,
+            valid_to TEXT,
+            PRIMARY KEY (ticker, exchange, dataset, period, stage, item_order, fiscal_period, valid_from)
+        )
+    '''))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {FACT_TABLE}_item ON {FACT_TABLE} (dataset, item, period, stage)"))
+
+    if legacy:
+        fields = 'ticker, exchange, dataset, period, stage, item_order, item, fiscal_period, value'
+        conn.execute(text(f'''
+            INSERT INTO {FACT_TABLE} ({fields}, valid_from)
+            SELECT {fields}, :valid_from FROM {FACT_TABLE}_legacy
+        '''), {'valid_from': UNKNOWN_TIME})
+        conn.execute(text(f"DROP TABLE {FACT_TABLE}_legacy"))
+
+
+def _fact_key(ticker, exchange, dataset, period, stage):
+    return {
+        'ticker': ticker.lower(),
+        'exchange': exchange.lower(),
+        'dataset': dataset,
+        'period': period or '',
+        'stage': stage,
+    }
+
+
+def _timestamp(time):
+    '''Text of a time in fact table, which sorts in time order'''
+    return pd.Timestamp(time).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+def _validity(as_of, params):
+    '''SQL condition of facts valid at as_of, or current facts if as_of is None'''
+    if as_of is None:
+        return 'valid_to IS NULL'
+    params['as_of'] = _timestamp(as_of)
+    return 'valid_from <= :as_of AND (valid_to IS NULL OR valid_to > :as_of)'
+
+
+def write_facts(conn, df, ticker, exchange, dataset, period, stage, fetched_at=None):
+    '''
+    Upsert facts of a dataset with cells of a wide DataFrame, whose first column is line item.
+    Only new or changed cells are written, the values they replace and cells no longer in
+    the DataFrame are kept as history, valid until fetched_at
+
+    Args:
+        conn: SQLAlchemy connection
+        df: DataFrame of statement or statistics
+        ticker, exchange, dataset, period, stage: Key of the dataset
+        fetched_at: Time of the data, default is now
+
+    Returns:
+        List of DataFrame columns, which is needed to rebuild the DataFrame
+    '''
+    key = _fact_key(ticker, exchange, dataset, period, stage)
+    now = _timestamp(fetched_at or datetime.now())
+    columns = [str(c) for c in df.columns if c != 'Last Updated']
+
+    current = pd.read_sql_query(text(f'''
+        SELECT item_order, item, fiscal_period, value FROM {FACT_TABLE}
+        WHERE {FACT_KEY_CONDITION} AND valid_to IS NULL
+    '''), conn, params=key)
+
+    cells = ['item_order', 'item', 'fiscal_period', 'value']
+    if len(df) and len(columns) > 1:
+        wide = df[[c for c in df.columns if c != 'Last Updated']].copy()
+        wide.columns = ['item'] + columns[1:]
+        wide.insert(0, 'item_order', range(len(wide)))
+        long = wide.melt(id_vars=['item_order', 'item'],
+                         var_name='fiscal_period', value_name='value')
+    else:
+        long = pd.DataFrame(columns=cells)
+
+    # SQLite can only bind builtin types
+    current = current.astype(object).where(current.notna(), None)
+    long = long.astype(object).where(long.notna(), None)
+    for frame in (current, long):
+        frame['item_order'] = frame['item_order'].astype('int64')
+        frame['fiscal_period'] = frame['fiscal_period'].astype(str)
+
+    # Diff cells by position, a cell is changed if its line item or value is changed
+    merged = current.merge(long, on=['item_order', 'fiscal_period'], how='outer',
+                           suffixes=('_old', ''), indicator=True)
+    same = merged['_merge'].eq('both')
+    for name in ('item', 'value'):
+        old, new = merged[f'{name}_old'], merged[name]
+        same &= (old == new) | (old.isna() & new.isna())
+    closed = merged[merged['_merge'].ne('right_only') & ~same]
+    opened = merged[merged['_merge'].ne('left_only') & ~same]
+
+    if len(closed):
+        params = [dict(key, valid_to=now, item_order=int(r.item_order), fiscal_period=r.fiscal_period)
+                  for r in closed.itertuples()]
+        conn.execute(text(f'''
+            UPDATE {FACT_TABLE} SET valid_to = :valid_to
+            WHERE {FACT_KEY_CONDITION} AND item_order = :item_order
+                AND fiscal_period = :fiscal_period AND valid_to IS NULL
+        '''), params)
+
+    if len(opened):
+        opened = opened[cells].astype(object).where(opened[cells].notna(), None)
+        opened = opened.assign(valid_from=now, **key)
+        opened['item_order'] = opened['item_order'].astype(int)
+        conn.execute(text(f'''
+            INSERT INTO {FACT_TABLE}
+                (ticker, exchange, dataset, period, stage, item_order, item, fiscal_period, value, valid_from)
+            VALUES
+                (:ticker, :exchange, :dataset, :period, :stage, :item_order, :item, :fiscal_period, :value,
+                 :valid_from)
+        '''), opened.to_dict('records'))
+
+    return columns
+
+
+def close_facts(conn, ticker, exchange, dataset, period, stage, fetched_at=None):
+    '''
+    Close current facts of a dataset, when it is written in another storage layout.
+    The facts are kept as history, valid until fetched_at
+
+    Args:
+        conn: SQLAlchemy connection
+        ticker, exchange, dataset, period, stage: Key of the dataset
+        fetched_at: Time of the data which replaces the facts, default is now
+    '''
+    key = _fact_key(ticker, exchange, dataset, period, stage)
+    conn.execute(text(f'''
+        UPDATE {FACT_TABLE} SET valid_to = :valid_to
+        WHERE {FACT_KEY_CONDITION} AND valid_to IS NULL
+    '''), dict(key, valid_to=_timestamp(fetched_at or datetime.now())))
+
+
+def read_facts(conn, ticker, exchange, dataset, period, stage, columns, as_of=None):
+    '''
+    Rebuild the wide DataFrame of a dataset from facts
+
+    Args:
+        conn: SQLAlchemy connection
+        ticker, exchange, dataset, period, stage: Key of the dataset
+        columns: List of DataFrame columns returned by write_facts()
+        as_of: Rebuild the dataset as it was at this time, None for current data
+
+    Returns:
+        DataFrame of the dataset, or None if it has no facts at as_of
+    '''
+    key = _fact_key(ticker, exchange, dataset, period, stage)
+    long = pd.read_sql_query(text(f'''
+        SELECT item_order, item, fiscal_period, value FROM {FACT_TABLE}
+        WHERE {FACT_KEY_CONDITION} AND {_validity(as_of, key)}
+    '''), conn, params=key)
+
+    if as_of is not None:
+        if not len(long):
+            return None
+        # Fiscal periods of the dataset at that time, in the order of current columns
+        periods = set(long['fiscal_period'])
+        columns = columns[:1] + [c for c in columns[1:] if c in periods] + \
+            sorted(periods.difference(columns[1:]))
+
+    items = long.drop_duplicates('item_order').set_index('item_order')['item'].sort_index()
+    wide = long.pivot(index='item_order', columns='fiscal_period', values='value')
+    wide = wide.reindex(index=items.index, columns=columns[1:])
+    wide.insert(0, columns[0], items)
+
+    # Infer column types the same way as pd.read_sql_query() does
+    records = wide.astype(object).where(wide.notna(), None).values.tolist()
+    return pd.DataFrame.from_records(records, columns=columns, coerce_float=True)
+
+
+def query_facts(conn, dataset, items=None, tickers=None, exchange=None, period=None, stage=None,
+                as_of=None, history=False):
+    '''
+    Query facts of a dataset across tickers, in long format
+
+    Args:
+        conn: SQLAlchemy connection
+        dataset: Dataset name, e.g. 'Income Statement'
+        items: List of line items, None for all
+        tickers: List of tickers, None for all
+        exchange, period, stage: Filters, None for all
+        as_of: Query facts valid at this time, None for current facts
+        history: Query all versions of facts, as_of is ignored
+
+    Returns:
+        DataFrame with columns ticker, exchange, dataset, period, stage, item_order, item, fiscal_period, value,
+        valid_from and valid_to
+    '''
+    conditions = ['dataset = :dataset']
+    params = {'dataset': dataset}
+    expanding = []
+    if items is not None:
+        conditions.append('item IN :items')
+        params['items'] = list(items)
+        expanding.append(bindparam('items', expanding=True))
+    if tickers is not None:
+        conditions.append('ticker IN :tickers')
+        params['tickers'] = [t.lower() for t in tickers]
+        expanding.append(bindparam('tickers', expanding=True))
+    if exchange is not None:
+        conditions.append('exchange = :exchange')
+        params['exchange'] = exchange.lower()
+    if period is not None:
+        conditions.append('period = :period')
+        params['period'] = period
+    if stage is not None:
+        conditions.append('stage = :stage')
+        params['stage'] = stage
+    if not history:
+        conditions.append(_validity(as_of, params))
+
+    query = text(f'''
+        SELECT ticker, exchange, dataset, period, stage, item_order, item, fiscal_period, value,
+            valid_from, valid_to
+        FROM {FACT_TABLE} WHERE {' AND '.join(conditions)}
+        ORDER BY ticker, exchange, item_order, valid_from
+    ''').bindparams(*expanding)
+    return pd.read_sql_query(query, conn, params=params)
+
+
+class FrameCache:
+    '''
+    In-memory LRU cache of DataFrames, bounded by total memory usage of cached DataFrames
+    '''
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        '''
+        Get a cached DataFrame, and mark it as recently used
+
+        Returns:
+            Tuple of (copy of DataFrame, fetch time), or None
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        df, fetched_at, _ = entry
+        return df.copy(), fetched_at
+
+    def put(self, key, df, fetched_at):
+        '''Cache a copy of DataFrame, least recently used ones are evicted to fit max_bytes'''
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_bytes:
+            self.invalidate(key)
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (df.copy(), fetched_at, size)
+            self.bytes += size
+
+            while self.bytes > self.max_bytes:
+                _, (_, _, evicted) = self._entries.popitem(last=False)
+                self.bytes -= evicted
+
+    def invalidate(self, key):
+        '''Remove a cached DataFrame'''
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+
+    def clear(self):
+        '''Remove all cached DataFrames'''
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+
+# Journal of crawl jobs, one row per ticker, exchange, dataset, period and stage
+JOURNAL_TABLE = 'msfinance_journal'
+
+# Status of crawl journal items
+JOURNAL_STATUSES = ('pending', 'done', 'failed', 'no_data')
+
+# Key of an item in journal
+JOURNAL_KEY_CONDITION = (
+    'ticker = :ticker AND exchange = :exchange AND dataset = :dataset AND period = :period AND stage = :stage')
+
+
+def ensure_journal(conn):
+    '''
+    Create crawl journal table if it does not exist. Items journaled before period
+    and stage were kept are migrated as crawled with the defaults, 'Annual' and 'Restated'
+
+    Args:
+        conn: SQLAlchemy connection
+    '''
+    inspector = sqlalchemy.inspect(conn)
+    legacy = False
+    if JOURNAL_TABLE in inspector.get_table_names():
+        if 'period' in [c['name'] for c in inspector.get_columns(JOURNAL_TABLE)]:
+            return
+        # Primary key changes, so the table is rebuilt
+        conn.execute(text(f"ALTER TABLE {JOURNAL_TABLE} RENAME TO {JOURNAL_TABLE}_legacy"))
+        conn.execute(text(f"DROP INDEX IF EXISTS {JOURNAL_TABLE}_status"))
+        legacy = True
+
+    conn.execute(text(f'''
+        CREATE TABLE IF NOT EXISTS {JOURNAL_TABLE} (
+            ticker TEXT NOT NULL,
+            exchange TEXT NOT NULL,
+            dataset TEXT NOT NULL,
+            period TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            status TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            started_at TEXT,
+            finished_at TEXT,
+            elapsed REAL,
+            error TEXT,
+            PRIMARY KEY (ticker, exchange, dataset, period, stage)
+        )
+    '''))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {JOURNAL_TABLE}_status ON {JOURNAL_TABLE} (status)"))
+
+    if legacy:
+        fields = 'ticker, exchange, dataset, status, attempts, started_at, finished_at, elapsed, error'
+        conn.execute(text(f'''
+            INSERT INTO {JOURNAL_TABLE} ({fields}, period, stage)
+            SELECT {fields}, 'Annual', 'Restated' FROM {JOURNAL_TABLE}_legacy
+        '''))
+        conn.execute(text(f"DROP TABLE {JOURNAL_TABLE}_legacy"))
+
+
+def _journal_key(ticker, exchange, dataset, period, stage):
+    return {
+        'ticker': ticker,
+        'exchange': exchange,
+        'dataset': dataset,
+        'period': period or '',
+        'stage': stage,
+    }
+
+
+def seed_journal(conn, items, reset=False):
+    '''
+    Add items to journal as pending
+
+    Args:
+        conn: SQLAlchemy connection
+        items: List of (ticker, exchange, dataset, period, stage), period is None for statistics
+        reset: Reset items already in journal to pending, else they are kept as they are
+    '''
+    verb = 'INSERT OR REPLACE' if reset else 'INSERT OR IGNORE'
+    conn.execute(text(f'''
+        {verb} INTO {JOURNAL_TABLE} (ticker, exchange, dataset, period, stage, status, attempts)
+        VALUES (:ticker, :exchange, :dataset, :period, :stage, 'pending', 0)
+    '''), [_journal_key(*item) for item in items])
+
+
+def select_journal(conn, statuses):
+    '''
+    Select journal items by status
+
+    Args:
+        conn: SQLAlchemy connection
+        statuses: List of status
+
+    Returns:
+        Set of (ticker, exchange, dataset, period, stage), period is None for statistics
+    '''
+    query = text(
+        f"SELECT ticker, exchange, dataset, period, stage FROM {JOURNAL_TABLE} WHERE status IN :statuses"
+    ).bindparams(bindparam('statuses', expanding=True))
+    return set((t, e, d, p or None, s) for t, e, d, p, s in conn.execute(query, {'statuses': list(statuses)}))
+
+
+def record_journal(conn, ticker, exchange, dataset, period, stage, status, started_at, elapsed, error=None):
+    '''
+    Record the outcome of one attempt of a journal item
+
+    Args:
+        conn: SQLAlchemy connection
+        ticker, exchange, dataset, period, stage: Key of the item
+        status: One of JOURNAL_STATUSES
+        started_at: Time the attempt started
+        elapsed: Seconds the attempt took
+        error: Error message of failed attempt
+    '''
+    conn.execute(text(f'''
+        UPDATE {JOURNAL_TABLE}
+        SET status = :status, attempts = attempts + 1, started_at = :started_at,
+            finished_at = :finished_at, elapsed = :elapsed, error = :error
+        WHERE {JOURNAL_KEY_CONDITION}
+    '''), dict(
+        _journal_key(ticker, exchange, dataset, period, stage),
+        status=status,
+        started_at=started_at.isoformat(sep=' '),
+        finished_at=datetime.now().isoformat(sep=' '),
+        elapsed=elapsed,
+        error=error,
+    ))
+
+
+# Partition value of datasets without period, i.e. statistics
+NO_PERIOD = 'none'
+
+# Hive partition keys of Parquet store, in order of directory levels
+PARTITION_KEYS = ('exchange', 'dataset', 'period', 'stage')
+
+# Column of ticker in Parquet files, so tables of many tickers can be concatenated
+TICKER_COLUMN = 'ticker'
+
+
+class ParquetStore:
+    '''
+    Columnar store of statements and statistics, one Parquet file per ticker in
+    hive partitions exchange=/dataset=/period=/stage=. Files are read through
+    memory map, and bulk loads only open the partitions and columns asked for.
+    '''
+
+    def __init__(self, root):
+        '''
+        Args:
+            root: Root directory of the store
+        '''
+        if pa is None:
+            raise ImportError("pyarrow is not installed, pip install msfinance[parquet]")
+        self.root = root
+        self.filesystem = fs.LocalFileSystem(use_mmap=True)
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, ticker, exchange, dataset, period, stage):
+        '''Path of Parquet file of a dataset'''
+        return os.path.join(
+            self.root, f"exchange={exchange.lower()}", f"dataset={dataset}",
+            f"period={period or NO_PERIOD}", f"stage={stage}",
+            f"{ticker.lower().replace('/', '_')}.parquet")
+
+    def write(self, df, ticker, exchange, dataset, period, stage):
+        '''
+        Replace Parquet file of a dataset
+
+        Args:
+            df: DataFrame of statement or statistics
+            ticker, exchange, dataset, period, stage: Key of the dataset
+
+        Returns:
+            List of DataFrame columns
+        '''
+        df = df.copy()
+        df.columns = [str(c) for c in df.columns]
+        columns = df.columns.tolist()
+        df[TICKER_COLUMN] = ticker.lower()
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Values which are not normalized may mix numbers and strings
+            mixed = [c for c in columns if 'object' == str(df[c].dtype)]
+            df[mixed] = df[mixed].astype('string')
+            table = pa.Table.from_pandas(df, preserve_index=False)
+
+        path = self.path(ticker, exchange, dataset, period, stage)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Hidden temporary file is ignored by readers of the dataset
+        tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        return columns
+
+    def read(self, ticker, exchange, dataset, period, stage, columns=None, as_arrow=False):
+        '''
+        Read Parquet file of a dataset
+
+        Args:
+            ticker, exchange, dataset, period, stage: Key of the dataset
+            columns: List of columns to read, None for all
+            as_arrow: Return pyarrow.Table, without copying into pandas
+
+        Returns:
+            DataFrame or pyarrow.Table, None if it is not stored
+        '''
+        path = self.path(ticker, exchange, dataset, period, stage)
+        if not os.path.exists(path):
+            return None
+        table = pq.read_table(path, columns=columns, memory_map=True)
+        if TICKER_COLUMN in table.column_names:
+            table = table.drop_columns([TICKER_COLUMN])
+        return table if as_arrow else table.to_pandas()
+
+    def load(self, dataset=None, period=None, stage=None, exchange=None, tickers=None, columns=None, as_arrow=False):
+        '''
+        Load a dataset of many tickers at once, only matching partitions and columns are read
+
+        Args:
+            dataset: Dataset name, e.g. 'Income Statement', None for all
+            period: Period of statement, 'Annual' or 'Quarterly', NO_PERIOD for statistics, None for all
+            stage: Stage of statement, None for all
+            exchange: Exchange name, None for all
+            tickers: List of stock symbols, None for all
+            columns: List of columns to read, None for all
+            as_arrow: Return pyarrow.Table, without copying into pandas
+
+        Returns:
+            DataFrame or pyarrow.Table with ticker and partition columns, one row per line item
+        '''
+        files = self._files(dataset, period, stage, exchange, tickers)
+        if not files:
+            return None
+
+        # Tickers have their own fiscal periods, so schemas of files are unified
+        partitioning = ds.partitioning(
+            pa.schema([(name, pa.string()) for name in PARTITION_KEYS]), flavor='hive')
+        options = dict(format='parquet', partitioning=partitioning, partition_base_dir=self.root,
+                       filesystem=self.filesystem)
+        schema = pa.unify_schemas(
+            [fragment.physical_schema for fragment in ds.dataset(files, **options).get_fragments()] +
+            [partitioning.schema], promote_options='permissive')
+        dataset_ = ds.dataset(files, schema=schema, **options)
+
+        if columns is not None:
+            columns = [TICKER_COLUMN] + [c for c in columns if c != TICKER_COLUMN and c in schema.names]
+        table = dataset_.to_table(columns=columns)
+        return table if as_arrow else table.to_pandas()
+
+    def _files(self, dataset, period, stage, exchange, tickers):
+        '''
+        Paths of Parquet files of matching partitions and tickers. Paths are built from the keys
+        which are given, only directories of partition keys which are not given are listed
+        '''
+        directories = [self.root]
+        for name, value in zip(PARTITION_KEYS, (exchange and exchange.lower(), dataset, period, stage)):
+            if value is not None:
+                directories = [os.path.join(d, f"{name}={value}") for d in directories]
+            else:
+                directories = [entry.path for d in directories if os.path.isdir(d)
+                               for entry in os.scandir(d) if entry.is_dir() and entry.name.startswith(f"{name}=")]
+
+        if tickers is not None:
+            filenames = dict.fromkeys(f"{t.lower().replace('/', '_')}.parquet" for t in tickers)
+            return [path for d in directories for path in (os.path.join(d, f) for f in filenames)
+                    if os.path.exists(path)]
+        # Hidden temporary files of unfinished writes are skipped
+        return sorted(entry.path for d in directories if os.path.isdir(d) for entry in os.scandir(d)
+                      if entry.name.endswith('.parquet') and not entry.name.startswith('.'))
+
+    def remove(self, ticker, exchange, dataset, period, stage):
+        '''Remove Parquet file of a dataset, if it exists'''
+        path = self.path(ticker, exchange, dataset, period, stage)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class WriteBehind:
+    '''
+    Background writer thread, which takes items from a queue and writes them in
+    batches, one transaction per batch. Callers never wait for disk or database
+    locks, except on flush() and close().
+    '''
+
+    def __init__(self, write_batch, max_batch=50, interval=1.0, logger=None):
+        '''
+        Args:
+            write_batch: Function to write a list of items in one transaction
+            max_batch: Max number of items in one batch
+            interval: Max seconds an item waits for more items to batch with
+            logger: Logger of write errors
+        '''
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self.interval = interval
+        self.logger = logger or logging.getLogger(__name__)
+
+        # Errors of failed batches, raised by flush()
+        self.errors = []
+
+        self._queue = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='msfinance-writer', daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        '''Queue an item to write'''
+        if self._closed:
+            raise RuntimeError("Writer is closed")
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+
+            # Gather more items for a while, up to a full batch
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.max_batch:
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                self.logger.error(f"Write {len(batch)} items fail: {e}")
+                self.errors.append(e)
+            finally:
+                for _ in range(len(batch) + stop):
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self):
+        '''Wait until all queued items are written, and raise the first error of failed batches'''
+        if self._thread.is_alive():
+            self._queue.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise errors[0]
+
+    def close(self):
+        '''Write queued items and stop the writer thread, and raise the first error of failed batches'''
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._thread.join()
+        if self.errors:
+            errors, self.errors = self.errors, []
+            raise errors[0]
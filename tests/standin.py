@@ -0,0 +1,297 @@
+'''
+Local stand-in of the websites msfinance fetches from, for offline tests and benchmarks.
+It serves Morningstar financials and key metrics pages with export buttons and JSON APIs,
+bot challenge and page not found pages, NASDAQ screener and Wikipedia constituents, all
+from fixture data. Point Stock to it with base_urls:
+
+    with StandIn() as standin:
+        stock = Stock(base_urls=standin.base_urls)
+'''
+
+import os
+import json
+import time
+import threading
+
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+from msfinance.stocks import statistics_filename, statement_apiname, us_exchange_screeners
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+# Text of Morningstar bot challenge page, see Stock.check_for_bot_confirmation()
+CHALLENGE_TEXT = "Let's confirm you aren't a bot"
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html><head><title>{title}</title>
+<style>
+  button, span, div {{ display: block; margin: 4px; }}
+  #no-data {{ display: none; }}
+  .filler {{ height: 1500px; }}
+</style>
+</head><body>
+<h1>{title}</h1>
+<div id="tabs">{tabs}</div>
+{lists}
+<button id="{export_id}" onclick="exportData()">Export Data</button>
+<div id="no-data"></div>
+<div class="filler"></div>
+<script>
+var page = {page};
+var state = {{tab: page.tabs[0], period: 'Annual', stage: 'Restated'}};
+
+function render() {{
+  document.querySelectorAll('button[aria-haspopup]').forEach(function (b) {{
+    b.textContent = state[b.dataset.list];
+  }});
+  var noData = document.getElementById('no-data');
+  if (page.noData.indexOf(state.tab) >= 0) {{
+    noData.textContent = 'There is no ' + state.tab + ' data available.';
+    noData.style.display = 'block';
+  }} else {{
+    noData.style.display = 'none';
+  }}
+  // Data of the shown table is loaded by API, as Morningstar pages do
+  var api = page.apis[state.tab];
+  fetch(page.base + '/api/v1/stocks/' + page.exchange + '/' + page.ticker + '/' + api
+        + '?dataType=' + page.periods[state.period] + '&reportType=' + page.stages[state.stage]);
+}}
+
+function select(name, value) {{
+  state[name] = value;
+  render();
+}}
+
+function exportData() {{
+  var file = page.files[state.tab];
+  if (page.kind == 'statement') {{
+    file = state.tab + '_' + state.period + '_' + state.stage;
+  }}
+  var link = document.createElement('a');
+  link.href = page.base + '/export/' + page.exchange + '/' + page.ticker + '/' + encodeURIComponent(file) + '.xls';
+  link.download = file + '.xls';
+  document.body.appendChild(link);
+  link.click();
+  link.remove();
+}}
+
+render();
+</script>
+</body></html>
+'''
+
+LIST_TEMPLATE = '''<button aria-haspopup="true" data-list="{name}"></button>
+<div class="mds-list-group">{options}</div>'''
+
+OPTION_TEMPLATE = '''<span class="mds-list-group-item__text__sal" onclick="select('{name}', '{value}')">{value}</span>'''
+
+
+class StandIn:
+    '''
+    Stand-in server of Morningstar, NASDAQ screener and Wikipedia, running in a background thread.
+    Every ticker is listed, except tickers in missing, whose pages are not found
+    '''
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, tickers=None, missing=('nope',), no_data=('Cash Flow',),
+                 challenges=0):
+        '''
+        Args:
+            host, port: Address to listen, port 0 for any free port
+            latency: Seconds to wait before each response, as network round trip
+            tickers: Dict of screener exchange name to listed tickers, e.g. {'nasdaq': ['AAPL']}
+            missing: Tickers without pages
+            no_data: Statistics without data, for all tickers
+            challenges: Number of page loads answered with a bot challenge, before pages are served
+        '''
+        self.latency = latency
+        self.tickers = tickers if tickers is not None else {
+            'nasdaq': ['AAPL', 'MSFT'], 'nyse': ['IBM'], 'amex': ['IMO']}
+        self.missing = {t.lower() for t in missing}
+        self.no_data = list(no_data)
+        self.challenges = challenges
+
+        # Number of requests by kind, e.g. 'financials', 'export', 'api', 'challenge', 'not_modified'
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+        with open(os.path.join(fixtures_dir, 'income_statement.xls'), 'rb') as f:
+            self.spreadsheet = f.read()
+        with open(os.path.join(fixtures_dir, 'income_statement.json'), 'rb') as f:
+            self.table_json = f.read()
+
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                standin._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        '''Base URL of the server'''
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_urls(self):
+        '''Base URLs of all websites for Stock, see msfinance.stocks.website_urls'''
+        return {'morningstar': self.url, 'nasdaq': self.url, 'wikipedia': self.url}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='msfinance-standin', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _count(self, kind):
+        with self._lock:
+            self.requests[kind] += 1
+
+    def _challenge(self):
+        '''Check if this page load is answered with a bot challenge'''
+        with self._lock:
+            if self.challenges > 0:
+                self.challenges -= 1
+                return True
+        return False
+
+    def _handle(self, request):
+        if self.latency:
+            time.sleep(self.latency)
+
+        parsed = urlparse(request.path)
+        parts = [unquote(p) for p in parsed.path.split('/') if p]
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+
+        if ['stocks'] == parts:
+            self._count('landing')
+            return self._send(request, 200, '<html><head><title>Stocks | Morningstar</title></head></html>')
+        if 4 == len(parts) and 'stocks' == parts[0] and parts[3] in ('financials', 'key-metrics'):
+            return self._page(request, parts[1], parts[2], parts[3])
+        if 4 == len(parts) and 'export' == parts[0]:
+            return self._export(request, parts[3])
+        if 6 == len(parts) and parts[:3] == ['api', 'v1', 'stocks']:
+            return self._api(request, parts[5])
+        if parts[:3] == ['api', 'screener', 'stocks']:
+            return self._screener(request, query.get('exchange'))
+        if 2 == len(parts) and 'wiki' == parts[0]:
+            return self._wiki(request, parts[1])
+
+        self._count('not_found')
+        return self._send(request, 404, '<html><head><title>Page Not Found | Morningstar</title></head></html>')
+
+    def _send(self, request, status, body, content_type='text/html; charset=utf-8', headers=None):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        request.send_response(status)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            request.send_header(name, value)
+        request.end_headers()
+        request.wfile.write(body)
+
+    def _page(self, request, exchange, ticker, page):
+        if self._challenge():
+            self._count('challenge')
+            return self._send(request, 200, f"<html><head><title>Morningstar</title></head>"
+                                            f"<body><h1>{CHALLENGE_TEXT}</h1></body></html>")
+        if ticker.lower() in self.missing:
+            self._count('not_found')
+            return self._send(request, 404, '<html><head><title>Page Not Found | Morningstar</title></head></html>')
+
+        if 'financials' == page:
+            self._count('financials')
+            tabs = list(statement_apiname)
+            lists = [('period', ['Annual', 'Quarterly']), ('stage', ['As Originally Reported', 'Restated'])]
+            apis = statement_apiname
+            files = {}
+            export_id = 'salEqsvFinancialsPopoverExport'
+            title = f"{ticker.upper()} Financials | Morningstar"
+        else:
+            self._count('key_metrics')
+            tabs = list(statistics_filename)
+            lists = [('stage', ['As Originally Reported', 'Restated'])]
+            apis = statistics_filename
+            files = statistics_filename
+            export_id = 'salKeyStatsPopoverExport'
+            title = f"{ticker.upper()} Key Metrics | Morningstar"
+
+        page_data = {
+            'base': self.url, 'exchange': exchange, 'ticker': ticker,
+            'kind': 'statement' if 'financials' == page else 'statistics',
+            'tabs': tabs, 'apis': apis, 'files': files, 'noData': [] if 'financials' == page else self.no_data,
+            'periods': {'Annual': 'A', 'Quarterly': 'Q'}, 'stages': {'As Originally Reported': 'A', 'Restated': 'R'},
+        }
+        body = PAGE_TEMPLATE.format(
+            title=title,
+            tabs=''.join(f'<button onclick="select(\'tab\', \'{tab}\')">{tab}</button>' for tab in tabs),
+            lists=''.join(
+                LIST_TEMPLATE.format(name=name, options=''.join(
+                    OPTION_TEMPLATE.format(name=name, value=value) for value in values))
+                for name, values in lists),
+            export_id=export_id,
+            page=json.dumps(page_data),
+        )
+        return self._send(request, 200, body)
+
+    def _export(self, request, filename):
+        self._count('export')
+        return self._send(request, 200, self.spreadsheet, 'application/vnd.ms-excel', {
+            'Content-Disposition': f"attachment; filename*=UTF-8''{quote(filename)}"})
+
+    def _api(self, request, name):
+        self._count('api')
+        statistics = [s for s, f in statistics_filename.items() if f == name]
+        if statistics and statistics[0] in self.no_data:
+            return self._send(request, 200, json.dumps({'result': {'columnDefs': [], 'rows': []}}), 'application/json')
+        return self._send(request, 200, self.table_json, 'application/json')
+
+    def _screener(self, request, exchange):
+        self._count('screener')
+        if exchange not in us_exchange_screeners.values():
+            return self._send(request, 400, json.dumps({'data': None}), 'application/json')
+        rows = [{'symbol': t, 'name': f"{t} Inc."} for t in self.tickers.get(exchange, [])]
+        return self._send(request, 200, json.dumps({'data': {'rows': rows}}), 'application/json')
+
+    def _wiki(self, request, page):
+        etag = f'"{page}-v1"'
+        if etag == request.headers.get('If-None-Match'):
+            self._count('not_modified')
+            request.send_response(304)
+            request.send_header('ETag', etag)
+            request.end_headers()
+            return
+
+        self._count('wiki')
+        if 'List_of_S&P_500_companies' == page:
+            rows = ''.join(f"<tr><td>{t}</td><td>{t} Inc.</td></tr>" for t in self.tickers.get('nasdaq', []))
+            table = f'<table id="constituents"><tr><th>Symbol</th><th>Security</th></tr>{rows}</table>'
+        elif 'Hang_Seng_Index' == page:
+            table = ('<table><tr><th>Ticker</th><th>Name</th></tr>'
+                     '<tr><td>SEHK:\xa0700</td><td>Tencent</td></tr>'
+                     '<tr><td>SEHK:\xa05</td><td>HSBC</td></tr></table>')
+        else:
+            self._count('not_found')
+            return self._send(request, 404, '<html><head><title>Not Found</title></head></html>')
+        return self._send(request, 200, f"<html><body>{table}</body></html>", headers={
+            'ETag': etag, 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
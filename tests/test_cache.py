@@ -0,0 +1,556 @@
+#!/usr/bin/python3 -u
+
+import os
+import gc
+import asyncio
+import sqlite3
+import weakref
+import threading
+import logging
+
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from msfinance import stocks
+import msfinance.storage
+from msfinance.storage import FrameCache
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def make_statement():
+    '''A small statement in the shape of Morningstar exports'''
+    return pd.DataFrame({
+        'Name': ['Total Revenue', 'Cost of Revenue', 'Gross Profit'],
+        '2022': [394328.0, 223546.0, 170782.0],
+        '2023': [383285.0, 214137.0, 169148.0],
+        'TTM': [385603.0, 210352.0, 175251.0],
+    })
+
+
+def test_cache_hit_without_driver(tmp_path):
+    logging.info("Starting test_cache_hit_without_driver")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database)
+
+    unique_id = 'aapl_xnas_income_statement_annual_restated'
+    stock._update_database(unique_id, make_statement())
+
+    df = stock.get_income_statement('aapl', 'xnas')
+    assert df is not None, "Cached income statement is not found"
+    assert df['Name'].tolist() == make_statement()['Name'].tolist(), "Cached income statement mismatch"
+
+    # Cache hits never launch a browser
+    assert 0 == len(stock.driver_pool), "Driver is created for cache hit"
+
+    logging.info("test_cache_hit_without_driver completed successfully")
+
+
+def test_catalog(tmp_path):
+    logging.info("Starting test_catalog")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+
+    # A table cached before the catalog existed
+    legacy = make_statement()
+    legacy['Last Updated'] = pd.Timestamp('2024-01-02 03:04:05')
+    with sqlite3.connect(database) as db:
+        legacy.to_sql('msft_xnas_income_statement_annual_restated', db, index=False)
+        legacy.assign(**{'2023': legacy['2023'].map(lambda v: f"{v:,.1f}")}).to_sql(
+            'ibm_xnys_income_statement_annual_restated', db, index=False)
+
+    stock = stocks.Stock(database=database)
+
+    unique_id = stock.statement_id('aapl', 'xnas', 'Income Statement')
+    stock._update_database(
+        unique_id, make_statement(), ticker='aapl', exchange='xnas', kind='statement',
+        dataset='Income Statement', period='Annual', stage='Restated')
+
+    unique_ids = [
+        unique_id,
+        stock.statement_id('msft', 'xnas', 'Income Statement'),
+        stock.statement_id('goog', 'xnas', 'Income Statement'),
+    ]
+    catalog = stock.lookup_catalog(unique_ids)
+    assert sorted(catalog.index) == sorted(unique_ids[:2]), "Catalog lookup mismatch"
+    assert 3 == catalog.loc[unique_id, 'rows'], "Catalog row count mismatch"
+    assert 'statement' == catalog.loc[unique_id, 'kind'], "Catalog kind mismatch"
+    assert datetime(2024, 1, 2, 3, 4, 5) == catalog.loc[unique_ids[1], 'fetched_at'], \
+        "Legacy table fetch time mismatch"
+
+    assert stock.get_missing(unique_ids) == unique_ids[2:], "Missing unique IDs mismatch"
+    assert stock.get_missing(unique_ids, max_age=timedelta(days=1)) == unique_ids[1:], \
+        "Stale unique IDs mismatch"
+
+    # Not cached tables are answered by catalog
+    assert stock._check_database(unique_ids[2]) is None, "Not cached table is found"
+
+    # Legacy tables of strings are normalized on read, as other statements are
+    df = stock.get_income_statement('ibm', 'xnys')
+    assert 'float64' == df['2023'].dtype and 383285.0 == df['2023'][0], "Legacy table is not normalized"
+
+    logging.info("test_catalog completed successfully")
+
+
+def test_fact_storage(tmp_path):
+    logging.info("Starting test_fact_storage")
+
+    table_stock = stocks.Stock(database=os.path.join(tmp_path, 'table.db3'))
+    fact_stock = stocks.Stock(database=os.path.join(tmp_path, 'fact.db3'), storage='fact')
+
+    statement = make_statement()
+    statement.loc[1, '2022'] = None
+    statement.loc[3] = ['Operating Expenses', None, None, None]
+
+    for stock in (table_stock, fact_stock):
+        for ticker in ('aapl', 'msft'):
+            unique_id = stock.statement_id(ticker, 'xnas', 'Income Statement')
+            stock._update_database(
+                unique_id, statement.copy(), ticker=ticker, exchange='xnas', kind='statement',
+                dataset='Income Statement', period='Annual', stage='Restated')
+
+    # Both layouts return the same DataFrame
+    expected = table_stock.get_income_statement('aapl', 'xnas').drop(columns='Last Updated')
+    df = fact_stock.get_income_statement('aapl', 'xnas')
+    assert 'Last Updated' in df.columns, "Last Updated column is missing"
+    pd.testing.assert_frame_equal(df.drop(columns='Last Updated'), expected)
+
+    # No table per unique_id in fact layout
+    with sqlite3.connect(os.path.join(tmp_path, 'fact.db3')) as db:
+        tables = [r[0] for r in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+    assert 'aapl_xnas_income_statement_annual_restated' not in tables, "Table is created in fact layout"
+
+    # One query for a line item of all tickers
+    facts = fact_stock.query_facts('Income Statement', items=['Total Revenue'], period='Annual')
+    assert sorted(facts['ticker'].unique()) == ['aapl', 'msft'], "Fact tickers mismatch"
+    assert 6 == len(facts), "Fact count mismatch"
+
+    logging.info("test_fact_storage completed successfully")
+
+
+def test_fact_history(tmp_path):
+    logging.info("Starting test_fact_history")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database, storage='fact')
+    unique_id = stock.statement_id('aapl', 'xnas', 'Income Statement')
+    meta = dict(ticker='aapl', exchange='xnas', kind='statement', dataset='Income Statement',
+                period='Annual', stage='Restated')
+
+    stock._update_database(unique_id, make_statement(), **meta)
+    before = datetime.now()
+
+    # Refresh revises one value, adds a fiscal period and drops TTM
+    statement = make_statement().drop(columns='TTM')
+    statement.loc[0, '2023'] = 383000.0
+    statement['2024'] = [391035.0, 210352.0, 180683.0]
+    stock._update_database(unique_id, statement.copy(), **meta)
+
+    # Only changed cells are written
+    with sqlite3.connect(database) as db:
+        total, current = db.execute(
+            "SELECT COUNT(*), COUNT(*) - COUNT(valid_to) FROM msfinance_facts").fetchone()
+    assert 13 == total, f"Unchanged cells are rewritten: {total}"
+    assert 9 == current, f"Current cells mismatch: {current}"
+
+    df = stock.get_income_statement('aapl', 'xnas')
+    pd.testing.assert_frame_equal(df.drop(columns='Last Updated'), statement)
+
+    # Replaced values are kept as history
+    facts = stock.query_facts('Income Statement', items=['Total Revenue'], as_of=before)
+    assert ['2022', '2023', 'TTM'] == sorted(facts['fiscal_period']), "Fiscal periods as of earlier time mismatch"
+    assert 383285.0 == facts.set_index('fiscal_period').loc['2023', 'value'], "Value as of earlier time mismatch"
+
+    facts = stock.query_facts('Income Statement', items=['Total Revenue'], history=True)
+    assert 5 == len(facts), "History of line item mismatch"
+
+    logging.info("test_fact_history completed successfully")
+
+
+def test_fact_migration(tmp_path):
+    logging.info("Starting test_fact_migration")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+
+    # A fact table stored before history was kept
+    with sqlite3.connect(database) as db:
+        db.execute('''
+            CREATE TABLE msfinance_facts (
+                ticker TEXT NOT NULL, exchange TEXT NOT NULL, dataset TEXT NOT NULL, period TEXT NOT NULL,
+                stage TEXT NOT NULL, item_order INTEGER NOT NULL, item TEXT, fiscal_period TEXT NOT NULL, value,
+                PRIMARY KEY (ticker, exchange, dataset, period, stage, item_order, fiscal_period))
+        ''')
+        db.execute("INSERT INTO msfinance_facts VALUES "
+                   "('aapl', 'xnas', 'Income Statement', 'Annual', 'Restated', 0, 'Total Revenue', '2023', 383285.0)")
+
+    stock = stocks.Stock(database=database, storage='fact')
+    facts = stock.query_facts('Income Statement', as_of='2000-01-01')
+    assert [383285.0] == facts['value'].tolist(), "Legacy facts are not migrated"
+
+    logging.info("test_fact_migration completed successfully")
+
+
+def test_freshness(tmp_path):
+    logging.info("Starting test_freshness")
+
+    stock = stocks.Stock(
+        database=os.path.join(tmp_path, 'msf.db3'),
+        freshness={'Quarterly': 30, 'Annual': 90, 'Financial Summary': timedelta(days=7)},
+    )
+
+    assert timedelta(days=30) == stock._max_age('statement', 'Income Statement', 'Quarterly')
+    assert timedelta(days=90) == stock._max_age('statement', 'Balance Sheet', 'Annual')
+    assert timedelta(days=7) == stock._max_age('statistics', 'Financial Summary')
+    assert stock._max_age('statistics', 'Growth') is None, "Data without policy gets stale"
+
+    unique_id = stock.statement_id('aapl', 'xnas', 'Income Statement', 'Quarterly')
+    stock._update_database(
+        unique_id, make_statement(), ticker='aapl', exchange='xnas', kind='statement',
+        dataset='Income Statement', period='Quarterly', stage='Restated')
+
+    assert stock._check_database(unique_id, timedelta(days=30)) is not None, "Fresh data is stale"
+
+    # Make the cached data 31 days old
+    with sqlite3.connect(os.path.join(tmp_path, 'msf.db3')) as db:
+        db.execute("UPDATE msfinance_catalog SET fetched_at = ? WHERE unique_id = ?",
+                   ((datetime.now() - timedelta(days=31)).isoformat(sep=' '), unique_id))
+
+    assert stock._check_database(unique_id, timedelta(days=30)) is None, "Stale data is served"
+    assert stock._check_database(unique_id, timedelta(days=90)) is not None, "Fresh data is stale"
+    assert 1 == stock.cache_stats['stale'], "Stale lookup is not counted"
+
+    logging.info("test_freshness completed successfully")
+
+
+def test_memory_cache(tmp_path):
+    logging.info("Starting test_memory_cache")
+
+    stock = stocks.Stock(database=os.path.join(tmp_path, 'msf.db3'), memory_cache=1 << 20)
+
+    unique_id = stock.statement_id('aapl', 'xnas', 'Income Statement')
+    stock._update_database(
+        unique_id, make_statement(), ticker='aapl', exchange='xnas', kind='statement',
+        dataset='Income Statement', period='Annual', stage='Restated')
+
+    df = stock._check_database(unique_id)
+    assert unique_id in stock.memory_cache, "DataFrame is not cached in memory"
+
+    # Cached DataFrame is not affected by callers
+    df.loc[0, '2022'] = 0.0
+    assert 394328.0 == stock._check_database(unique_id).loc[0, '2022'], "Cached DataFrame is modified"
+
+    # Update invalidates memory cache
+    statement = make_statement()
+    statement.loc[0, '2022'] = 1.0
+    stock._update_database(
+        unique_id, statement, ticker='aapl', exchange='xnas', kind='statement',
+        dataset='Income Statement', period='Annual', stage='Restated')
+    assert unique_id not in stock.memory_cache, "Memory cache is not invalidated"
+    assert 1.0 == stock._check_database(unique_id).loc[0, '2022'], "Updated DataFrame is not read"
+
+    logging.info("test_memory_cache completed successfully")
+
+
+def test_frame_cache_eviction():
+    logging.info("Starting test_frame_cache_eviction")
+
+    df = make_statement()
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    cache = FrameCache(size * 2)
+
+    cache.put('a', df, None)
+    cache.put('b', df, None)
+    cache.get('a')
+    cache.put('c', df, None)
+
+    # 'b' is the least recently used one
+    assert 'a' in cache and 'c' in cache, "Recently used DataFrame is evicted"
+    assert 'b' not in cache, "Least recently used DataFrame is not evicted"
+    assert cache.bytes <= cache.max_bytes, "Cache exceeds max bytes"
+
+    logging.info("test_frame_cache_eviction completed successfully")
+
+
+def test_typed_storage(tmp_path):
+    logging.info("Starting test_typed_storage")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database, value_dtype='float32')
+
+    statement = make_statement().astype({'2022': object})
+    statement.loc[1, '2022'] = '—'
+    unique_id = stock.statement_id('aapl', 'xnas', 'Income Statement')
+    stock._update_database(
+        unique_id, stock._normalize(statement), ticker='aapl', exchange='xnas', kind='statement',
+        dataset='Income Statement', period='Annual', stage='Restated')
+
+    # Values are stored as numbers, not strings
+    with sqlite3.connect(database) as db:
+        types = {r[0] for r in db.execute(f"SELECT typeof(\"2022\") FROM '{unique_id}'")}
+    assert {'real', 'null'} == types, f"Values are stored as {types}"
+
+    df = stock.get_income_statement('aapl', 'xnas')
+    assert 'float32' == df['2022'].dtype, "Values are not read as float32"
+
+    logging.info("test_typed_storage completed successfully")
+
+
+def test_parquet_storage(tmp_path, monkeypatch):
+    logging.info("Starting test_parquet_storage")
+    pytest.importorskip('pyarrow')
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database, storage='parquet')
+
+    for ticker, exchange in (('aapl', 'xnas'), ('ibm', 'xnys')):
+        unique_id = stock.statement_id(ticker, exchange, 'Income Statement')
+        stock._update_database(
+            unique_id, make_statement(), ticker=ticker, exchange=exchange, kind='statement',
+            dataset='Income Statement', period='Annual', stage='Restated')
+    unique_id = stock.statistics_id('aapl', 'xnas', 'Growth')
+    stock._update_database(
+        unique_id, make_statement(), ticker='aapl', exchange='xnas', kind='statistics',
+        dataset='Growth', period=None, stage='Restated')
+
+    assert os.path.exists(os.path.join(
+        tmp_path, 'msf.parquet', 'exchange=xnas', 'dataset=Income Statement', 'period=Annual',
+        'stage=Restated', 'aapl.parquet')), "Parquet file is not partitioned"
+
+    # Datasets are read back from Parquet files
+    df = stock.get_income_statement('aapl', 'xnas')
+    pd.testing.assert_frame_equal(df.drop(columns='Last Updated'), make_statement())
+    assert 'parquet' == stock.lookup_catalog([unique_id]).loc[unique_id, 'storage'], "Catalog storage mismatch"
+
+    # Bulk load prunes partitions and columns
+    df = stock.load_dataset('income_statement', columns=['Name', '2023'])
+    assert ['ticker', 'Name', '2023'] == df.columns.tolist(), "Columns are not pruned"
+    assert ['aapl', 'ibm'] == sorted(df['ticker'].unique()), "Tickers mismatch"
+    assert 6 == len(df), "Rows mismatch"
+
+    # Paths of given partitions and tickers are built without listing directories
+    def no_scandir(path):
+        raise AssertionError(f"{path} is listed")
+    dataset = msfinance.storage.ds.dataset
+
+    def files_only(source, **kwargs):
+        assert isinstance(source, list), f"{source} is discovered"
+        return dataset(source, **kwargs)
+    monkeypatch.setattr(msfinance.storage.os, 'scandir', no_scandir)
+    monkeypatch.setattr(msfinance.storage.ds, 'dataset', files_only)
+    df = stock.load_dataset('income_statement', exchange='xnys', tickers=['IBM'])
+    assert ['ibm'] * 3 == df['ticker'].tolist(), "Ticker rows mismatch"
+    monkeypatch.undo()
+
+    table = stock.load_dataset('growth', as_arrow=True)
+    assert 3 == table.num_rows, "Arrow table mismatch"
+    assert stock.load_dataset('income_statement', exchange='xase') is None, "Empty load is not None"
+
+    # Unknown or ambiguous dataset names are rejected
+    with pytest.raises(ValueError, match='Invalid dataset'):
+        stock.load_dataset('bogus')
+    with pytest.raises(ValueError, match='cash_flow_statement'):
+        stock.load_dataset('Cash Flow')
+
+    logging.info("test_parquet_storage completed successfully")
+
+
+def test_storage_switch(tmp_path):
+    logging.info("Starting test_storage_switch")
+    pytest.importorskip('pyarrow')
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    meta = dict(ticker='aapl', exchange='xnas', kind='statement', dataset='Income Statement',
+                period='Annual', stage='Restated')
+
+    def write(storage, value):
+        stock = stocks.Stock(database=database, storage=storage)
+        statement = make_statement()
+        statement.loc[0, '2023'] = value
+        stock._update_database(stock.statement_id('aapl', 'xnas', 'Income Statement'), statement, **meta)
+        return stock
+
+    def revenue(df):
+        return df.set_index('Name').loc['Total Revenue', '2023']
+
+    write('fact', 1.0)
+    stock = write('parquet', 2.0)
+    facts = stock.query_facts('Income Statement', items=['Total Revenue'])
+    assert facts.empty, "Facts replaced by Parquet layout are current"
+    facts = stock.query_facts('Income Statement', items=['Total Revenue'], history=True)
+    assert 1.0 == facts.set_index('fiscal_period').loc['2023', 'value'], "Replaced facts are not kept as history"
+
+    stock = write('fact', 3.0)
+    assert stock.load_dataset('income_statement') is None, "Parquet file replaced by fact layout is loaded"
+    assert 3.0 == revenue(stock.get_income_statement('aapl', 'xnas')), "Value after switching layout mismatch"
+
+    # Table layout also closes current facts
+    stock = write('table', 4.0)
+    assert stock.query_facts('Income Statement', items=['Total Revenue']).empty, \
+        "Facts replaced by table layout are current"
+    assert 4.0 == revenue(stock.get_income_statement('aapl', 'xnas')), "Value after switching to table mismatch"
+
+    logging.info("test_storage_switch completed successfully")
+
+
+def test_panel(tmp_path):
+    logging.info("Starting test_panel")
+    pytest.importorskip('pyarrow')
+
+    database = os.path.join(tmp_path, 'msf.db3')
+
+    # One ticker of each storage layout in the same database
+    for ticker, storage in (('aapl', 'table'), ('msft', 'fact'), ('goog', 'parquet')):
+        stock = stocks.Stock(database=database, storage=storage)
+        statement = make_statement()
+        statement['2023'] = statement['2023'].map(lambda v: f"{v:,.1f}")
+        unique_id = stock.statement_id(ticker, 'xnas', 'Income Statement')
+        stock._update_database(
+            unique_id, statement, ticker=ticker, exchange='xnas', kind='statement',
+            dataset='Income Statement', period='Annual', stage='Restated')
+        stock.close()
+
+    stock = stocks.Stock(database=database)
+    tickers = [('aapl', 'xnas'), ('msft', 'xnas'), ('goog', 'xnas'), ('tsla', 'xnas')]
+    df = stock.panel(tickers, 'income_statement', items=['Total Revenue', 'Gross Profit'])
+
+    assert ['Total Revenue', 'Gross Profit'] == df.columns.tolist(), "Panel items mismatch"
+    assert ['aapl', 'goog', 'msft'] == df.index.get_level_values('ticker').unique().tolist(), "Panel tickers mismatch"
+    assert 383285.0 == df.loc[('msft', '2023'), 'Total Revenue'], "Panel value is not normalized"
+    assert 9 == len(df), "Panel rows mismatch"
+    assert 0 == len(stock.driver_pool), "Driver is created for cached panel"
+
+    tidy = stock.panel(tickers, 'Income Statement', items=['Gross Profit'], tidy=True)
+    assert ['ticker', 'exchange', 'item', 'fiscal_period', 'value'] == tidy.columns.tolist(), "Tidy columns mismatch"
+    assert 9 == len(tidy), "Tidy rows mismatch"
+
+    with pytest.raises(ValueError, match='Invalid dataset'):
+        stock.panel(tickers, 'bogus')
+    with pytest.raises(ValueError, match='cash_flow_statement'):
+        stock.panel(tickers, 'Cash Flow')
+
+    # Fetching inside a running event loop points to fetch_many()
+    async def panel_in_loop():
+        return stock.panel(tickers, 'income_statement', fetch=True)
+
+    with pytest.raises(RuntimeError, match='fetch_many'):
+        asyncio.run(panel_in_loop())
+
+    logging.info("test_panel completed successfully")
+
+
+def test_write_behind(tmp_path):
+    logging.info("Starting test_write_behind")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database, write_behind=True)
+
+    batches = []
+    write_pending = stock._write_pending
+
+    def record_batch(batch):
+        batches.append(len(batch))
+        write_pending(batch)
+    stock._writer.write_batch = record_batch
+
+    unique_ids = [stock.statement_id(ticker, 'xnas', 'Income Statement') for ticker in ['aapl', 'msft', 'goog']]
+    for unique_id in unique_ids:
+        stock._update_database(unique_id, make_statement())
+
+    # Queued data is served before it is written
+    df = stock.get_income_statement('aapl', 'xnas')
+    assert df is not None, "Queued income statement is not served"
+    assert df['Name'].tolist() == make_statement()['Name'].tolist(), "Queued income statement mismatch"
+
+    stock.flush()
+    assert [3] == batches, f"Queued data is not written in one batch: {batches}"
+    assert not stock._pending_writes, "Written data is still pending"
+    assert [] == stock.get_missing(unique_ids), "Written data is missing in database"
+
+    with sqlite3.connect(database) as db:
+        assert 'wal' == db.execute("PRAGMA journal_mode").fetchone()[0], "Database is not in WAL mode"
+
+    # Data queued at close is written
+    unique_id = stock.statement_id('tsla', 'xnas', 'Income Statement')
+    stock._update_database(unique_id, make_statement())
+    stock.close()
+
+    stock = stocks.Stock(database=database)
+    assert [] == stock.get_missing([unique_id]), "Data queued at close is not written"
+    stock.close()
+
+    logging.info("test_write_behind completed successfully")
+
+
+def test_write_behind_memory_cache(tmp_path):
+    logging.info("Starting test_write_behind_memory_cache")
+
+    stock = stocks.Stock(database=os.path.join(tmp_path, 'msf.db3'), write_behind=True, memory_cache=1 << 20)
+    unique_id = stock.statement_id('aapl', 'xnas', 'Income Statement')
+    meta = dict(ticker='aapl', exchange='xnas', kind='statement', dataset='Income Statement',
+                period='Annual', stage='Restated')
+
+    def write(value):
+        statement = make_statement()
+        statement.loc[0, '2023'] = value
+        stock._update_database(unique_id, statement, **meta)
+
+    write(1.0)
+    stock.flush()
+    assert 1.0 == stock.get_income_statement('aapl', 'xnas')['2023'][0], "Written value mismatch"
+
+    # Hold the writer back, so the refresh stays queued while the old value is in memory cache
+    release = threading.Event()
+    write_pending = stock._writer.write_batch
+
+    def held_batch(batch):
+        release.wait()
+        write_pending(batch)
+    stock._writer.write_batch = held_batch
+
+    try:
+        write(2.0)
+        assert 2.0 == stock.get_income_statement('aapl', 'xnas')['2023'][0], "Queued refresh is not served"
+        panel = stock.panel([('aapl', 'xnas')], 'income_statement', items=['Total Revenue'])
+        assert 2.0 == panel.loc[('aapl', '2023'), 'Total Revenue'], "Queued refresh is not served by panel"
+    finally:
+        release.set()
+    stock.flush()
+    assert 2.0 == stock.get_income_statement('aapl', 'xnas')['2023'][0], "Written refresh is not served"
+    stock.close()
+
+    logging.info("test_write_behind_memory_cache completed successfully")
+
+
+def test_write_behind_failure(tmp_path):
+    logging.info("Starting test_write_behind_failure")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database, write_behind=True)
+
+    def fail(conn, unique_id, df, **meta):
+        raise sqlite3.OperationalError("disk I/O error")
+    stock._write_database = fail
+
+    unique_id = stock.statement_id('aapl', 'xnas', 'Income Statement')
+    stock._update_database(unique_id, make_statement())
+    with pytest.raises(sqlite3.OperationalError):
+        stock.close()
+
+    # Data of the failed batch is not served as cached
+    assert not stock._pending_writes, "Data of failed batch is still pending"
+    assert stock._check_database(unique_id) is None, "Data of failed batch is served"
+
+    # Writer does not keep its Stock alive
+    stock = stocks.Stock(database=database, write_behind=True)
+    stock._update_database(unique_id, make_statement())
+    ref = weakref.ref(stock)
+    del stock
+    gc.collect()
+    assert ref() is None, "Stock with write-behind writer is not collected"
+    assert [] == stocks.Stock(database=database).get_missing([unique_id]), "Queued data is not written on collection"
+
+    logging.info("test_write_behind_failure completed successfully")
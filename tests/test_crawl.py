@@ -0,0 +1,149 @@
+#!/usr/bin/python3 -u
+
+import os
+import sqlite3
+import logging
+
+import pandas as pd
+
+import msfinance as msf
+from msfinance import stocks
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def make_statement():
+    return pd.DataFrame({'Name': ['Total Revenue'], '2023': [1.0]})
+
+
+def test_crawl_cached(tmp_path):
+    logging.info("Starting test_crawl_cached")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database)
+
+    tickers = {'aapl': 'xnas', 'msft': 'xnas', 'ibm': 'xnys'}
+    for ticker, exchange in tickers.items():
+        for statement in ('Income Statement', 'Balance Sheet'):
+            unique_id = stock.statement_id(ticker, exchange, statement)
+            stock._update_database(
+                unique_id, make_statement(), ticker=ticker, exchange=exchange, kind='statement',
+                dataset=statement, period='Annual', stage='Restated')
+
+    # Everything is cached, so workers never launch a browser
+    results = list(msf.crawl(tickers, ['income_statement', 'balance_sheet'], workers=2, database=database))
+    assert 6 == len(results), "Result count mismatch"
+    assert sorted((t, d) for t, _, d, _, _ in results) == sorted(
+        (t, d) for t in tickers for d in ['income_statement', 'balance_sheet']), "Results mismatch"
+    assert all(error is None for _, _, _, _, error in results), "Crawl fails"
+    assert all(isinstance(df, pd.DataFrame) for _, _, _, df, _ in results), "DataFrame is not returned"
+
+    results = list(msf.crawl(tickers, ['income_statement'], workers=1, return_data=False, database=database))
+    assert all(1 == rows for _, _, _, rows, _ in results), "Row counts mismatch"
+
+    logging.info("test_crawl_cached completed successfully")
+
+
+def test_crawl_journal(tmp_path):
+    logging.info("Starting test_crawl_journal")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database)
+
+    tickers = {'aapl': 'xnas', 'ibm': 'xnys'}
+    for ticker, exchange in tickers.items():
+        unique_id = stock.statement_id(ticker, exchange, 'Income Statement')
+        stock._update_database(
+            unique_id, make_statement(), ticker=ticker, exchange=exchange, kind='statement',
+            dataset='Income Statement', period='Annual', stage='Restated')
+
+    results = list(msf.crawl(tickers, ['income_statement'], database=database))
+    assert 2 == len(results), "Result count mismatch"
+
+    journal = msf.crawl_journal(database)
+    assert 2 == len(journal), "Journal item count mismatch"
+    assert (journal['status'] == 'done').all(), "Journal status mismatch"
+    assert (journal['attempts'] == 1).all(), "Journal attempts mismatch"
+    assert journal['elapsed'].notna().all(), "Journal timing is missing"
+
+    # Everything is done, resumed crawl has nothing to do
+    assert [] == list(msf.crawl(tickers, ['income_statement'], resume=True, database=database)), \
+        "Done items are crawled again"
+
+    # Resumed crawl of another period is not done yet
+    for ticker, exchange in tickers.items():
+        unique_id = stock.statement_id(ticker, exchange, 'Income Statement', 'Quarterly')
+        stock._update_database(
+            unique_id, make_statement(), ticker=ticker, exchange=exchange, kind='statement',
+            dataset='Income Statement', period='Quarterly', stage='Restated')
+    results = list(msf.crawl(tickers, ['income_statement'], period='Quarterly', resume=True, database=database))
+    assert 2 == len(results), "Items of another period are taken as done"
+    journal = msf.crawl_journal(database)
+    assert ['Annual', 'Annual', 'Quarterly', 'Quarterly'] == sorted(journal['period']), "Journal periods mismatch"
+    assert [] == list(msf.crawl(tickers, ['income_statement'], period='Quarterly', resume=True,
+                                database=database)), "Done items of another period are crawled again"
+
+    # Only the failed item is retried
+    with sqlite3.connect(database) as db:
+        db.execute("UPDATE msfinance_journal SET status = 'failed' WHERE ticker = 'ibm' AND period = 'Annual'")
+    results = list(msf.crawl(tickers, ['income_statement'], retry_failed=True, database=database))
+    assert [('ibm', 'income_statement')] == [(t, d) for t, _, d, _, _ in results], "Failed item is not retried"
+
+    journal = msf.crawl_journal(database, status='done').query("period == 'Annual'").set_index('ticker')
+    assert 2 == journal.loc['ibm', 'attempts'], "Retry is not counted"
+    assert 1 == journal.loc['aapl', 'attempts'], "Done item is retried"
+
+    logging.info("test_crawl_journal completed successfully")
+
+
+def test_crawl_journal_migration(tmp_path):
+    logging.info("Starting test_crawl_journal_migration")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+
+    # A journal kept before period and stage were in its key
+    with sqlite3.connect(database) as db:
+        db.execute('''
+            CREATE TABLE msfinance_journal (
+                ticker TEXT NOT NULL, exchange TEXT NOT NULL, dataset TEXT NOT NULL, status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0, started_at TEXT, finished_at TEXT, elapsed REAL, error TEXT,
+                PRIMARY KEY (ticker, exchange, dataset))
+        ''')
+        db.execute("INSERT INTO msfinance_journal (ticker, exchange, dataset, status, attempts) "
+                   "VALUES ('aapl', 'xnas', 'income_statement', 'done', 1)")
+
+    journal = msf.crawl_journal(database)
+    assert [('aapl', 'Annual', 'Restated', 'done')] == \
+        list(journal[['ticker', 'period', 'stage', 'status']].itertuples(index=False, name=None)), \
+        "Legacy journal is not migrated"
+
+    # Migrated items are resumed as crawled with the defaults
+    assert [] == list(msf.crawl({'aapl': 'xnas'}, ['income_statement'], resume=True, database=database)), \
+        "Migrated done item is crawled again"
+
+    logging.info("test_crawl_journal_migration completed successfully")
+
+
+def test_crawl_negative(tmp_path):
+    logging.info("Starting test_crawl_negative")
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database)
+
+    # Negative cache entries are served without a browser
+    for ticker, status in (('nope', 'failed'), ('fund', 'no_data')):
+        stock._record_negative(
+            stock.statement_id(ticker, 'xnas', 'Income Statement'), status, 'not found' if 'failed' == status else None,
+            ticker=ticker, exchange='xnas', kind='statement', dataset='Income Statement', period='Annual',
+            stage='Restated')
+
+    results = list(msf.crawl({'nope': 'xnas', 'fund': 'xnas'}, ['income_statement'], database=database))
+    errors = {t: error for t, _, _, _, error in results}
+    assert {'nope': 'not found', 'fund': None} == errors, "Crawl errors mismatch"
+
+    journal = msf.crawl_journal(database).set_index('ticker')
+    assert 'failed' == journal.loc['nope', 'status'], "Failed item is not journaled as failed"
+    assert 'no_data' == journal.loc['fund', 'status'], "No data item is not journaled as no_data"
+
+    logging.info("test_crawl_negative completed successfully")
@@ -0,0 +1,171 @@
+#!/usr/bin/python3 -u
+
+import os
+import time
+import threading
+import logging
+
+import pytest
+
+from selenium.common.exceptions import TimeoutException
+
+from msfinance.drivers import DriverPool, DownloadWatcher
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class FakeDriver:
+    '''Stand-in of a selenium driver, only records the calls made by DriverPool'''
+
+    def __init__(self):
+        self.urls = []
+        self.quitted = False
+
+    def get(self, url):
+        self.urls.append(url)
+
+    def quit(self):
+        self.quitted = True
+
+
+class FakeDriverPool(DriverPool):
+    def setup_chrome_driver(self, download_dir):
+        return FakeDriver()
+
+
+def test_driver_pool():
+    logging.info("Starting test_driver_pool")
+
+    pool = FakeDriverPool(size=2, warmup_url='about:blank', warmup_delay=0)
+    assert 0 == len(pool), "Drivers are created before they are acquired"
+
+    # Drivers are warmed up once, when they are created
+    first = pool.acquire()
+    second = pool.acquire()
+    assert first is not second, "Pool lends the same driver twice"
+    assert first.urls == ['about:blank'], "Driver is not warmed up"
+    assert pool.download_dir(first) != pool.download_dir(second), "Drivers share download directory"
+    assert 2 == len(pool), "Pool creates more drivers than acquired"
+
+    # Released drivers are lent again, without a new warm-up
+    pool.release(first)
+    with pool.driver() as driver:
+        assert driver is first, "Released driver is not reused"
+    assert first.urls == ['about:blank'], "Reused driver is warmed up again"
+
+    # Reset driver keeps its slot and download directory
+    download_dir = pool.download_dir(second)
+    new = pool.reset(second)
+    assert second.quitted, "Reset driver is not quit"
+    assert pool.download_dir(new) == download_dir, "Reset driver changes download directory"
+    pool.release(new)
+
+    pool.close()
+    assert first.quitted and new.quitted, "Drivers are not quit on close"
+
+    logging.info("test_driver_pool completed successfully")
+
+
+def test_driver_pool_reset_failure():
+    logging.info("Starting test_driver_pool_reset_failure")
+
+    class FlakyDriverPool(FakeDriverPool):
+        failures = 0
+
+        def setup_chrome_driver(self, download_dir):
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("Chrome fails to start")
+            return super().setup_chrome_driver(download_dir)
+
+    pool = FlakyDriverPool(size=1, warmup_url=None)
+    driver = pool.acquire()
+
+    pool.failures = 1
+    with pytest.raises(RuntimeError):
+        pool.reset(driver)
+    assert driver.quitted, "Broken driver is not quit"
+
+    # Quit driver is never lent again, the slot gets a new driver
+    pool.release(driver)
+    new = pool.acquire(timeout=1)
+    assert new is not driver, "Quit driver is lent again"
+    assert pool.download_dir(new), "New driver has no download directory"
+
+    # Waiters for a full pool are woken up when a failed reset frees the slot
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(pool.acquire()), daemon=True)
+    waiter.start()
+    time.sleep(0.1)
+    assert not acquired, "Full pool lends a driver"
+    pool.failures = 1
+    with pytest.raises(RuntimeError):
+        pool.reset(new)
+    waiter.join(timeout=5)
+    assert not waiter.is_alive(), "Waiter is still blocked after the slot is freed"
+    assert acquired and acquired[0] is not new, "Waiter does not get a new driver"
+    assert 1 == len(pool), "Slots mismatch"
+    pool.close()
+
+    logging.info("test_driver_pool_reset_failure completed successfully")
+
+
+def test_driver_pool_threads():
+    logging.info("Starting test_driver_pool_threads")
+
+    pool = FakeDriverPool(size=2, warmup_url=None)
+    borrowed = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(10):
+            with pool.driver() as driver:
+                with lock:
+                    assert driver not in borrowed, "Driver is lent to two threads"
+                    borrowed.append(driver)
+                with lock:
+                    borrowed.remove(driver)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    pool.close()
+    logging.info("test_driver_pool_threads completed successfully")
+
+
+def test_download_watcher(tmp_path):
+    logging.info("Starting test_download_watcher")
+
+    download_dir = str(tmp_path)
+
+    # A file left by an earlier download is not reported again
+    with open(os.path.join(download_dir, 'summary_old.xls'), 'wb') as f:
+        f.write(b'old')
+
+    def download():
+        time.sleep(0.2)
+        partial = os.path.join(download_dir, 'summary.xls.crdownload')
+        with open(partial, 'wb') as f:
+            f.write(b'new')
+        os.rename(partial, os.path.join(download_dir, 'summary.xls'))
+
+    with DownloadWatcher(download_dir) as watcher:
+        thread = threading.Thread(target=download)
+        start = time.monotonic()
+        thread.start()
+        path = watcher.wait('summary*.xls', timeout=5)
+        elapsed = time.monotonic() - start
+        thread.join()
+
+    assert os.path.join(download_dir, 'summary.xls') == path, "Downloaded file mismatch"
+    assert elapsed < 1, f"Download is noticed late: {elapsed}s"
+
+    with DownloadWatcher(download_dir) as watcher:
+        with pytest.raises(TimeoutException):
+            watcher.wait('growthTable*.xls', timeout=0.2)
+
+    logging.info("test_download_watcher completed successfully")
@@ -0,0 +1,189 @@
+#!/usr/bin/python3 -u
+
+import os
+import asyncio
+import logging
+
+import pandas as pd
+import pytest
+
+from selenium.common.exceptions import TimeoutException, InvalidSessionIdException
+
+from msfinance import stocks
+from msfinance.drivers import DriverPool
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class FakeDriver:
+    def quit(self):
+        pass
+
+
+class FakeDriverPool(DriverPool):
+    resets = 0
+
+    def setup_chrome_driver(self, download_dir):
+        return FakeDriver()
+
+    def reset(self, driver):
+        self.resets += 1
+        return super().reset(driver)
+
+
+class FakeStock(stocks.Stock):
+    '''Stock whose page operations are recorded instead of driving a browser'''
+
+    def __init__(self, pool_size=1, **kwargs):
+        super().__init__(driver_pool=FakeDriverPool(size=pool_size, warmup_url=None), **kwargs)
+        self.operations = []
+        self.failures = []
+
+    def _open_page(self, url):
+        self.operations.append(('open', url))
+        if '/nope/' in url:
+            raise stocks.PageNotFound(f"{url} is not found")
+        if self.failures:
+            raise self.failures.pop(0)
+        return None
+
+    def _retry_wait(self, retry_state):
+        return 0
+
+    def _select_tab(self, name):
+        self.operations.append(('tab', name))
+
+    def _select_option(self, options, option):
+        self.operations.append(('option', option))
+
+    def _random_mouse_move(self):
+        pass
+
+    def _human_delay(self, min=3, max=15):
+        pass
+
+    def _random_scroll(self):
+        pass
+
+    def _export_financials(self, unique_id, ticker, exchange, statement, period, stage, capture):
+        self.operations.append(('export', statement, period, stage))
+        df = pd.DataFrame({'Name': ['Total Revenue'], '2023': [1.0]})
+        self._update_database(
+            unique_id, df, ticker=ticker, exchange=exchange, kind='statement',
+            dataset=statement, period=period, stage=stage)
+        return df
+
+    def _export_key_metrics(self, unique_id, ticker, exchange, statistics, stage, capture):
+        self.operations.append(('export', statistics, stage))
+        if 'Cash Flow' == statistics:
+            self._record_negative(
+                unique_id, 'no_data', ticker=ticker, exchange=exchange, kind='statistics',
+                dataset=statistics, period=None, stage=stage)
+            return None
+        df = pd.DataFrame({'Name': ['Revenue %'], '2023': [1.0]})
+        self._update_database(
+            unique_id, df, ticker=ticker, exchange=exchange, kind='statistics',
+            dataset=statistics, period=None, stage=stage)
+        return df
+
+
+def test_one_page_visit_per_ticker(tmp_path):
+    logging.info("Starting test_one_page_visit_per_ticker")
+
+    stock = FakeStock(database=os.path.join(tmp_path, 'msf.db3'))
+
+    financials = stock.get_all_financials('aapl', 'xnas')
+    assert 12 == len(financials), "Not all statements are fetched"
+
+    key_metrics = stock.get_key_metrics('aapl', 'xnas')
+    assert 5 == len(key_metrics), "Not all statistics are fetched"
+    assert key_metrics[4] is None, "No data statistics mismatch"
+
+    pages = [op for op in stock.operations if 'open' == op[0]]
+    assert 2 == len(pages), f"Pages are loaded {len(pages)} times"
+
+    exports = [op for op in stock.operations if 'export' == op[0]]
+    assert 17 == len(exports), "Export count mismatch"
+
+    # Tabs are switched once per statement or statistics
+    tabs = [op for op in stock.operations if 'tab' == op[0]]
+    assert 3 + 5 == len(tabs), "Tab switch count mismatch"
+
+    # Cached statements are not fetched again
+    stock.operations = []
+    stock.get_financials('aapl', 'xnas', period='Quarterly', stage='As Originally Reported')
+    assert [] == stock.operations, "Cached statements are fetched again"
+
+    logging.info("test_one_page_visit_per_ticker completed successfully")
+
+
+def test_fetch_many(tmp_path):
+    logging.info("Starting test_fetch_many")
+
+    stock = FakeStock(pool_size=2, database=os.path.join(tmp_path, 'msf.db3'))
+
+    # One ticker is cached already
+    stock.get_income_statement('msft', 'xnas')
+    stock.operations = []
+
+    tickers = [('aapl', 'xnas'), ('msft', 'xnas'), ('goog', 'xnas'), ('amzn', 'xnas')]
+    datasets = ['income_statement', 'balance_sheet', 'growth']
+    results = asyncio.run(stock.fetch_many(tickers, datasets, concurrency=2))
+
+    assert 12 == len(results), "Result count mismatch"
+    assert all(df is not None for _, _, _, df in results), "Fetch fails"
+    assert ('msft', 'xnas', 'income_statement') == results[0][:3], "Cache hit is not served first"
+    assert len(stock.driver_pool) <= 2, "More drivers than concurrency are created"
+
+    # One page visit per ticker and page
+    pages = [op for op in stock.operations if 'open' == op[0]]
+    assert 8 == len(pages), f"Pages are loaded {len(pages)} times"
+
+    logging.info("test_fetch_many completed successfully")
+
+
+def test_negative_cache(tmp_path):
+    logging.info("Starting test_negative_cache")
+
+    stock = FakeStock(database=os.path.join(tmp_path, 'msf.db3'))
+
+    # No data is remembered, so it is not fetched again
+    assert stock.get_cash_flow('aapl', 'xnas') is None, "No data statistics mismatch"
+    stock.operations = []
+    assert stock.get_cash_flow('aapl', 'xnas') is None, "No data statistics mismatch"
+    assert [] == stock.operations, "No data statistics is fetched again"
+    assert 1 == stock.cache_stats['negative'], "Negative cache hit is not counted"
+
+    # Until it is older than negative TTL
+    stock.negative_ttl['no_data'] = 0
+    stock.get_cash_flow('aapl', 'xnas')
+    assert ('export', 'Cash Flow', 'Restated') in stock.operations, "Expired no data is not fetched"
+
+    # Permanent failures are not retried, and are skipped later
+    stock.operations = []
+    with pytest.raises(stocks.PageNotFound):
+        stock.get_growth('nope', 'xnas')
+    assert 1 == len(stock.operations), "Permanent failure is retried"
+    assert stock.get_growth('nope', 'xnas') is None, "Failed statistics mismatch"
+    assert 1 == len(stock.operations), "Failed statistics is fetched again"
+
+    # Failed items are missing, no data items only after negative TTL
+    stock.negative_ttl['no_data'] = 30
+    unique_ids = [stock.statistics_id('nope', 'xnas', 'Growth'), stock.statistics_id('aapl', 'xnas', 'Cash Flow')]
+    assert unique_ids[:1] == stock.get_missing(unique_ids), "Missing items mismatch"
+
+    # Transient errors are retried without a driver reset, broken drivers are reset
+    stock.failures = [TimeoutException('slow'), InvalidSessionIdException('gone')]
+    assert stock.get_growth('msft', 'xnas') is not None, "Transient error is not retried"
+    assert 1 == stock.driver_pool.resets, "Driver reset count mismatch"
+
+    # Bulk fetches skip negative cache entries too
+    stock.operations = []
+    results = asyncio.run(stock.fetch_many([('aapl', 'xnas')], ['cash_flow']))
+    results += asyncio.run(stock.fetch_many([('nope', 'xnas')], ['growth']))
+    assert [('aapl', 'xnas', 'cash_flow', None), ('nope', 'xnas', 'growth', None)] == results, \
+        "Bulk fetch results of negative cache entries mismatch"
+    assert [] == stock.operations, "Negative cache entries are fetched again by bulk fetch"
+
+    logging.info("test_negative_cache completed successfully")
@@ -0,0 +1,102 @@
+#!/usr/bin/python3 -u
+
+import time
+import logging
+import threading
+import multiprocessing
+
+from msfinance.pacing import Pacer, CircuitBreaker
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+def test_pacer():
+    logging.info("Starting test_pacer")
+
+    pacer = Pacer(rate=10, burst=2, jitter=0)
+
+    # Burst is taken without waiting, then steps are paced at rate
+    assert 0 == pacer.reserve('a.com'), "Burst step waits"
+    assert 0 == pacer.reserve('a.com'), "Burst step waits"
+    assert abs(pacer.reserve('a.com') - 0.1) < 0.01, "Step is not paced at rate"
+    assert abs(pacer.reserve('a.com') - 0.2) < 0.01, "Concurrent steps do not queue up"
+
+    # Hosts have their own buckets
+    assert 0 == pacer.reserve('b.com'), "Hosts share bucket"
+
+    # Time spent on real work refills the bucket
+    pacer = Pacer(rate=10, burst=1, jitter=0)
+    pacer.reserve('a.com')
+    time.sleep(0.1)
+    assert pacer.wait('a.com') < 0.02, "Elapsed time does not refill the bucket"
+
+    logging.info("test_pacer completed successfully")
+
+
+def test_pacer_adapt():
+    logging.info("Starting test_pacer_adapt")
+
+    pacer = Pacer(rate=1, burst=1, jitter=0)
+
+    # Challenges tighten rate down to min_rate, and drop the saved burst
+    pacer.penalize('a.com')
+    assert 0.5 == pacer.rate_of('a.com'), "Rate is not tightened"
+    assert pacer.reserve('a.com') > 1.9, "Burst is kept after penalty"
+    for _ in range(10):
+        pacer.penalize('a.com')
+    assert pacer.min_rate == pacer.rate_of('a.com'), "Rate is below min_rate"
+
+    # Clean fetches loosen rate up to max_rate
+    for _ in range(50):
+        pacer.reward('a.com')
+    assert pacer.max_rate == pacer.rate_of('a.com'), "Rate is above max_rate"
+    assert 1 == pacer.rate_of('b.com'), "Penalty of host affects others"
+
+    logging.info("test_pacer_adapt completed successfully")
+
+
+def trip_breaker(directory):
+    CircuitBreaker(directory, backoff=0.5).trip('a.com')
+
+
+def test_circuit_breaker(tmp_path):
+    logging.info("Starting test_circuit_breaker")
+
+    directory = str(tmp_path)
+    breaker = CircuitBreaker(directory, backoff=0.5, poll_interval=0.05)
+    assert 0 == breaker.wait('a.com'), "Closed breaker waits"
+
+    # Breaker opened by another process pauses this one
+    process = multiprocessing.Process(target=trip_breaker, args=(directory,))
+    process.start()
+    process.join()
+    assert breaker.remaining('a.com') > 0, "Breaker of other process is not shared"
+    assert 0 == breaker.remaining('b.com'), "Breaker of host affects others"
+
+    # Trips while open are not counted again
+    breaker.trip('a.com')
+    assert 1 == breaker.state('a.com')['trips'], "Trip of an open breaker is counted"
+
+    start = time.monotonic()
+    breaker.wait('a.com')
+    assert 0.3 < time.monotonic() - start < 1, "Fetch does not wait for breaker to close"
+
+    # Window doubles on trips in a row, and is reset by a clean fetch
+    assert breaker.trip('a.com') > 0.5, "Window does not grow on trips in a row"
+    assert 2 == breaker.state('a.com')['trips'], "Trips in a row are not counted"
+    breaker.reset('a.com')
+    assert 0 == breaker.state('a.com')['trips'], "Breaker is not reset"
+
+    # Parallel fetches seeing the same challenge penalize pacing once
+    pacer = Pacer(rate=1, jitter=0)
+    breaker = CircuitBreaker(str(tmp_path / 'parallel'), backoff=5)
+    threads = [threading.Thread(target=breaker.trip, args=('a.com', pacer.penalize)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 0.5 == pacer.rate_of('a.com'), "Challenge is penalized more than once"
+    assert 1 == breaker.state('a.com')['trips'], "Parallel trips are counted"
+
+    logging.info("test_circuit_breaker completed successfully")
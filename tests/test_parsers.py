@@ -0,0 +1,132 @@
+#!/usr/bin/python3 -u
+
+import os
+import json
+import logging
+
+import pandas as pd
+import pytest
+
+from msfinance.drivers import NetworkCapture
+from msfinance.parsers import parse_table_json, parse_spreadsheet, python_calamine
+from msfinance.parsers import normalize_statement, parse_period, to_periods
+from msfinance.stocks import _match_api_url
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+fixtures_dir = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+
+def load_fixture(name):
+    with open(os.path.join(fixtures_dir, name), 'rb') as f:
+        return f.read()
+
+
+def test_parse_table_json():
+    logging.info("Starting test_parse_table_json")
+
+    df = parse_table_json(json.loads(load_fixture('income_statement.json')))
+    assert df.columns.tolist() == ['Name', '2022', '2023', 'TTM'], "Columns mismatch"
+    assert df['Name'].tolist() == ['Total Revenue', 'Business Revenue', 'Cost of Revenue', 'Gross Profit'], \
+        "Line items mismatch"
+    assert 'float64' == df['2022'].dtype, "Values are not numeric"
+
+    assert parse_table_json({'message': 'no data'}) is None, "Table is found in empty JSON"
+
+    logging.info("test_parse_table_json completed successfully")
+
+
+class FakeDriver:
+    '''Stand-in of a Chrome driver with performance log'''
+
+    def __init__(self, events, bodies):
+        self.events = events
+        self.bodies = bodies
+
+    def get_log(self, log_type):
+        events, self.events = self.events, []
+        return [{'message': json.dumps({'message': event})} for event in events]
+
+    def execute_cdp_cmd(self, cmd, params):
+        assert 'Network.getResponseBody' == cmd
+        return {'body': self.bodies[params['requestId']], 'base64Encoded': False}
+
+
+def test_network_capture():
+    logging.info("Starting test_network_capture")
+
+    api = 'https://api-global.morningstar.com/sal-service/v1/stock/newfinancials/0P000000GY/incomeStatement/detail'
+    events = [
+        {'method': 'Network.responseReceived',
+         'params': {'requestId': '1', 'response': {'url': f"{api}?dataType=A&reportType=A"}}},
+        {'method': 'Network.loadingFinished', 'params': {'requestId': '1'}},
+        {'method': 'Network.responseReceived',
+         'params': {'requestId': '2', 'response': {'url': f"{api}?dataType=A&reportType=R"}}},
+        {'method': 'Network.loadingFinished', 'params': {'requestId': '2'}},
+    ]
+    bodies = {'1': '{}', '2': load_fixture('income_statement.json').decode('utf-8')}
+
+    capture = NetworkCapture(FakeDriver(events, bodies), poll_interval=0)
+    data = capture.wait_json(
+        lambda url: _match_api_url(url, 'incomeStatement', {'dataType': 'A', 'reportType': 'R'}), timeout=1)
+    assert 'result' in data, "Matched response mismatch"
+
+    logging.info("test_network_capture completed successfully")
+
+
+@pytest.mark.parametrize('engine', ['xlrd', 'calamine'])
+def test_parse_spreadsheet(engine):
+    logging.info(f"Starting test_parse_spreadsheet[{engine}]")
+    if 'calamine' == engine and python_calamine is None:
+        pytest.skip("python-calamine is not installed")
+
+    data = load_fixture('income_statement.xls')
+    expected = parse_spreadsheet(data, 'pandas')
+    assert expected.columns.tolist() == ['Name', '2019', '2020', '2021', '2022', '2023', 'TTM'], "Columns mismatch"
+
+    # Engines give the same DataFrame as pandas.read_excel
+    pd.testing.assert_frame_equal(parse_spreadsheet(data, engine), expected)
+
+    with pytest.raises(ValueError):
+        parse_spreadsheet(data, 'nope')
+
+    logging.info(f"test_parse_spreadsheet[{engine}] completed successfully")
+
+
+def test_normalize_statement():
+    logging.info("Starting test_normalize_statement")
+
+    df = normalize_statement(parse_spreadsheet(load_fixture('income_statement.xls'), 'pandas'))
+    assert all('float64' == df[c].dtype for c in df.columns[1:]), "Values are not numeric"
+    assert df.loc[6, '2019'] != df.loc[6, '2019'], "Dash is not NaN"
+    assert 258.0 == df.loc[6, '2021'], "Value mismatch"
+
+    df = pd.DataFrame({
+        'Name': ['Separator', 'Percent', 'Negative', 'Unit', 'Dash', 'Missing'],
+        2023: ['1,234', '12.5%', '(3.4)', '1.2B', '—', None],
+    })
+    df = normalize_statement(df, 'float32')
+    assert ['Name', '2023'] == df.columns.tolist(), "Column names are not strings"
+    assert 'float32' == df['2023'].dtype, "Values are not float32"
+    assert [1234.0, 12.5, -3.4, 1.2e9] == pytest.approx(df['2023'][:4].tolist()), "Values mismatch"
+    assert df['2023'][4:].isna().all(), "Placeholders are not NaN"
+
+    logging.info("test_normalize_statement completed successfully")
+
+
+def test_periods():
+    logging.info("Starting test_periods")
+
+    assert pd.Period('2023', 'Y') == parse_period('2023'), "Fiscal year mismatch"
+    assert pd.Period('2023-09', 'M') == parse_period('2023-09'), "Fiscal month mismatch"
+    assert pd.Period('2023Q3', 'Q') == parse_period('Q3 2023'), "Fiscal quarter mismatch"
+    assert parse_period('TTM') is None, "TTM is a fiscal period"
+
+    df = normalize_statement(parse_spreadsheet(load_fixture('income_statement.xls'), 'pandas'))
+    values = to_periods(df)
+    assert isinstance(values.columns, pd.PeriodIndex), "Columns are not periods"
+    assert 5 == len(values.columns), "TTM is not dropped"
+    assert 394328.0 == values.loc['Total Revenue', pd.Period('2022', 'Y')], "Value mismatch"
+
+    logging.info("test_periods completed successfully")
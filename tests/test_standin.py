@@ -0,0 +1,93 @@
+#!/usr/bin/python3 -u
+
+import os
+import shutil
+import logging
+
+import requests
+import pytest
+
+from msfinance import stocks
+from msfinance.pacing import Pacer, CircuitBreaker
+from msfinance.parsers import parse_spreadsheet, parse_table_json
+
+from tests.standin import StandIn, CHALLENGE_TEXT
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+@pytest.fixture
+def standin():
+    with StandIn(challenges=1) as server:
+        yield server
+
+
+def test_standin_pages(standin):
+    logging.info("Starting test_standin_pages")
+
+    url = f"{standin.url}/stocks/xnas/aapl/financials"
+    assert CHALLENGE_TEXT in requests.get(url).text, "First page load is not challenged"
+
+    page = requests.get(url)
+    assert 200 == page.status_code, "Financials page is not served"
+    assert 'salEqsvFinancialsPopoverExport' in page.text, "Export button is missing"
+    assert 'salKeyStatsPopoverExport' in requests.get(f"{standin.url}/stocks/xnas/aapl/key-metrics").text, \
+        "Key metrics page is not served"
+
+    page = requests.get(f"{standin.url}/stocks/xnas/nope/financials")
+    assert 404 == page.status_code and 'Page Not Found' in page.text, "Missing ticker page is served"
+
+    export = requests.get(f"{standin.url}/export/xnas/aapl/Income%20Statement_Annual_Restated.xls")
+    assert 'Income%20Statement_Annual_Restated.xls' in export.headers['Content-Disposition'], "Export file name mismatch"
+    assert 'Total Revenue' == parse_spreadsheet(export.content)['Name'][0], "Exported spreadsheet mismatch"
+
+    data = requests.get(f"{standin.url}/api/v1/stocks/xnas/aapl/incomeStatement?dataType=A&reportType=R").json()
+    assert 'Total Revenue' == parse_table_json(data)['Name'][0], "Statement API mismatch"
+    data = requests.get(f"{standin.url}/api/v1/stocks/xnas/aapl/cashFlow?reportType=R").json()
+    assert parse_table_json(data).empty, "Statistics without data are not empty"
+
+    logging.info("test_standin_pages completed successfully")
+
+
+def test_standin_tickers(standin, tmp_path):
+    logging.info("Starting test_standin_tickers")
+
+    stock = stocks.Stock(database=os.path.join(tmp_path, 'msf.db3'), base_urls=standin.base_urls)
+
+    tickers = stock.get_us_tickers()
+    assert ['AAPL', 'MSFT'] == tickers['xnas'], "NASDAQ screener tickers mismatch"
+    assert 'xnys' == stock.resolve_exchange('IBM'), "NYSE ticker is not resolved"
+
+    assert ['AAPL', 'MSFT'] == stock.get_sp500_tickers(), "S&P 500 constituents mismatch"
+    assert ['00700', '00005'] == stock.get_hsi_tickers(), "Hang Seng Index constituents mismatch"
+
+    # Revalidation of unchanged constituents is not downloaded again
+    stock.get_sp500_tickers(update=True)
+    assert 1 == standin.requests['not_modified'], "Constituents are not revalidated"
+    stock.close()
+
+    logging.info("test_standin_tickers completed successfully")
+
+
+@pytest.mark.skipif(
+    not any(shutil.which(name) for name in ('google-chrome', 'chromium', 'chromium-browser')),
+    reason="Chrome is not installed")
+def test_standin_fetch(standin, tmp_path):
+    logging.info("Starting test_standin_fetch")
+
+    stock = stocks.Stock(
+        database=os.path.join(tmp_path, 'msf.db3'), base_urls=standin.base_urls,
+        pacer=Pacer(rate=100, jitter=0), breaker=CircuitBreaker(os.path.join(tmp_path, 'breaker'), backoff=1))
+
+    # First page load is challenged, the fetch is retried after the breaker closes
+    df = stock.get_income_statement('aapl', 'xnas')
+    assert 'Total Revenue' == df['Name'][0], "Income statement mismatch"
+    assert stock.get_growth('aapl', 'xnas') is not None, "Growth is not fetched"
+    assert stock.get_cash_flow('aapl', 'xnas') is None, "Statistics without data are fetched"
+
+    for step in ('page_load', 'download', 'parse', 'db_write'):
+        assert stock.timings[step] > 0, f"Time of {step} is not measured"
+    stock.close()
+
+    logging.info("test_standin_fetch completed successfully")
@@ -0,0 +1,165 @@
+#!/usr/bin/python3 -u
+
+import os
+import json
+import time
+import logging
+import threading
+
+import pandas as pd
+import pytest
+
+from msfinance import stocks
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+
+class Response:
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def json(self):
+        return json.loads(self.text)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+def cache_screeners(stock, screeners):
+    '''Cache ticker tables of NASDAQ screener, as _get_us_exchange_tickers does'''
+    for screener, symbols in screeners.items():
+        stock._update_database(
+            f"us_exchange_{screener}_tickers", pd.DataFrame({'symbol': symbols}),
+            exchange=screener, kind='tickers')
+
+
+def test_exchange_resolver(tmp_path, monkeypatch):
+    logging.info("Starting test_exchange_resolver")
+
+    stock = stocks.Stock(database=os.path.join(tmp_path, 'msf.db3'))
+    cache_screeners(stock, {'nasdaq': ['AAPL', 'MSFT'], 'nyse': ['IBM', 'MSFT'], 'amex': ['IMO']})
+
+    # Tickers of other exchanges are known from catalog
+    statement = pd.DataFrame({'Name': ['Total Revenue'], '2023': [1.0]})
+    stock._update_database(
+        stock.statement_id('00700', 'xhkg', 'Income Statement'), statement.copy(),
+        ticker='00700', exchange='xhkg', kind='statement',
+        dataset='Income Statement', period='Annual', stage='Restated')
+
+    assert 'xnas' == stock.resolve_exchange('aapl'), "NASDAQ ticker is not resolved"
+    assert 'xnys' == stock.resolve_exchange('IBM'), "NYSE ticker is not resolved"
+    assert 'xase' == stock.resolve_exchange('IMO'), "AMEX ticker is not resolved"
+    assert 'xnas' == stock.resolve_exchange('MSFT'), "Listed twice ticker is not resolved in order"
+    assert 'xhkg' == stock.resolve_exchange('00700'), "Cataloged ticker is not resolved"
+
+    # Tickers which never had data are not indexed
+    stock._record_negative(
+        stock.statement_id('99999', 'xhkg', 'Income Statement'), 'failed', 'not found', ticker='99999',
+        exchange='xhkg', kind='statement', dataset='Income Statement', period='Annual', stage='Restated')
+    index = stocks.Stock(database=os.path.join(tmp_path, 'msf.db3')).exchange_index()
+    assert '00700' in index and '99999' not in index, "Ticker without data is indexed"
+    with pytest.raises(ValueError):
+        stock.resolve_exchange('NOPE')
+
+    # Getters resolve exchange, cached data is served without a browser
+    df = stock.get_income_statement('00700')
+    assert df is not None, "Income statement of resolved ticker is not found"
+    assert 0 == len(stock.driver_pool), "Driver is created for cache hit"
+
+    # Refresh of ticker tables drops the index
+    rows = json.dumps({'data': {'rows': [{'symbol': 'NEW'}]}})
+    monkeypatch.setattr(stocks.requests.Session, 'get', lambda *args, **kwargs: Response(200, rows))
+    index = stock.exchange_index()
+    stock._get_us_exchange_tickers('amex', update=True)
+    assert stock.exchange_index() is not index, "Index is not rebuilt after refresh"
+    assert 'xase' == stock.resolve_exchange('NEW'), "Refreshed ticker is not resolved"
+
+    logging.info("test_exchange_resolver completed successfully")
+
+
+SP500_HTML = '''
+<html><body>
+<table class="wikitable" id="constituents">
+<tr><th>Symbol</th><th>Security</th></tr>
+<tr><td>AAPL</td><td>Apple Inc.</td></tr>
+<tr><td>MSFT</td><td>Microsoft</td></tr>
+</table>
+<table class="wikitable" id="changes">
+<tr><th>Date</th><th>Added</th></tr>
+<tr><td>2024-01-01</td><td>XYZ</td></tr>
+</table>
+</body></html>
+'''
+
+
+def test_index_tickers(tmp_path, monkeypatch):
+    logging.info("Starting test_index_tickers")
+
+    requests_made = []
+
+    def get(session, url, headers=None, **kwargs):
+        headers = headers or {}
+        requests_made.append(headers)
+        if '"v1"' == headers.get('If-None-Match'):
+            return Response(304)
+        return Response(200, SP500_HTML, {'ETag': '"v1"', 'Last-Modified': 'Mon, 01 Jan 2024 00:00:00 GMT'})
+
+    monkeypatch.setattr(stocks.requests.Session, 'get', get)
+
+    database = os.path.join(tmp_path, 'msf.db3')
+    stock = stocks.Stock(database=database)
+    assert ['AAPL', 'MSFT'] == stock.get_sp500_tickers(), "Constituents mismatch"
+
+    # Constituents are cached in database, also for other instances
+    assert ['AAPL', 'MSFT'] == stocks.Stock(database=database).get_sp500_tickers(), "Cached constituents mismatch"
+    assert 1 == len(requests_made), "Cached constituents are downloaded again"
+
+    # Stale constituents are revalidated with a conditional request
+    stock = stocks.Stock(database=database, freshness={'index': 0})
+    assert ['AAPL', 'MSFT'] == stock.get_sp500_tickers(), "Revalidated constituents mismatch"
+    assert 2 == len(requests_made), "Stale constituents are not revalidated"
+    assert '"v1"' == requests_made[1]['If-None-Match'], "ETag is not sent"
+    assert 'If-Modified-Since' in requests_made[1], "Last-Modified is not sent"
+
+    catalog = stock.lookup_catalog(['index_sp500_tickers'])
+    assert 2 == catalog.loc['index_sp500_tickers', 'rows'], "Catalog row count mismatch"
+
+    logging.info("test_index_tickers completed successfully")
+
+
+def test_us_tickers(tmp_path, monkeypatch):
+    logging.info("Starting test_us_tickers")
+
+    stock = stocks.Stock(database=os.path.join(tmp_path, 'msf.db3'))
+    cache_screeners(stock, {'nasdaq': ['AAPL']})
+
+    # Missing screeners are downloaded concurrently
+    lock = threading.Lock()
+    active = []
+    peak = []
+
+    def get(session, url, **kwargs):
+        with lock:
+            active.append(url)
+            peak.append(len(active))
+        time.sleep(0.3)
+        with lock:
+            active.remove(url)
+        screener = url.split('exchange=')[1].split('&')[0]
+        return Response(200, json.dumps({'data': {'rows': [{'symbol': screener.upper()}]}}))
+
+    monkeypatch.setattr(stocks.requests.Session, 'get', get)
+
+    tickers = stock.get_us_tickers()
+    assert {'xnas': ['AAPL'], 'xnys': ['NYSE'], 'xase': ['AMEX']} == tickers, "US tickers mismatch"
+    assert 2 == len(peak), "Cached screener is downloaded"
+    assert 2 == max(peak), "Screeners are not downloaded concurrently"
+
+    assert ['NYSE'] == stock.get_xnys_tickers(), "Downloaded screener is not cached"
+    assert 'xase' == stock.resolve_exchange('AMEX'), "Downloaded screener is not indexed"
+
+    logging.info("test_us_tickers completed successfully")